@@ -1,12 +1,23 @@
+import contextlib
 import datetime
+import functools
+import gzip
+import io
 import locale
 import os
 import sys
 import json
 import re
+import threading
+import time
 from sqlalchemy import create_engine, text
 from urllib.parse import quote_plus
 
+try:
+    import zstandard
+except ImportError:  # zstandard é opcional: sem ele a compressão zstd não fica disponível
+    zstandard = None
+
 locale.setlocale(locale.LC_TIME, 'pt_br')
 
 def get_postgres_engine(pg_params):
@@ -50,6 +61,99 @@ def resource_path(relative_path):
     return os.path.join(os.path.abspath("."), relative_path)
 
 
+# Compressão da exportação (export_compression do job) -> sufixo acrescentado ao .csv
+EXPORT_COMPRESSIONS = {'gzip': '.gz', 'zstd': '.zst'}
+CSV_SUFFIXES = ('.csv',) + tuple('.csv' + suffix for suffix in EXPORT_COMPRESSIONS.values())
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+def compression_available(compression: str) -> bool:
+    return compression in EXPORT_COMPRESSIONS and (compression != 'zstd' or zstandard is not None)
+
+
+def compression_of(path: str):
+    """Compressão indicada pelo sufixo do arquivo ('nome.csv.gz' -> 'gzip'), ou None."""
+    for compression, suffix in EXPORT_COMPRESSIONS.items():
+        if path.endswith(suffix):
+            return compression
+    return None
+
+
+def csv_base_path(path: str) -> str:
+    """Remove a extensão do CSV exportado, comprimido ou não: 'nome.csv.gz' -> 'nome'."""
+    for suffix in CSV_SUFFIXES:
+        if path.endswith(suffix):
+            return path[:-len(suffix)]
+    return os.path.splitext(path)[0]
+
+
+def open_export(path: str, mode: str = 'r', compression: str = None):
+    """
+    Abre um arquivo de exportação em texto ('r'/'w', UTF-8) ou binário ('rb'/'wb'),
+    comprimindo/descomprimindo em fluxo conforme `compression` (padrão: pelo sufixo do arquivo).
+    """
+    compression = compression or compression_of(path)
+    binary = 'b' in mode
+    text_options = {} if binary else {'encoding': 'utf-8', 'newline': ''}
+    if compression == 'gzip':
+        return gzip.open(path, mode if binary else mode + 't', compresslevel=GZIP_LEVEL, **text_options)
+    if compression == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("zstd compression requires the 'zstandard' package")
+        if 'w' in mode:
+            return zstandard.open(path, mode, cctx=zstandard.ZstdCompressor(level=ZSTD_LEVEL), **text_options)
+        if binary:
+            # o leitor do zstandard não implementa readline/iteração por linha
+            return io.BufferedReader(zstandard.open(path, mode))
+        return zstandard.open(path, mode, **text_options)
+    return open(path, mode, **text_options)
+
+
+# Tentativas de os.replace quando o destino está aberto por outro processo (Windows)
+REPLACE_RETRIES = 10
+REPLACE_RETRY_SECONDS = 0.5
+
+
+def replace_file(source: str, target: str):
+    """
+    os.replace com novas tentativas: no Windows a troca falha enquanto algum leitor (ex.: a API
+    de dados) está com o arquivo de destino aberto.
+    """
+    for attempt in range(REPLACE_RETRIES):
+        try:
+            os.replace(source, target)
+            return
+        except PermissionError:
+            if attempt == REPLACE_RETRIES - 1:
+                raise
+            time.sleep(REPLACE_RETRY_SECONDS)
+
+
+@contextlib.contextmanager
+def atomic_output(path: str):
+    """
+    Entrega um caminho temporário ao lado de `path` para a gravação; se o bloco terminar sem erro
+    o temporário substitui `path` de uma vez (os.replace), senão é apagado e a versão anterior
+    continua intacta. Quem lê `path` nunca vê um arquivo pela metade.
+    O temporário termina em '.tmp': informe a compressão do destino explicitamente ao abri-lo.
+    """
+    folder, name = os.path.split(path)
+    tmp_path = os.path.join(folder, f".{name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        yield tmp_path
+        replace_file(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def columnar_path(csv_path: str) -> str:
+    """Caminho do sidecar colunar (Parquet) de um CSV exportado: `nome.csv` (ou `nome.csv.gz`) -> `nome.parquet`."""
+    return csv_base_path(csv_path) + '.parquet'
+
+
 """
 ##----------------------------------------
 Date and time aux functions
@@ -99,6 +203,28 @@ def get_export_name(arch_name: str, date_ref: datetime.datetime) -> str:
     return export_name
 
 
+# Partição mensal gerada por get_export_name: 'nome MM.AAAA.csv' (com sufixo de compressão opcional)
+EXPORT_PARTITION_PATTERN = re.compile(r'^(?P<name>.+) (?P<month>\d{2})\.(?P<year>\d{4})\.csv(\.gz|\.zst)?$')
+
+
+def parse_export_name(file_name: str):
+    """Inverso de get_export_name: retorna (nome, primeiro dia do mês) ou None se não for uma partição."""
+    match = EXPORT_PARTITION_PATTERN.match(file_name)
+    if not match or not 1 <= int(match.group('month')) <= 12:
+        return None
+    return match.group('name'), datetime.date(int(match.group('year')), int(match.group('month')), 1)
+
+
+def month_starts(initial_date: datetime.date, final_date: datetime.date) -> list:
+    """Primeiro dia de cada mês entre as duas datas (inclusive)."""
+    current = initial_date.replace(day=1)
+    months = []
+    while current <= final_date:
+        months.append(current)
+        current = (current + datetime.timedelta(days=32)).replace(day=1)
+    return months
+
+
 """
 ##----------------------------------------
 Json files aux function
@@ -110,11 +236,18 @@ def open_json() -> dict:
     base_content = """{
   "oracle_database": {
     "TSN": "",
-    "INSTANT_CLIENT": ""
+    "INSTANT_CLIENT": "",
+    "pool": {
+      "min": 1,
+      "max": 10,
+      "increment": 1,
+      "wait_timeout_ms": 60000
+    }
   },
   "backend": {
     "secret_key": "",
-    "sqlite_path": ""
+    "sqlite_path": "",
+    "metrics_token": ""
   },
   "postgres":{
     "hostname": "localhost",
@@ -125,8 +258,40 @@ def open_json() -> dict:
   },
   "user_name": "",
   "user_pass": "",
+  "logging": {
+    "db_batch_size": 200,
+    "db_flush_interval_s": 1.0,
+    "db_queue_size": 10000,
+    "db_overflow": "drop_oldest"
+  },
+  "scheduler": {
+    "max_workers": 5,
+    "reserved_workers": 1,
+    "max_schema_weight": 3,
+    "heavy_job_seconds": 300,
+    "monthly_backfill_months": 12,
+    "parameter_ttl_seconds": 300,
+    "parameter_fail_ttl_seconds": 60,
+    "parameter_retry_seconds": 300,
+    "parameter_max_retries": 6,
+    "max_split_parts": 4,
+    "csv_writer": "columnar",
+    "fetch_memory_target_mb": 64,
+    "fetch_min_arraysize": 100,
+    "fetch_max_arraysize": 50000,
+    "metrics_port": 9108,
+    "metrics_token": "",
+    "catchup_lookback_hours": 24,
+    "catchup_max_concurrency": 2,
+    "distributed": false,
+    "node_id": "",
+    "lease_seconds": 60,
+    "lease_heartbeat_seconds": 15
+  },
   "data_api": {
     "csv_folder_path": "",
+    "stream_chunk_rows": 50000,
+    "cache_max_bytes": 268435456,
     "api_keys": [
       ""
     ]
@@ -151,53 +316,128 @@ SQL check functions
 ##----------------------------------------
 """
 
+# Tokenizador de SQL: espaços, comentários, literais de texto (inclusive q'[...]' do Oracle)
+# e números são descartados; sobram as palavras (só elas contam como palavras-chave), as
+# variáveis de bind, os identificadores entre aspas e a pontuação, um caractere por token
+SQL_TOKEN_PATTERN = re.compile(r"""
+      (?P<skip>
+          \s+
+        | --[^\n]*
+        | /\*.*?(?:\*/|\Z)
+        | [nN]?[qQ]'(?:\[.*?\]|\{.*?\}|<.*?>|\(.*?\)|(?P<q>\S).*?(?P=q))'
+        | [nN]?'(?:[^']|'')*(?:'|\Z)
+        | \d[\w.]*
+      )
+    | (?P<bind>:[A-Za-z_][\w$#]*)
+    | (?P<quoted>"(?:[^"]|"")*(?:"|\Z))
+    | (?P<word>[A-Za-z_][\w$#]*)
+    | (?P<punct>[^\w\s'"/:-])
+    | (?P<other>.)
+""", re.VERBOSE | re.DOTALL)
+
+READ_ONLY_KEYWORDS = frozenset({'SELECT', 'WITH', 'SHOW', 'DESCRIBE', 'EXPLAIN'})
+FORBIDDEN_KEYWORDS = frozenset({'INSERT', 'UPDATE', 'DELETE', 'DROP', 'CREATE', 'ALTER', 'TRUNCATE', 'GRANT',
+                                'REVOKE', 'MERGE', 'LOCK', 'RENAME'})
+SQL_VALIDATION_CACHE_SIZE = 4096
+
+
+def sql_tokens(sql):
+    """Tokens da consulta como (tipo, texto), na ordem: tipo 'word', 'bind', 'quoted', 'punct' ou 'other'."""
+    for match in SQL_TOKEN_PATTERN.finditer(sql or ''):
+        if match.lastgroup != 'skip':
+            yield match.lastgroup, match.group()
+
+
+def sql_keywords(sql):
+    """Palavras da consulta em maiúsculas, na ordem, ignorando literais, identificadores entre aspas e comentários."""
+    return [value.upper() for kind, value in sql_tokens(sql) if kind == 'word']
+
+
+@functools.lru_cache(maxsize=SQL_VALIDATION_CACHE_SIZE)
 def is_select_query(sql):
     """
-    Verifica se a consulta SQL é apenas para leitura (DQL).
+    Verifica se a consulta SQL é apenas para leitura (DQL): a primeira palavra é de leitura e nenhuma
+    palavra de modificação aparece fora de literais e comentários.
+    O resultado fica em cache por texto da consulta: revalidar os mesmos scripts não volta a tokenizá-los.
     """
-    # Remove comentários e normaliza espaços em branco
-    normalized_sql = re.sub(r'--.*?\n|/\*.*?\*/', '', sql, flags=re.DOTALL)
-    normalized_sql = re.sub(r'\s+', ' ', normalized_sql).strip().upper()
-    
-    # Verifica se a consulta começa com palavras-chave de leitura
-    allowed_patterns = [
-        r'^SELECT\s+',
-        r'^WITH\s+',
-        r'^SHOW\s+',
-        r'^DESCRIBE\s+',
-        r'^EXPLAIN\s+'
-    ]
-    
-    # Verifica se a consulta é apenas de leitura
-    is_read_only = any(re.match(pattern, normalized_sql) for pattern in allowed_patterns)
-    
-    # Verifica se não contém palavras-chave de modificação de dados
-    forbidden_patterns = [
-        r'\s+INSERT\s+',
-        r'\s+UPDATE\s+', 
-        r'\s+DELETE\s+',
-        r'\s+DROP\s+',
-        r'\s+CREATE\s+',
-        r'\s+ALTER\s+',
-        r'\s+TRUNCATE\s+',
-        r'\s+GRANT\s+',
-        r'\s+REVOKE\s+',
-        r'\s+MERGE\s+',
-        r'^INSERT\s+', 
-        r'^UPDATE\s+', 
-        r'^DELETE\s+',
-        r'^DROP\s+',
-        r'^CREATE\s+',
-        r'^ALTER\s+',
-        r'^TRUNCATE\s+',
-        r'^GRANT\s+',
-        r'^REVOKE\s+',
-        r'^MERGE\s+'
-    ]
-    
-    contains_forbidden = any(re.search(pattern, normalized_sql) for pattern in forbidden_patterns)
-    
-    return is_read_only and not contains_forbidden
+    words = sql_keywords(sql)
+    return bool(words) and words[0] in READ_ONLY_KEYWORDS and FORBIDDEN_KEYWORDS.isdisjoint(words)
+
+
+def _table_owner(tokens):
+    """Owner de um nome qualificado no início de `tokens` (OWNER.TABELA ou "Owner".TABELA), ou None."""
+    if len(tokens) < 2 or tokens[1] != ('punct', '.'):
+        return None
+    kind, value = tokens[0]
+    if kind == 'word':
+        return value.upper()
+    if kind == 'quoted':
+        return value[1:-1].replace('""', '"')
+    return None
+
+
+@functools.lru_cache(maxsize=SQL_VALIDATION_CACHE_SIZE)
+def get_sql_schema(sql, default=None):
+    """
+    Retorna o schema (owner) da tabela qualificada após o FROM da consulta,
+    ex.: 'SELECT ... FROM VENDAS.PEDIDOS' -> 'VENDAS'. Se não houver, retorna `default`.
+    Literais e comentários são ignorados, e um FROM entre parênteses só conta se os parênteses
+    forem uma subconsulta (o de EXTRACT(YEAR FROM p.dt) ou TRIM(' ' FROM x) não conta).
+    Entre várias tabelas qualificadas vale a menos aninhada e, empatando, a primeira.
+    """
+    tokens = list(sql_tokens(sql))
+    query_levels = [True]  # por nível de parênteses: o nível é uma (sub)consulta?
+    found = None
+    for i, token in enumerate(tokens):
+        if token == ('punct', '('):
+            kind, value = tokens[i + 1] if i + 1 < len(tokens) else (None, '')
+            query_levels.append(kind == 'word' and value.upper() in ('SELECT', 'WITH'))
+        elif token == ('punct', ')'):
+            if len(query_levels) > 1:
+                query_levels.pop()
+        elif token[0] == 'word' and token[1].upper() == 'FROM' and query_levels[-1]:
+            owner = _table_owner(tokens[i + 1:i + 3])
+            if owner and (found is None or len(query_levels) < found[0]):
+                found = (len(query_levels), owner)
+                if len(query_levels) == 1:
+                    break
+    if found:
+        return found[1]
+    return default.upper() if default else default
+
+
+def get_sql_binds(sql):
+    """
+    Retorna os nomes (minúsculos) das variáveis de bind usadas na consulta, ex.: ':start_date'.
+    Literais de texto (inclusive q'[...]'), identificadores entre aspas e comentários são ignorados.
+    """
+    return {value[1:].lower() for kind, value in sql_tokens(sql) if kind == 'bind'}
+
+
+def split_ranges(cursor, sql, binds, column, parts):
+    """
+    Divide o intervalo [MIN, MAX] da coluna no resultado da consulta em `parts` faixas de mesmo tamanho.
+    Funciona com colunas numéricas e de data. Retorna [(início, fim), ...] ou None se não for possível dividir.
+    """
+    cursor.execute(f"SELECT MIN({column}), MAX({column}) FROM (\n{sql}\n)", binds or None)
+    low, high = cursor.fetchone()
+    if low is None or low == high or isinstance(low, (str, bytes)):
+        return None
+    if isinstance(low, int):
+        # divisão inteira: com float, acima de 2**53 o primeiro limite pode passar do MIN e perder linhas
+        bounds = [low + (high - low) * i // parts for i in range(parts)] + [high]
+    else:
+        bounds = [low + (high - low) * i / parts for i in range(parts)] + [high]
+    return [(bounds[i], bounds[i + 1]) for i in range(parts) if bounds[i] != bounds[i + 1]]
+
+
+def split_query(sql, column, part, parts):
+    """Sub-consulta de uma faixa. A primeira faixa também traz os NULLs; a última inclui o MAX."""
+    upper = '<=' if part == parts - 1 else '<'
+    condition = f"{column} >= :split_low AND {column} {upper} :split_high"
+    if part == 0:
+        condition = f"({condition}) OR {column} IS NULL"
+    return f"SELECT * FROM (\n{sql}\n) WHERE {condition}"
 
 
 if __name__ == '__main__':
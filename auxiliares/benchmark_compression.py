@@ -0,0 +1,99 @@
+"""
+Benchmark da compressão dos arquivos exportados.
+
+Grava o mesmo conjunto de linhas com o mesmo loop do agendador (csv.writer + writerows em
+blocos de `arraysize`) sem compressão, com gzip e com zstd, e compara a vazão de escrita,
+o tamanho final e o tempo de leitura completa pela API de dados (pandas).
+
+Uso (a partir da raiz do projeto):
+    python auxiliares/benchmark_compression.py [--csv ARQUIVO.csv] [--rows 500000] [--arraysize 5000]
+
+Sem --csv são geradas linhas fictícias parecidas com um extract típico (ids, valores, datas,
+códigos e textos); com --csv o benchmark usa as linhas de um CSV já exportado (separador ';').
+"""
+import argparse
+import csv
+import datetime
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+from auxiliares import open_export, compression_available, EXPORT_COMPRESSIONS
+
+
+def sample_rows(count):
+    random.seed(42)
+    start = datetime.datetime(2024, 1, 1)
+    cities = ['SAO PAULO', 'RIO DE JANEIRO', 'BELO HORIZONTE', 'CURITIBA', 'PORTO ALEGRE', 'RECIFE']
+    header = ['ID_PEDIDO', 'DT_MOVIMENTO', 'COD_CLIENTE', 'CIDADE', 'UF', 'VALOR', 'QTDE', 'OBSERVACAO']
+    rows = [
+        (
+            1000000 + i,
+            start + datetime.timedelta(minutes=i * 7),
+            f'CLI{random.randint(1, 50000):06d}',
+            random.choice(cities),
+            random.choice(['SP', 'RJ', 'MG', 'PR', 'RS', 'PE']),
+            round(random.uniform(1, 10000), 2),
+            random.randint(1, 40),
+            None if i % 3 else f'pedido {i} entregue em {random.randint(1, 9)} dias',
+        )
+        for i in range(count)
+    ]
+    return header, rows
+
+
+def csv_rows(path, count):
+    with open_export(path, 'r') as f:
+        reader = csv.reader(f, delimiter=';')
+        header = next(reader)
+        rows = [tuple(row) for _, row in zip(range(count), reader)]
+    return header, rows
+
+
+def write(path, header, rows, arraysize):
+    start = time.perf_counter()
+    with open_export(path, 'w') as f:
+        writer = csv.writer(f, delimiter=';')
+        writer.writerow(header)
+        for i in range(0, len(rows), arraysize):
+            writer.writerows(rows[i:i + arraysize])
+    return time.perf_counter() - start
+
+
+def read(path):
+    start = time.perf_counter()
+    pd.read_csv(path, encoding='utf-8', sep=';')
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--csv')
+    parser.add_argument('--rows', type=int, default=500000)
+    parser.add_argument('--arraysize', type=int, default=5000)
+    args = parser.parse_args()
+
+    header, rows = csv_rows(args.csv, args.rows) if args.csv else sample_rows(args.rows)
+    codecs = [None] + [c for c in EXPORT_COMPRESSIONS if compression_available(c)]
+
+    print(f"{len(rows)} linhas, arraysize {args.arraysize}")
+    print(f"{'compressão':>10} | {'escrita s':>9} | {'linhas/s':>10} | {'tamanho MB':>10} | {'razão':>6} | {'leitura s':>9}")
+    with tempfile.TemporaryDirectory() as folder:
+        base_size = None
+        for compression in codecs:
+            path = os.path.join(folder, 'benchmark.csv' + EXPORT_COMPRESSIONS.get(compression, ''))
+            write_s = write(path, header, rows, args.arraysize)
+            size = os.path.getsize(path)
+            base_size = base_size or size
+            read_s = read(path)
+            print(f"{compression or 'nenhuma':>10} | {write_s:>9.2f} | {len(rows) / write_s:>10.0f} | "
+                  f"{size / 1024 / 1024:>10.1f} | {base_size / size:>6.1f} | {read_s:>9.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Benchmark dos backends de serialização do CSV (scheduler.csv_writer).
+
+Grava o mesmo conjunto de linhas com o mesmo loop do agendador (writerow do cabeçalho +
+writerows em blocos de `arraysize`) com cada backend de export_writers.CSV_WRITERS, compara
+a vazão (linhas/s) e o tempo de CPU e confere que todos geram exatamente os mesmos bytes que
+o csv.writer.
+
+Uso (a partir da raiz do projeto):
+    python auxiliares/benchmark_csv_writer.py [--rows 500000] [--arraysize 5000]
+
+As linhas fictícias imitam o que o oracledb devolve num extract típico: ints, floats, Decimals,
+datas, textos com ';', aspas e quebras de linha, e NULLs. Antes do benchmark uma bateria de
+casos de borda (coluna única vazia, colunas só com NULL, tipos misturados) também é comparada.
+"""
+import argparse
+import csv
+import datetime
+import decimal
+import hashlib
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from export_writers import CSV_WRITERS
+
+
+def sample_rows(count):
+    random.seed(42)
+    start = datetime.datetime(2024, 1, 1)
+    cities = ['SAO PAULO', 'RIO DE JANEIRO', 'BELO HORIZONTE', 'CURITIBA', 'PORTO ALEGRE', 'RECIFE']
+    notes = ['entregue', 'cliente "VIP"', 'ver; observação', 'linha 1\nlinha 2', '']
+    header = ['ID_PEDIDO', 'DT_MOVIMENTO', 'DT_REF', 'COD_CLIENTE', 'CIDADE', 'VALOR', 'PRECO', 'QTDE', 'OBSERVACAO']
+    rows = [
+        (
+            1000000 + i,
+            start + datetime.timedelta(minutes=i * 7),
+            datetime.date(2024, 1 + i % 12, 1),
+            f'CLI{random.randint(1, 50000):06d}',
+            random.choice(cities),
+            round(random.uniform(1, 10000), 2),
+            decimal.Decimal(random.randint(1, 99999)) / 100,
+            random.randint(1, 40),
+            None if i % 3 else random.choice(notes),
+        )
+        for i in range(count)
+    ]
+    return header, rows
+
+
+def edge_cases():
+    """Blocos (cabeçalho, linhas) que costumam divergir do csv.writer."""
+    return [
+        (['A'], [('',), (None,), ('x',), ('a;b',)]),
+        (['A', 'B'], [(None, None), ('', None), (None, '')]),
+        (['A', 'B', 'C'], [(1, 'x', None), (2.5, None, 'q"q'), ('3', b'bytes', True)]),
+        (['A', 'B'], [(decimal.Decimal('1.10'), '\r'), (decimal.Decimal('1.10'), ' ; ')]),
+        (['A'], [(1,), (None,), (1e16,), (float('nan'),)]),
+    ]
+
+
+def write(backend, header, rows, arraysize):
+    buffer = io.StringIO(newline='')
+    writer = backend(buffer)
+    writer.writerow(header)
+    for i in range(0, len(rows), arraysize):
+        writer.writerows(rows[i:i + arraysize])
+    return buffer.getvalue()
+
+
+def reference(header, rows):
+    buffer = io.StringIO(newline='')
+    writer = csv.writer(buffer, delimiter=';')
+    writer.writerow(header)
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=500000)
+    parser.add_argument('--arraysize', type=int, default=5000)
+    args = parser.parse_args()
+
+    for name, backend in CSV_WRITERS.items():
+        for header, rows in edge_cases():
+            if write(backend, header, rows, args.arraysize) != reference(header, rows):
+                sys.exit(f"backend '{name}' diverge do csv.writer em {rows!r}")
+
+    header, rows = sample_rows(args.rows)
+    expected = hashlib.sha256(reference(header, rows).encode('utf-8')).hexdigest()
+
+    print(f"{len(rows)} linhas, arraysize {args.arraysize}")
+    print(f"{'backend':>10} | {'escrita s':>9} | {'CPU s':>7} | {'linhas/s':>10} | {'idêntico':>8}")
+    for name, backend in CSV_WRITERS.items():
+        start, cpu_start = time.perf_counter(), time.process_time()
+        output = write(backend, header, rows, args.arraysize)
+        write_s, cpu_s = time.perf_counter() - start, time.process_time() - cpu_start
+        identical = hashlib.sha256(output.encode('utf-8')).hexdigest() == expected
+        print(f"{name:>10} | {write_s:>9.2f} | {cpu_s:>7.2f} | {len(rows) / write_s:>10.0f} | {'sim' if identical else 'NÃO':>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""
+Benchmark do núcleo de agendamento (job_schedule.ScheduleQueue).
+
+Monta a agenda de N jobs fictícios (10 mil por padrão) como o agendador monta: JobRecord do
+catálogo (job_catalog) com as máscaras schedule_* e JobRecord.schedule (JobSchedule.from_masks).
+Mede o tempo de montagem, a memória ocupada, o custo de um tick sem nada a disparar e o custo por
+disparo simulando um dia inteiro minuto a minuto. Os disparos são conferidos contra uma contagem
+direta da agenda expandida (as linhas que iriam para jobs_de).
+Se a biblioteca `schedule` estiver instalada, a mesma agenda é montada nela (uma entrada por
+dia/hora/minuto, como o agendador fazia antes) para comparação.
+
+Uso (a partir da raiz do projeto):
+    python auxiliares/benchmark_scheduler.py [--jobs 10000] [--dense]
+
+Com --dense todo job roda nos 7 dias, 24 horas e 4 minutos por hora (672 horários por semana).
+"""
+import argparse
+import datetime
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from job_catalog import JobRecord
+from job_schedule import DAY_KEYS, CronMask, ScheduleQueue
+
+try:
+    import schedule
+except ImportError:
+    schedule = None
+
+EMPTY_JOB = JobRecord(*[None] * len(JobRecord._fields))
+SCHEDULE_DAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+START = datetime.datetime(2026, 10, 19)  # segunda-feira: o dia simulado
+BUILD_AT = START - datetime.timedelta(seconds=30)  # a agenda é montada antes, sem nada a disparar
+
+
+def sample_jobs(count, dense):
+    """JobRecord como os do load_job_catalog: a agenda (dias x horas x minutos) nas máscaras."""
+    random.seed(42)
+    jobs = []
+    for job_id in range(1, count + 1):
+        if dense:
+            days, hours, minutes = DAY_KEYS, range(24), (0, 15, 30, 45)
+        else:
+            days = random.sample(DAY_KEYS, random.randint(1, 7))
+            hours = random.sample(range(24), random.randint(1, 3))
+            minutes = random.sample(range(0, 60, 5), random.randint(1, 2))
+        mask = CronMask.from_fields(days, hours, minutes)
+        jobs.append(EMPTY_JOB._replace(job_id=job_id, job_name=f'job {job_id}', job_status='Y', schedule_days=mask.days,
+                                       schedule_hours=mask.hours, schedule_minutes=mask.minutes))
+    return jobs
+
+
+def measure(build):
+    """
+    Executa `build()` duas vezes: uma cronometrada e outra sob o tracemalloc (que deixa a execução
+    mais lenta). Devolve (resultado, segundos, bytes alocados que continuam vivos).
+    """
+    gc.collect()
+    start = time.perf_counter()
+    result = build()
+    seconds = time.perf_counter() - start
+    gc.collect()
+    tracemalloc.start()
+    traced = build()
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del traced
+    return result, seconds, memory
+
+
+def build_queue(jobs):
+    queue = ScheduleQueue()
+    for job in jobs:
+        queue.add(job.job_id, job.schedule, job, now=BUILD_AT)
+    return queue
+
+
+def build_schedule_library(jobs):
+    scheduler = schedule.Scheduler()
+    for job in jobs:
+        for day_key, hour, minute in job.schedule_mask.rows():
+            day_method = SCHEDULE_DAYS[DAY_KEYS.index(day_key)]
+            getattr(scheduler.every(), day_method).at(f'{hour}:{minute}').do(lambda: None).tag(job.job_id)
+    return scheduler
+
+
+def expected_fires(jobs, day):
+    """Disparos esperados num dia, contando direto as linhas da agenda expandida."""
+    day_key = DAY_KEYS[day.weekday()]
+    return sum(1 for job in jobs for row in job.schedule_mask.rows() if row[0] == day_key)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--jobs', type=int, default=10000)
+    parser.add_argument('--dense', action='store_true')
+    parser.add_argument('--ticks', type=int, default=10000, help='ticks sem disparo medidos')
+    args = parser.parse_args()
+
+    jobs = sample_jobs(args.jobs, args.dense)
+    slots = sum(job.schedule.slots for job in jobs)
+    print(f"{len(jobs)} jobs, {slots} horários por semana")
+    print(f"{'núcleo':>12} | {'montagem s':>10} | {'memória MB':>10} | {'tick ocioso µs':>14} | {'µs/disparo':>10} | {'disparos/dia':>12}")
+
+    queue, build_s, memory = measure(lambda: build_queue(jobs))
+    start = time.perf_counter()
+    for _ in range(args.ticks):
+        queue.pop_due(BUILD_AT)
+        queue.idle_seconds(BUILD_AT)
+    idle_us = (time.perf_counter() - start) / args.ticks * 1e6
+
+    fires = 0
+    start = time.perf_counter()
+    for minute in range(24 * 60):
+        fires += len(queue.pop_due(START + datetime.timedelta(minutes=minute)))
+    fire_s = time.perf_counter() - start
+    expected = expected_fires(jobs, START)
+    print(f"{'heap':>12} | {build_s:>10.2f} | {memory / 2 ** 20:>10.1f} | {idle_us:>14.2f} | {fire_s / max(fires, 1) * 1e6:>10.2f} | {fires:>12}")
+    if fires != expected:
+        sys.exit(f"disparos divergentes: {fires}, esperado {expected}")
+    del queue
+
+    if schedule is None:
+        print("biblioteca 'schedule' não instalada: comparação ignorada")
+        return
+    scheduler, build_s, memory = measure(lambda: build_schedule_library(jobs))
+    ticks = max(1, args.ticks // 100)
+    start = time.perf_counter()
+    for _ in range(ticks):
+        scheduler.run_pending()
+        scheduler.idle_seconds
+    idle_us = (time.perf_counter() - start) / ticks * 1e6
+    print(f"{'schedule':>12} | {build_s:>10.2f} | {memory / 2 ** 20:>10.1f} | {idle_us:>14.2f} | {'-':>10} | {'-':>12}")
+
+
+if __name__ == '__main__':
+    main()
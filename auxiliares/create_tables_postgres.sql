@@ -22,10 +22,23 @@ CREATE TABLE IF NOT EXISTS jobs_he (
     check_parameter  CHAR(1) NOT NULL CHECK (check_parameter IN ('Y','N')),
     parameter_id     INTEGER REFERENCES parameters(parameter_id),
     data_primary_key TEXT,
-    sql_script       TEXT
+    sql_script       TEXT,
+    job_priority     INTEGER NOT NULL DEFAULT 0,
+    job_weight       INTEGER NOT NULL DEFAULT 1,
+    columnar_output  CHAR(1) NOT NULL DEFAULT 'N' CHECK (columnar_output IN ('Y','N')),
+    split_column     TEXT,
+    split_parts      INTEGER NOT NULL DEFAULT 1 CHECK (split_parts >= 1),
+    export_compression TEXT CHECK (export_compression IN ('gzip','zstd')),
+    fetch_arraysize  INTEGER CHECK (fetch_arraysize > 0),
+    fetch_prefetchrows INTEGER CHECK (fetch_prefetchrows >= 0),
+    overlap_policy   TEXT NOT NULL DEFAULT 'skip' CHECK (overlap_policy IN ('skip','queue','cancel')),
+    -- agenda em máscaras de bits: bit i = dia da semana i (segunda = 0) / hora i / minuto i
+    schedule_days    SMALLINT NOT NULL DEFAULT 0,
+    schedule_hours   INTEGER  NOT NULL DEFAULT 0,
+    schedule_minutes BIGINT   NOT NULL DEFAULT 0
 );
 
--- 3) jobs_de
+-- 3) jobs_de (agenda expandida, uma linha por dia/hora/minuto; o backend e o agendador usam as máscaras de jobs_he)
 CREATE TABLE IF NOT EXISTS jobs_de (
     schedule_id SERIAL PRIMARY KEY,
     job_id      INTEGER NOT NULL REFERENCES jobs_he(job_id),
@@ -53,3 +66,94 @@ CREATE TABLE IF NOT EXISTS logs (
     log_text   TEXT NOT NULL,
     duration_ms INTEGER
 );
+
+-- Migrações para bases já existentes
+-- 6) prioridade e peso dos jobs (executor do agendador)
+ALTER TABLE jobs_he ADD COLUMN IF NOT EXISTS job_priority INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE jobs_he ADD COLUMN IF NOT EXISTS job_weight   INTEGER NOT NULL DEFAULT 1;
+
+-- 7) saída colunar (Parquet) opcional por job
+ALTER TABLE jobs_he ADD COLUMN IF NOT EXISTS columnar_output CHAR(1) NOT NULL DEFAULT 'N' CHECK (columnar_output IN ('Y','N'));
+
+-- 8) extração dividida em faixas (sub-consultas em paralelo)
+ALTER TABLE jobs_he ADD COLUMN IF NOT EXISTS split_column TEXT;
+ALTER TABLE jobs_he ADD COLUMN IF NOT EXISTS split_parts  INTEGER NOT NULL DEFAULT 1 CHECK (split_parts >= 1);
+
+-- 9) compressão do arquivo exportado
+ALTER TABLE jobs_he ADD COLUMN IF NOT EXISTS export_compression TEXT CHECK (export_compression IN ('gzip','zstd'));
+
+-- 10) tamanho do fetch por job (nulo = calculado pelo agendador)
+ALTER TABLE jobs_he ADD COLUMN IF NOT EXISTS fetch_arraysize    INTEGER CHECK (fetch_arraysize > 0);
+ALTER TABLE jobs_he ADD COLUMN IF NOT EXISTS fetch_prefetchrows INTEGER CHECK (fetch_prefetchrows >= 0);
+
+-- 11) histórico de execuções dos jobs, com o tempo de cada fase
+CREATE TABLE IF NOT EXISTS job_runs (
+    run_id        SERIAL PRIMARY KEY,
+    job_id        INTEGER NOT NULL REFERENCES jobs_he(job_id) ON DELETE CASCADE,
+    started_at    TIMESTAMP NOT NULL,
+    finished_at   TIMESTAMP NOT NULL,
+    status        TEXT NOT NULL CHECK (status IN ('success','error','cancelled','deferred')),
+    attempt       INTEGER NOT NULL DEFAULT 0,
+    rows_exported BIGINT,
+    bytes_written BIGINT,
+    duration_ms   INTEGER,
+    connect_ms    INTEGER,
+    execute_ms    INTEGER,
+    fetch_ms      INTEGER,
+    serialize_ms  INTEGER,
+    error_text    TEXT
+);
+CREATE INDEX IF NOT EXISTS job_runs_job_started_idx ON job_runs (job_id, started_at);
+
+-- 12) sobreposição de execuções do mesmo job e execuções canceladas no histórico
+ALTER TABLE jobs_he ADD COLUMN IF NOT EXISTS overlap_policy TEXT NOT NULL DEFAULT 'skip' CHECK (overlap_policy IN ('skip','queue','cancel'));
+ALTER TABLE job_runs DROP CONSTRAINT IF EXISTS job_runs_status_check;
+ALTER TABLE job_runs ADD CONSTRAINT job_runs_status_check CHECK (status IN ('success','error','cancelled','deferred'));
+
+-- 13) agenda compacta em máscaras de bits, preenchida a partir das linhas de jobs_de
+ALTER TABLE jobs_he ADD COLUMN IF NOT EXISTS schedule_days    SMALLINT NOT NULL DEFAULT 0;
+ALTER TABLE jobs_he ADD COLUMN IF NOT EXISTS schedule_hours   INTEGER  NOT NULL DEFAULT 0;
+ALTER TABLE jobs_he ADD COLUMN IF NOT EXISTS schedule_minutes BIGINT   NOT NULL DEFAULT 0;
+-- A máscara só representa agendas dias x horas x minutos. O backend sempre gravou jobs_de nesse
+-- formato, mas linhas editadas à mão (ex.: horas diferentes em cada dia) fariam a máscara cobrir
+-- horários a mais. Nesse caso a migração para aqui e lista os jobs: corrija a agenda deles
+-- (pela tela de jobs ou em jobs_de) e rode o script de novo.
+DO $$
+DECLARE
+    irregular TEXT;
+BEGIN
+    SELECT string_agg(d.job_id::TEXT, ', ' ORDER BY d.job_id) INTO irregular
+      FROM (SELECT job_id
+              FROM jobs_de
+             GROUP BY job_id
+            HAVING count(DISTINCT (job_day, trim(job_hour)::INTEGER, trim(job_minute)::INTEGER))
+                <> count(DISTINCT job_day) * count(DISTINCT trim(job_hour)::INTEGER) * count(DISTINCT trim(job_minute)::INTEGER)) AS d
+      JOIN jobs_he AS j ON j.job_id = d.job_id
+     WHERE j.schedule_days = 0 AND j.schedule_hours = 0 AND j.schedule_minutes = 0;
+    IF irregular IS NOT NULL THEN
+        RAISE EXCEPTION 'Migration 13: the jobs_de rows of jobs % are not a days x hours x minutes schedule and cannot become a bitmask.', irregular;
+    END IF;
+END $$;
+UPDATE jobs_he AS j
+   SET schedule_days    = s.days,
+       schedule_hours   = s.hours,
+       schedule_minutes = s.minutes
+  FROM (SELECT job_id,
+               bit_or(1 << (array_position(ARRAY['Seg','Ter','Qua','Qui','Sex','Sáb','Dom'], job_day) - 1))::SMALLINT AS days,
+               bit_or(1 << trim(job_hour)::INTEGER)                                                                 AS hours,
+               bit_or(1::BIGINT << trim(job_minute)::INTEGER)                                                       AS minutes
+          FROM jobs_de
+         GROUP BY job_id) AS s
+ WHERE j.job_id = s.job_id
+   AND j.schedule_days = 0 AND j.schedule_hours = 0 AND j.schedule_minutes = 0;
+
+-- 14) leases de execução: vários agendadores dividindo os jobs (scheduler.distributed)
+CREATE TABLE IF NOT EXISTS job_leases (
+    job_id      INTEGER PRIMARY KEY REFERENCES jobs_he(job_id) ON DELETE CASCADE,
+    owner       TEXT,
+    lease_until TIMESTAMP,
+    last_fire   TIMESTAMP,
+    claimed_at  TIMESTAMP,
+    takeovers   INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS job_leases_expired_idx ON job_leases (lease_until) WHERE owner IS NOT NULL;
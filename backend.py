@@ -1,4 +1,4 @@
-from flask import Flask, jsonify, request, send_from_directory, redirect
+from flask import Flask, jsonify, request, send_from_directory, redirect, Response, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from urllib.parse import quote_plus
 from flask_cors import CORS
@@ -6,17 +6,27 @@ from flask_login import LoginManager, UserMixin, login_user, login_required, log
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import safe_join
 from functools import wraps
+from sqlalchemy import text, func, insert, delete
+import datetime
 import os
-from auxiliares import open_json, get_postgres_url
+import json
+from auxiliares import open_json, get_postgres_url, parse_export_name, csv_base_path, CSV_SUFFIXES, is_select_query
 
 import time # For request duration logging
 
 import pandas as pd
+from data_api import (DatasetQuery, DatasetQueryError, iter_query_chunks, run_query, stream_ndjson, stream_json_array,
+                      count_dataset_rows, dataset_columns, NDJSON_MIMETYPE, CHUNK_ROWS, TOTAL_COUNT_HEADER,
+                      DatasetCache, CACHE_MAX_BYTES, dataset_validators, is_not_modified, find_dataset_partitions,
+                      resolve_dataset_file)
 
 # --- Import Logging ---
 from logging_config import get_logger, log_info, log_warning, log_error, log_exception, log_debug
 logger = get_logger('backend')
 # --- End Logging Import ---
+import metrics
+from job_schedule import CronMask
+from job_catalog import load_job_catalog
 
 def role_required(*roles):
     def decorator(f):
@@ -50,8 +60,28 @@ def data_api_auth_required(f):
         return jsonify({'msg': 'Authentication required'}), 401
     return decorated_function
 
+def metrics_auth_required(f):
+    # O Prometheus envia o token de backend.metrics_token; pelo navegador basta estar logado
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        token = main_parameters.get('backend', {}).get('metrics_token')
+        if metrics.token_matches(request.headers.get('Authorization'), token) or current_user.is_authenticated:
+            return f(*args, **kwargs)
+        return jsonify({'msg': 'Authentication required'}), 401
+    return decorated_function
+
 # Parametros principais
 main_parameters = open_json()
+dataset_cache = DatasetCache(main_parameters.get('data_api', {}).get('cache_max_bytes', CACHE_MAX_BYTES))
+
+# Métricas do backend (expostas em /metrics)
+request_duration = metrics.histogram('http_request_duration_seconds', 'HTTP request latency by route.', ['method', 'route'])
+requests_total = metrics.counter('http_requests_total', 'HTTP requests by route and status.', ['method', 'route', 'status'])
+data_api_bytes = metrics.counter('data_api_bytes_served_total', 'Response bytes served by the Data API.')
+metrics.counter('data_api_cache_hits_total', 'Data API response cache hits.', function=lambda: dataset_cache.hits)
+metrics.counter('data_api_cache_misses_total', 'Data API response cache misses.', function=lambda: dataset_cache.misses)
+metrics.gauge('data_api_cache_bytes', 'Bytes held by the Data API response cache.', function=lambda: dataset_cache.current_bytes)
+DATA_API_PREFIX = '/api/data/'
 
 # Configurações iniciais do Flask
 template_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'react-build')
@@ -112,9 +142,26 @@ class JobHE(db.Model):
     parameter_id     = db.Column(db.Integer, db.ForeignKey('parameters.parameter_id'))
     data_primary_key = db.Column(db.Text)
     sql_script       = db.Column(db.Text)
-    schedule         = db.relationship('JobDE', uselist=False, backref='job')
+    job_priority     = db.Column(db.Integer, nullable=False, default=0)  # maior valor roda primeiro
+    job_weight       = db.Column(db.Integer, nullable=False, default=1)  # peso > 1 = job pesado
+    columnar_output  = db.Column(db.Text, nullable=False, default='N')   # 'Y' grava também o sidecar Parquet
+    split_column     = db.Column(db.Text)                                 # coluna usada para dividir a extração
+    split_parts      = db.Column(db.Integer, nullable=False, default=1)   # sub-consultas em paralelo
+    export_compression = db.Column(db.Text)                               # 'gzip', 'zstd' ou nulo (CSV puro)
+    fetch_arraysize  = db.Column(db.Integer)                              # nulo = calculado pela largura das colunas
+    fetch_prefetchrows = db.Column(db.Integer)                            # nulo = igual ao arraysize
+    overlap_policy   = db.Column(db.Text, nullable=False, default='skip')  # 'skip', 'queue' ou 'cancel'
+    # agenda em máscaras de bits (ver job_schedule.CronMask): bit i = dia da semana i (segunda = 0) / hora i / minuto i
+    schedule_days    = db.Column(db.SmallInteger, nullable=False, default=0)
+    schedule_hours   = db.Column(db.Integer, nullable=False, default=0)
+    schedule_minutes = db.Column(db.BigInteger, nullable=False, default=0)
+
+    @property
+    def schedule_mask(self):
+        return CronMask(self.schedule_days or 0, self.schedule_hours or 0, self.schedule_minutes or 0)
 
 class JobDE(db.Model):
+    """Agenda expandida (uma linha por dia/hora/minuto), mantida para quem lê a tabela diretamente."""
     __tablename__ = 'jobs_de'
     schedule_id = db.Column(db.Integer, primary_key=True)
     job_id      = db.Column(db.Integer, db.ForeignKey('jobs_he.job_id'))
@@ -122,6 +169,75 @@ class JobDE(db.Model):
     job_hour    = db.Column(db.Text,  nullable=False)
     job_day     = db.Column(db.Text,  nullable=False)
 
+class JobRun(db.Model):
+    __tablename__ = 'job_runs'
+    run_id        = db.Column(db.Integer, primary_key=True)
+    job_id        = db.Column(db.Integer, db.ForeignKey('jobs_he.job_id', ondelete='CASCADE'), nullable=False)
+    started_at    = db.Column(db.DateTime, nullable=False)
+    finished_at   = db.Column(db.DateTime, nullable=False)
+    status        = db.Column(db.Text, nullable=False)      # 'success', 'error', 'cancelled' ou 'deferred' (parâmetro não liberado)
+    attempt       = db.Column(db.Integer, nullable=False, default=0)
+    rows_exported = db.Column(db.BigInteger)
+    bytes_written = db.Column(db.BigInteger)
+    duration_ms   = db.Column(db.Integer)
+    connect_ms    = db.Column(db.Integer)                   # espera por uma sessão do pool
+    execute_ms    = db.Column(db.Integer)                   # parse/execute das consultas
+    fetch_ms      = db.Column(db.Integer)                   # fetchmany
+    serialize_ms  = db.Column(db.Integer)                   # conversão/gravação do CSV e do sidecar
+    error_text    = db.Column(db.Text)
+
+class JobLease(db.Model):
+    """Dono atual de cada job quando vários agendadores dividem a base (ver job_leases.JobLeases)."""
+    __tablename__ = 'job_leases'
+    job_id      = db.Column(db.Integer, db.ForeignKey('jobs_he.job_id', ondelete='CASCADE'), primary_key=True)
+    owner       = db.Column(db.Text)                       # nó com o lease (nulo = livre)
+    lease_until = db.Column(db.DateTime)                   # renovado pelo heartbeat do dono
+    last_fire   = db.Column(db.DateTime)                   # último horário agendado já assumido por algum nó
+    claimed_at  = db.Column(db.DateTime)
+    takeovers   = db.Column(db.Integer, nullable=False, default=0)
+
+
+def parse_schedule(sched):
+    """Máscara da agenda a partir do campo 'schedule' da API (dias, horas e minutos separados por vírgula)."""
+    sched = sched or {}
+    return CronMask.from_fields(*([x.strip() for x in (sched.get(field) or '').split(',') if x.strip()]
+                                  for field in ('day', 'hour', 'minute')))
+
+
+def schedule_fields(mask):
+    """Campo 'schedule' da API a partir da máscara."""
+    hours, minutes = mask.hour_values(), mask.minute_values()
+    return {
+        'day': ','.join(mask.day_keys()),
+        'hour': ','.join(hours),
+        'minute': ','.join(minutes),
+        'complete_hour': ','.join(f"{h}:{m}" for h in hours for m in minutes)
+    }
+
+
+def write_schedule_rows(job_id, mask):
+    """
+    Regrava a agenda expandida do job em jobs_de com um único INSERT em lote.
+    Backend e agendador leem só as máscaras de jobs_he; jobs_de fica para consultas externas.
+    """
+    db.session.execute(delete(JobDE).where(JobDE.job_id == job_id))
+    rows = [{'job_id': job_id, 'job_day': d, 'job_hour': h, 'job_minute': m} for d, h, m in mask.rows()]
+    if rows:
+        db.session.execute(insert(JobDE), rows)
+    return len(rows)
+
+
+# Canal do PostgreSQL (LISTEN/NOTIFY) usado para avisar o agendador sobre mudanças nos jobs
+JOBS_CHANNEL = 'jobs_changed'
+
+def notify_job_change(job_id, action):
+    """
+    Publica a mudança de um job para o agendador.
+    Deve ser chamada antes do commit: o PostgreSQL só entrega a notificação se a transação for confirmada.
+    """
+    payload = json.dumps({'job_id': job_id, 'action': action})
+    db.session.execute(text("SELECT pg_notify(:channel, :payload)"), {'channel': JOBS_CHANNEL, 'payload': payload})
+
 
 # --- Request Logging ---
 @app.before_request
@@ -137,6 +253,16 @@ def log_response_info(response):
     if hasattr(request, 'start_time'):
         duration_ms = int((time.time() - request.start_time) * 1000)
 
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    if hasattr(request, 'start_time'):
+        request_duration.observe(time.time() - request.start_time, method=request.method, route=route)
+    requests_total.inc(method=request.method, route=route, status=response.status_code)
+    if request.path.startswith(DATA_API_PREFIX) and not response.is_streamed:
+        # respostas em streaming são contadas enquanto são geradas (stream_dataset)
+        data_api_bytes.inc(response.content_length or 0)
+    if request.path == metrics.METRICS_PATH:
+        return response  # os scrapes não vão para a tabela de logs
+
     user = current_user.username if current_user.is_authenticated else "anonymous"
     log_level = log_info if response.status_code < 400 else log_warning if response.status_code < 500 else log_error
 
@@ -300,37 +426,14 @@ def list_parameters():
 
 @app.route('/api/jobs', methods=['GET'])
 def list_jobs():
-    jobs = JobHE.query.order_by(JobHE.job_name).all()
     result = []
-    for j in jobs:
-        # puxa todos os schedules
-        scheds = JobDE.query.filter_by(job_id=j.job_id).all()
-        minutes = [s.job_minute for s in scheds]
-        hours   = [s.job_hour   for s in scheds]
-        days    = set([s.job_day     for s in scheds])
-        complete_hour = [f"{h}:{m}" for h in hours for m in minutes]
-        result.append({
-            'job_id': j.job_id,
-            'job_name': j.job_name,
-            'job_status': j.job_status,
-            'export_type': j.export_type,
-            'export_path': j.export_path,
-            'export_name': j.export_name,
-            'days_offset': j.days_offset,
-            'check_parameter': j.check_parameter,
-            'parameter_id': j.parameter_id,
-            'data_primary_key': j.data_primary_key,
-            'sql_script': j.sql_script,
-            'schedule': {
-                # dias podem repetir se o mesmo dia tiver múltiplos minutos/horas?
-                'day': ','.join(days),
-                # minutos e horas trazemos únicos (mantendo ordem de aparição)
-                'minute': ','.join(dict.fromkeys(minutes)),
-                'hour':   ','.join(dict.fromkeys(hours)),
-                # campo com hora completa
-                'complete_hour': ','.join(dict.fromkeys(complete_hour))
-            }
-        })
+    for job in load_job_catalog(db.session):
+        # agenda montada direto das máscaras do job (dias na ordem da semana, horas e minutos em ordem)
+        data = job._asdict()
+        data['schedule'] = schedule_fields(job.schedule_mask)
+        for field in ('schedule_days', 'schedule_hours', 'schedule_minutes'):
+            del data[field]
+        result.append(data)
     return jsonify(result)
 
 @app.route('/api/jobs', methods=['POST'])
@@ -347,7 +450,18 @@ def create_job():
         if not all(field in data for field in required_fields):
              log_warning(logger, f"Job creation failed for '{job_name}' by '{actor}': Missing required fields.", user=actor)
              return jsonify({"msg": "Missing required fields"}), 400
+
+        # Só consultas de leitura são aceitas (a mesma verificação feita pelo agendador antes de executar)
+        if not is_select_query(data['sql_script']):
+             log_warning(logger, f"Job creation failed for '{job_name}' by '{actor}': SQL is not a SELECT query.", user=actor)
+             return jsonify({"msg": "SQL script must be a read-only SELECT query"}), 400
         
+        try:
+            mask = parse_schedule(data.get('schedule'))
+        except ValueError as e:
+             log_warning(logger, f"Job creation failed for '{job_name}' by '{actor}': {e}", user=actor)
+             return jsonify({"msg": f"Invalid schedule: {e}"}), 400
+
         # Cria JobHE
         new_job = JobHE(
             job_name=data['job_name'],
@@ -359,33 +473,29 @@ def create_job():
             check_parameter=data.get('check_parameter'),
             parameter_id=data.get('parameter_id'),
             data_primary_key=data.get('data_primary_key'),
-            sql_script=data.get('sql_script')
+            sql_script=data.get('sql_script'),
+            job_priority=data.get('job_priority', 0),
+            job_weight=data.get('job_weight', 1),
+            columnar_output=data.get('columnar_output', 'N'),
+            split_column=data.get('split_column') or None,
+            split_parts=data.get('split_parts', 1),
+            export_compression=data.get('export_compression') or None,
+            fetch_arraysize=data.get('fetch_arraysize') or None,
+            fetch_prefetchrows=data.get('fetch_prefetchrows'),
+            overlap_policy=data.get('overlap_policy') or 'skip',
+            schedule_days=mask.days,
+            schedule_hours=mask.hours,
+            schedule_minutes=mask.minutes
         )
         db.session.add(new_job)
         db.session.flush()  # obter job_id antes de commit para FK
         job_id = new_job.job_id # Get the ID
 
-        # Cria JobDE (produto cartesiano) se há schedule
-        sched = data.get('schedule', {})
-        minutes =  [x for x in sched.get('minute', '').split(',') if x]
-        hours   =  [x for x in sched.get('hour',   '').split(',') if x]
-        days    =  [x for x in set(sched.get('day',    '').split(',')) if x] #Adicionado set() para remover suplicados
-
-        schedule_details = f"Days: {','.join(days)}, Hours: {','.join(hours)}, Minutes: {','.join(minutes)}"
+        schedule_details = f"Days: {','.join(mask.day_keys())}, Hours: {','.join(mask.hour_values())}, Minutes: {','.join(mask.minute_values())}"
         log_debug(logger, f"Processing schedule for new job {job_id}: {schedule_details}", job_id=job_id, user=actor)
+        schedule_count = write_schedule_rows(job_id, mask)
 
-        schedule_count = 0
-        for d in days:
-            for h in hours:
-                for m in minutes:
-                    db.session.add(JobDE(
-                        job_id=job_id,
-                        job_minute=m,
-                        job_hour=h,
-                        job_day=d
-                    ))
-                    schedule_count += 1
-
+        notify_job_change(job_id, 'created')
         db.session.commit()
         log_info(logger, f"Job '{job_name}' (ID: {job_id}) created successfully by '{actor}'. {schedule_count} schedule entries added.", job_id=job_id, user=actor)
         return jsonify({'job_id': new_job.job_id}), 201
@@ -397,7 +507,6 @@ def create_job():
 @app.route('/api/jobs/<int:job_id>', methods=['GET'])
 def get_job(job_id):
     j = JobHE.query.get_or_404(job_id)
-    scheds = JobDE.query.filter_by(job_id=job_id).all()
     return jsonify({
         'job_id': j.job_id,
         'job_name': j.job_name,
@@ -410,11 +519,16 @@ def get_job(job_id):
         'parameter_id': j.parameter_id,
         'data_primary_key': j.data_primary_key,
         'sql_script': j.sql_script,
-        'schedule': {
-            'minute': ','.join([s.job_minute for s in scheds]),
-            'hour': ','.join([s.job_hour   for s in scheds]),
-            'day': ','.join(set([s.job_day     for s in scheds])),
-        }
+        'job_priority': j.job_priority,
+        'job_weight': j.job_weight,
+        'columnar_output': j.columnar_output,
+        'split_column': j.split_column,
+        'split_parts': j.split_parts,
+        'export_compression': j.export_compression,
+        'fetch_arraysize': j.fetch_arraysize,
+        'fetch_prefetchrows': j.fetch_prefetchrows,
+        'overlap_policy': j.overlap_policy,
+        'schedule': schedule_fields(j.schedule_mask)
     })
 
 
@@ -428,37 +542,32 @@ def update_job(job_id):
     j = JobHE.query.get_or_404(job_id)
     original_name = j.job_name
 
+    if data.get('sql_script') is not None and not is_select_query(data['sql_script']):
+        log_warning(logger, f"Job update for '{original_name}' (ID: {job_id}) by '{actor}' rejected: SQL is not a SELECT query.", job_id=job_id, user=actor)
+        return jsonify({"msg": "SQL script must be a read-only SELECT query"}), 400
+
+    try:
+        new_mask = parse_schedule(data['schedule']) if 'schedule' in data else j.schedule_mask
+    except ValueError as e:
+        log_warning(logger, f"Job update for '{original_name}' (ID: {job_id}) by '{actor}' rejected: {e}", job_id=job_id, user=actor)
+        return jsonify({"msg": f"Invalid schedule: {e}"}), 400
+
     try:
         changes = []
 
         # 1. Rastrear mudanças em JobHE (sem aplicar ainda)
         for field in ['job_name', 'job_status', 'export_type', 'export_path', 'export_name', 'days_offset',
-                      'check_parameter', 'parameter_id', 'data_primary_key', 'sql_script']:
+                      'check_parameter', 'parameter_id', 'data_primary_key', 'sql_script', 'job_priority', 'job_weight', 'columnar_output',
+                      'split_column', 'split_parts', 'export_compression', 'fetch_arraysize', 'fetch_prefetchrows', 'overlap_policy']:
             if field in data and getattr(j, field) != data[field]:
                 # Guardamos o valor antigo e o novo para um log mais rico
                 old_value = getattr(j, field)
                 new_value = data[field]
                 changes.append(f"{field} changed from '{old_value}' to '{new_value}'")
 
-        # 2. Rastrear mudanças na agenda (JobDE)
-        new_sched_data = data.get('schedule', {})
-        new_minutes = sorted([x for x in new_sched_data.get('minute', '').split(',') if x])
-        new_hours = sorted([x for x in new_sched_data.get('hour', '').split(',') if x])
-        new_days = sorted(list(set(new_sched_data.get('day', '').split(','))))  # Usar set para remover duplicados
-
-        # Cria uma representação "canônica" da nova agenda
-        new_schedule_set = set()
-        for d in new_days:
-            for h in new_hours:
-                for m in new_minutes:
-                    new_schedule_set.add((d, h, m))
-
-        # Pega a agenda antiga do banco para comparar
-        old_schedules = JobDE.query.filter_by(job_id=job_id).all()
-        old_schedule_set = set((s.job_day, s.job_hour, s.job_minute) for s in old_schedules)
-
-        # Compara a agenda antiga com a nova
-        if old_schedule_set != new_schedule_set:
+        # 2. Rastrear mudanças na agenda (as máscaras já são a forma canônica)
+        schedule_changed = new_mask != j.schedule_mask
+        if schedule_changed:
             changes.append("schedule changed")
 
         # 3. Se não houver mudanças, retornar agora
@@ -480,20 +589,22 @@ def update_job(job_id):
         j.parameter_id = data.get('parameter_id')
         j.data_primary_key = data.get('data_primary_key')
         j.sql_script = data.get('sql_script')
-
-        # Aplicar mudanças em JobDE (apagar e recriar)
-        JobDE.query.filter_by(job_id=job_id).delete(
-            synchronize_session=False)  # Adicionar synchronize_session pode evitar alguns warnings/erros
-
-        # Adiciona os novos agendamentos usando o conjunto já calculado
-        for d, h, m in new_schedule_set:
-            db.session.add(JobDE(
-                job_id=job_id,
-                job_minute=m,
-                job_hour=h,
-                job_day=d
-            ))
-
+        j.job_priority = data.get('job_priority', j.job_priority)
+        j.job_weight = data.get('job_weight', j.job_weight)
+        j.columnar_output = data.get('columnar_output', j.columnar_output)
+        j.split_column = data.get('split_column', j.split_column) or None
+        j.split_parts = data.get('split_parts', j.split_parts)
+        j.export_compression = data.get('export_compression', j.export_compression) or None
+        j.fetch_arraysize = data.get('fetch_arraysize', j.fetch_arraysize) or None
+        j.fetch_prefetchrows = data.get('fetch_prefetchrows', j.fetch_prefetchrows)
+        j.overlap_policy = data.get('overlap_policy', j.overlap_policy) or 'skip'
+        j.schedule_days, j.schedule_hours, j.schedule_minutes = new_mask
+
+        # jobs_de só é regravada quando a agenda mudou
+        if schedule_changed:
+            write_schedule_rows(job_id, new_mask)
+
+        notify_job_change(job_id, 'updated')
         db.session.commit()
         log_info(logger,
                  f"Job '{j.job_name}' (ID: {job_id}) updated successfully by '{actor}'. Changes: {'; '.join(changes)}.",
@@ -506,6 +617,42 @@ def update_job(job_id):
                       user=actor)
         return jsonify({'msg': 'Error updating job'}), 500
 
+# Percentis do histórico de execuções (job_runs), para encontrar regressões de tempo
+RUN_PERCENTILES = (0.5, 0.9, 0.99)
+RUN_METRICS = ('duration_ms', 'connect_ms', 'execute_ms', 'fetch_ms', 'serialize_ms', 'rows_exported', 'bytes_written')
+
+@app.route('/api/jobs/runs/percentiles', methods=['GET'])
+@login_required
+def job_run_percentiles():
+    """
+    Percentis (p50/p90/p99) da duração total e de cada fase das execuções bem-sucedidas por job,
+    nos últimos `days` dias (padrão 30). `job_id` limita a um job.
+    """
+    days = request.args.get('days', 30, type=int)
+    job_id = request.args.get('job_id', type=int)
+
+    columns = [JobRun.job_id, func.count().label('runs')]
+    for metric in RUN_METRICS:
+        for percentile in RUN_PERCENTILES:
+            columns.append(func.percentile_cont(percentile).within_group(getattr(JobRun, metric))
+                           .label(f"{metric}_p{round(percentile * 100)}"))
+    query = (db.session.query(*columns)
+             .filter(JobRun.status == 'success',
+                     JobRun.started_at >= datetime.datetime.now() - datetime.timedelta(days=days))
+             .group_by(JobRun.job_id))
+    if job_id is not None:
+        query = query.filter(JobRun.job_id == job_id)
+
+    names = dict(db.session.query(JobHE.job_id, JobHE.job_name))
+    result = []
+    for row in query:
+        values = row._asdict()
+        item = {'job_id': row.job_id, 'job_name': names.get(row.job_id), 'runs': row.runs}
+        for metric in RUN_METRICS:
+            item[metric] = {f"p{round(p * 100)}": values[f"{metric}_p{round(p * 100)}"] for p in RUN_PERCENTILES}
+        result.append(item)
+    return jsonify(sorted(result, key=lambda item: item['job_name'] or ''))
+
 @app.route('/api/jobs/<int:job_id>', methods=['DELETE'])
 @login_required
 def delete_job(job_id):
@@ -520,6 +667,7 @@ def delete_job(job_id):
         JobHE.query.filter_by(job_id=job_id).delete()
         JobDE.query.filter_by(job_id=job_id).delete()
 
+        notify_job_change(job_id, 'deleted')
         db.session.commit()
         log_info(logger, f"Job '{job_name}' (ID: {job_id}) deleted successfully by '{actor}'.", job_id=job_id, user=actor)
         return jsonify({'msg':'deleted'})
@@ -539,7 +687,8 @@ def delete_job(job_id):
 def list_datasets():
     """
     Lista todos os arquivos .csv disponíveis na pasta configurada,
-    incluindo os que estão em subpastas.
+    incluindo os que estão em subpastas. As partições mensais ('nome MM.AAAA.csv')
+    aparecem como um único dataset ('nome').
     """
     try:
         csv_path = main_parameters['data_api']['csv_folder_path']
@@ -547,18 +696,21 @@ def list_datasets():
             log_error(logger, f"CSV folder not found at path: {csv_path}")
             return jsonify({'error': 'Server configuration error: CSV folder not found'}), 500
 
-        datasets = []
+        datasets = set()
         # os.walk percorre a árvore de diretórios de cima para baixo
         for root, dirs, files in os.walk(csv_path):
             for filename in files:
-                if filename.endswith('.csv'):
+                if filename.endswith(CSV_SUFFIXES):
+                    partition = parse_export_name(filename)
+                    if partition:
+                        filename = partition[0] + '.csv'
                     # Pega o caminho completo do arquivo
                     full_path = os.path.join(root, filename)
                     # Calcula o caminho relativo à pasta base
                     relative_path = os.path.relpath(full_path, csv_path)
-                    # Remove a extensão .csv e garante barras de URL (/)
-                    dataset_id = os.path.splitext(relative_path)[0].replace(os.sep, '/')
-                    datasets.append(dataset_id)
+                    # Remove a extensão (.csv, .csv.gz, .csv.zst) e garante barras de URL (/)
+                    dataset_id = csv_base_path(relative_path).replace(os.sep, '/')
+                    datasets.add(dataset_id)
         
         return jsonify(sorted(datasets)) # Retorna a lista ordenada para melhor visualização
     except KeyError:
@@ -577,6 +729,13 @@ def get_dataset(dataset_path): # O nome da variável aqui deve corresponder ao d
     """
     Retorna o conteúdo de um arquivo CSV como JSON, usando um caminho relativo.
     Suporta paginação com os parâmetros de query ?limit= e ?offset=
+    Com ?format=ndjson (um registro por linha) ou ?stream=true (array JSON) a resposta
+    é gerada em blocos, sem carregar o arquivo inteiro em memória.
+    ?columns=a,b retorna apenas as colunas pedidas, ?filter=COL:op:valor filtra e ?sort=COL,-COL2
+    ordena no servidor. Se o job gravou o sidecar Parquet, a leitura é feita nele
+    (tipado e memory-mapped) em vez do CSV.
+    As respostas levam ETag/Last-Modified (requisições condicionais recebem 304) e as
+    não-streaming ficam em um cache LRU em memória até o arquivo ser regravado.
     """
     try:
         base_path = main_parameters['data_api']['csv_folder_path']
@@ -590,26 +749,51 @@ def get_dataset(dataset_path): # O nome da variável aqui deve corresponder ao d
              log_warning(logger, f"Potential directory traversal attempt for dataset: {dataset_path}")
              return jsonify({'error': 'Invalid dataset name'}), 400
 
-        if not os.path.isfile(file_path):
-            log_warning(logger, f"Dataset not found: {dataset_path}")
-            return jsonify({'error': f'Dataset "{dataset_path}" not found'}), 404
-
-        print(file_path)
-        # O resto da função permanece igual
-        df = pd.read_csv(file_path, encoding='utf-8', sep=';')
-        df = df.astype(object).where(pd.notnull(df), None)
-
+        # o arquivo pode estar comprimido (nome.csv.gz / nome.csv.zst): a leitura é transparente
+        dataset_file = resolve_dataset_file(file_path)
+        if dataset_file:
+            file_path = dataset_file
+        else:
+            # dataset particionado por mês: as partições são lidas como um único dataset
+            file_path = find_dataset_partitions(file_path)
+            if not file_path:
+                log_warning(logger, f"Dataset not found: {dataset_path}")
+                return jsonify({'error': f'Dataset "{dataset_path}" not found'}), 404
+
+        # Projeção, filtros, ordenação e paginação (ver DatasetQuery)
         try:
-            limit = request.args.get('limit', type=int)
-            offset = request.args.get('offset', default=0, type=int)
-            if limit is not None:
-                df = df.iloc[offset : offset + limit]
-        except Exception as e:
-            log_warning(logger, f"Invalid pagination parameters for {dataset_path}: {e}")
+            query = DatasetQuery.from_args(request.args)
+            query.validate(dataset_columns(file_path))
+        except DatasetQueryError as e:
+            log_warning(logger, f"Invalid query for dataset {dataset_path}: {e}")
+            return jsonify({'error': str(e)}), 400
+
+        cache_key, etag, last_modified = dataset_validators(file_path, request.args)
+        if is_not_modified(request, etag, last_modified):
+            return validated(Response(status=304), etag, last_modified)
+
+        output_format = request.args.get('format', default='json').lower()
+        if output_format == 'ndjson' or request.args.get('stream', default='false').lower() in ('1', 'true'):
+            return validated(stream_dataset(file_path, dataset_path, output_format, query), etag, last_modified)
+
+        cached = dataset_cache.get(cache_key)
+        if cached is not None:
+            body, headers = cached
+            return validated(Response(body, mimetype='application/json', headers=headers), etag, last_modified)
+
+        df, total_rows = run_query(file_path, query)
+        df = df.astype(object).where(pd.notnull(df), None)
 
         data = df.to_dict(orient='records')
-        return jsonify(data)
-
+        response = jsonify(data)
+        if total_rows is not None and (query.offset or query.limit is not None):
+            response.headers[TOTAL_COUNT_HEADER] = str(total_rows)
+        extra_headers = {k: v for k, v in response.headers.items() if k == TOTAL_COUNT_HEADER}
+        dataset_cache.put(cache_key, response.get_data(), extra_headers)
+        return validated(response, etag, last_modified)
+
+    except DatasetQueryError as e:
+        return jsonify({'error': str(e)}), 400
     except KeyError:
         log_error(logger, "data_api:csv_folder_path not configured in parameters file.")
         return jsonify({'error': 'Server configuration error: API path not configured'}), 500
@@ -618,6 +802,45 @@ def get_dataset(dataset_path): # O nome da variável aqui deve corresponder ao d
         return jsonify({'error': f'An error occurred while processing the dataset: {str(e)}'}), 500
 
 
+def validated(response, etag, last_modified):
+    """Cabeçalhos de validação HTTP para o cliente/proxy reaproveitar a resposta."""
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def stream_dataset(file_path, dataset_path, output_format, query):
+    """Resposta em streaming (NDJSON ou array JSON) lendo o dataset em blocos."""
+    chunk_rows = main_parameters['data_api'].get('stream_chunk_rows', CHUNK_ROWS)
+
+    headers = {}
+    if query.is_plain and (query.offset or query.limit is not None):
+        headers[TOTAL_COUNT_HEADER] = str(count_dataset_rows(file_path))
+
+    def generate():
+        # sem filtros, a leitura começa no registro pedido, sem percorrer o início do arquivo
+        chunks = iter_query_chunks(file_path, query, chunk_rows=chunk_rows)
+        try:
+            pieces = stream_ndjson(chunks) if output_format == 'ndjson' else stream_json_array(chunks)
+            for piece in pieces:
+                body = piece.encode('utf-8')
+                data_api_bytes.inc(len(body))
+                yield body
+        except Exception as e:
+            # O status já foi enviado: a resposta termina com o registro de erro (ver data_api.STREAM_ERROR_KEY)
+            log_exception(logger, f"Error streaming dataset {dataset_path}: {e}")
+
+    mimetype = NDJSON_MIMETYPE if output_format == 'ndjson' else 'application/json'
+    return Response(stream_with_context(generate()), mimetype=mimetype, headers=headers)
+
+
+@app.route(metrics.METRICS_PATH, methods=['GET'])
+@metrics_auth_required
+def metrics_endpoint():
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+
 # Servindo o front-end React+Vite (agora usando o REACT_BUILD do config)
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
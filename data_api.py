@@ -0,0 +1,639 @@
+"""
+##----------------------------------------
+Funções de leitura da API de dados (CSVs)
+##----------------------------------------
+"""
+import csv
+import datetime
+import hashlib
+import json
+import os
+import struct
+import threading
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # sem pyarrow a API lê apenas os CSVs
+    pa = None
+    ds = None
+    pq = None
+
+from auxiliares import columnar_path, parse_export_name, open_export, compression_of, atomic_output, CSV_SUFFIXES
+
+# Quantidade de linhas lidas por bloco no modo streaming. O primeiro bloco é pequeno
+# para que o primeiro byte saia rápido, mesmo em arquivos muito grandes.
+FIRST_CHUNK_ROWS = 1000
+CHUNK_ROWS = 50000
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+TOTAL_COUNT_HEADER = 'X-Total-Count'
+
+# No streaming o status 200 já foi enviado quando um erro acontece no meio da leitura: a resposta
+# termina com um registro {"_error": ...}, que o cliente usa para saber que ela está incompleta
+STREAM_ERROR_KEY = '_error'
+STREAM_ERROR_MESSAGE = 'Error reading the dataset; the response is incomplete.'
+
+# Orçamento padrão (bytes) do cache de respostas serializadas (data_api.cache_max_bytes)
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Índice de linhas: a cada INDEX_EVERY_ROWS registros guardamos o byte onde o registro começa,
+# permitindo ir direto para uma página sem ler o arquivo desde o início.
+INDEX_EVERY_ROWS = 1000
+INDEX_SUFFIX = '.idx'
+INDEX_HEADER = struct.Struct('<qqqq')  # mtime_ns, tamanho do CSV, intervalo, total de registros
+
+# Datasets particionados por mês ('nome MM.AAAA.csv'): partições lidas ao mesmo tempo
+PARTITION_WORKERS = 4
+
+
+
+class DatasetQueryError(ValueError):
+    """Parâmetros de consulta inválidos para o dataset (respondido com 400)."""
+
+
+_index_locks = {}
+_index_locks_guard = threading.Lock()
+_partition_executor = ThreadPoolExecutor(max_workers=PARTITION_WORKERS, thread_name_prefix='dataset-partition')
+
+
+class RowIndex:
+    def __init__(self, every, total_rows, offsets):
+        self.every = every
+        self.total_rows = total_rows
+        self.offsets = offsets
+
+    def locate(self, row):
+        """Retorna (byte inicial do bloco, registros a pular dentro do bloco) para o registro `row`."""
+        block = row // self.every
+        return self.offsets[block], row - block * self.every
+
+
+def build_row_index(file_path, every=INDEX_EVERY_ROWS):
+    """
+    Percorre o CSV uma única vez e grava o índice de linhas ao lado dele (`<arquivo>.csv.idx`).
+    Campos entre aspas com quebra de linha são respeitados: um registro só termina quando
+    a quantidade de aspas acumulada é par. Em arquivos comprimidos as posições não permitem
+    seek e o índice serve apenas para a contagem de registros.
+    """
+    stat = os.stat(file_path)
+    offsets = array('q')
+    rows = 0
+    in_quotes = False
+    with open_export(file_path, 'rb') as f:
+        position = len(f.readline())  # cabeçalho
+        for line in f:
+            if not in_quotes and rows % every == 0:
+                offsets.append(position)
+            if line.count(b'"') % 2:
+                in_quotes = not in_quotes
+            position += len(line)
+            if not in_quotes:
+                rows += 1
+
+    with atomic_output(file_path + INDEX_SUFFIX) as tmp_path:
+        with open(tmp_path, 'wb') as f:
+            f.write(INDEX_HEADER.pack(stat.st_mtime_ns, stat.st_size, every, rows))
+            offsets.tofile(f)
+    return RowIndex(every, rows, offsets)
+
+
+def _read_row_index(file_path):
+    """Lê o índice gravado, ou None se ele não existe ou não corresponde mais ao CSV."""
+    try:
+        stat = os.stat(file_path)
+        with open(file_path + INDEX_SUFFIX, 'rb') as f:
+            mtime_ns, size, every, rows = INDEX_HEADER.unpack(f.read(INDEX_HEADER.size))
+            if (mtime_ns, size) != (stat.st_mtime_ns, stat.st_size):
+                return None
+            offsets = array('q')
+            offsets.frombytes(f.read())
+        return RowIndex(every, rows, offsets)
+    except (OSError, struct.error, ValueError):
+        return None
+
+
+def get_row_index(file_path):
+    """Retorna o índice de linhas do CSV, construindo-o na primeira vez (ou se o CSV mudou)."""
+    index = _read_row_index(file_path)
+    if index is not None:
+        return index
+
+    with _index_locks_guard:
+        lock = _index_locks.setdefault(file_path, threading.Lock())
+    with lock:
+        # outra thread pode ter construído enquanto esperávamos
+        return _read_row_index(file_path) or build_row_index(file_path)
+
+
+def read_csv_header(file_path):
+    with open_export(file_path, 'r') as f:
+        return next(csv.reader(f, delimiter=';'), [])
+
+
+def resolve_dataset_file(csv_path):
+    """
+    Arquivo do dataset `nome.csv`, comprimido ou não ('nome.csv', 'nome.csv.gz', 'nome.csv.zst').
+    Se houver mais de uma variante (a compressão do job mudou), usa a mais recente. None se não existir.
+    """
+    candidates = [path for path in (csv_path[:-len('.csv')] + suffix for suffix in CSV_SUFFIXES) if os.path.isfile(path)]
+    if not candidates:
+        return None
+    return max(candidates, key=os.path.getmtime)
+
+
+def find_columnar_sidecar(file_path):
+    """Retorna o sidecar Parquet do CSV se ele existir e for tão novo quanto o CSV; senão None."""
+    if pq is None:
+        return None
+    path = columnar_path(file_path)
+    try:
+        if os.stat(path).st_mtime_ns >= os.stat(file_path).st_mtime_ns:
+            return path
+    except OSError:
+        pass
+    return None
+
+
+def find_dataset_partitions(file_path):
+    """
+    Partições mensais do dataset `nome.csv` (arquivos 'nome MM.AAAA.csv' gravados pelo job
+    com export_type 'Mês'), em ordem cronológica. Lista vazia se não houver.
+    """
+    folder, file_name = os.path.split(file_path)
+    name = os.path.splitext(file_name)[0]
+    try:
+        entries = os.listdir(folder)
+    except OSError:
+        return []
+    partitions = {}
+    for entry in entries:
+        parsed = parse_export_name(entry)
+        if parsed and parsed[0] == name:
+            path = os.path.join(folder, entry)
+            # o mesmo mês com outra compressão: fica o arquivo mais recente
+            if parsed[1] not in partitions or os.path.getmtime(path) > os.path.getmtime(partitions[parsed[1]]):
+                partitions[parsed[1]] = path
+    return [partitions[month] for month in sorted(partitions)]
+
+
+def _partitions(file_path):
+    """As funções de leitura aceitam um CSV ou a lista de partições de um dataset mensal."""
+    return list(file_path) if isinstance(file_path, (list, tuple)) else [file_path]
+
+
+def _map_partitions(func, paths):
+    """Aplica `func` a cada partição, em paralelo quando há mais de uma (a leitura libera o GIL)."""
+    if len(paths) == 1:
+        return [func(paths[0])]
+    return list(_partition_executor.map(func, paths))
+
+
+def dataset_columns(file_path):
+    # a partição mais recente define as colunas do dataset
+    path = _partitions(file_path)[-1]
+    sidecar = find_columnar_sidecar(path)
+    if sidecar:
+        return pq.read_schema(sidecar, memory_map=True).names
+    return read_csv_header(path)
+
+
+def _frame_from_arrow(table):
+    """Converte para pandas mantendo as datas no mesmo texto que o CSV (str(datetime))."""
+    df = table.to_pandas()
+    for field in table.schema:
+        if pa.types.is_timestamp(field.type):
+            values = df[field.name]
+            text = values.dt.strftime('%Y-%m-%d %H:%M:%S')
+            micro = values.dt.microsecond
+            text = text.where(micro.fillna(0) == 0, text + '.' + micro.fillna(0).astype(int).astype(str).str.zfill(6))
+            df[field.name] = text.where(values.notna(), None)
+    return df
+
+
+def _iter_parquet_chunks(path, columns, start_row, chunk_rows):
+    parquet_file = pq.ParquetFile(path, memory_map=True)
+    # pula direto os row groups que terminam antes de start_row
+    first_group, skip = 0, start_row
+    metadata = parquet_file.metadata
+    while first_group < metadata.num_row_groups and skip >= metadata.row_group(first_group).num_rows:
+        skip -= metadata.row_group(first_group).num_rows
+        first_group += 1
+    if first_group >= metadata.num_row_groups:
+        return
+    batches = parquet_file.iter_batches(batch_size=chunk_rows, columns=columns,
+                                        row_groups=range(first_group, metadata.num_row_groups))
+    frames = (_frame_from_arrow(pa.Table.from_batches([batch])) for batch in batches)
+    yield from slice_chunks(frames, offset=skip)
+
+
+def _iter_csv_chunks(file_path, columns, start_row, chunk_rows, first_chunk_rows):
+    if start_row > 0 and compression_of(file_path):
+        # arquivo comprimido não permite seek: descomprime desde o início e descarta os registros
+        if start_row >= get_row_index(file_path).total_rows:
+            return
+        reader = pd.read_csv(file_path, encoding='utf-8', sep=';', usecols=columns, iterator=True)
+        yield from slice_chunks(_iter_reader(reader, chunk_rows, chunk_rows), offset=start_row)
+        return
+
+    if start_row > 0:
+        index = get_row_index(file_path)
+        if start_row >= index.total_rows:
+            return
+        position, skip = index.locate(start_row)
+        with open(file_path, 'rb') as f:
+            f.seek(position)
+            reader = pd.read_csv(f, encoding='utf-8', sep=';', header=None, names=read_csv_header(file_path),
+                                 usecols=columns, iterator=True)
+            # os registros até o início do bloco indexado são descartados já parseados,
+            # pois um registro pode ocupar várias linhas
+            yield from slice_chunks(_iter_reader(reader, chunk_rows, first_chunk_rows + skip), offset=skip)
+        return
+
+    reader = pd.read_csv(file_path, encoding='utf-8', sep=';', usecols=columns, iterator=True)
+    yield from _iter_reader(reader, chunk_rows, first_chunk_rows)
+
+
+def iter_dataset_chunks(file_path, columns=None, start_row=0, chunk_rows=CHUNK_ROWS, first_chunk_rows=FIRST_CHUNK_ROWS):
+    """
+    Lê o dataset em blocos de DataFrame, sem carregar o arquivo inteiro em memória.
+    Usa o sidecar Parquet (memory-mapped, apenas as colunas pedidas) quando ele existe;
+    senão lê o CSV. Com `start_row` a leitura começa direto no registro pedido (em um
+    dataset particionado, as partições inteiras antes dele são puladas pela contagem).
+    """
+    for path in _partitions(file_path):
+        if start_row:
+            rows = _count_file_rows(path)
+            if start_row >= rows:
+                start_row -= rows
+                continue
+        sidecar = find_columnar_sidecar(path)
+        if sidecar:
+            yield from _iter_parquet_chunks(sidecar, columns, start_row, chunk_rows)
+        else:
+            yield from _iter_csv_chunks(path, columns, start_row, chunk_rows, first_chunk_rows)
+        start_row = 0
+
+
+def _count_file_rows(path):
+    sidecar = find_columnar_sidecar(path)
+    if sidecar:
+        return pq.ParquetFile(sidecar, memory_map=True).metadata.num_rows
+    return get_row_index(path).total_rows
+
+
+def count_dataset_rows(file_path):
+    return sum(_map_partitions(_count_file_rows, _partitions(file_path)))
+
+
+def _read_file(path, columns):
+    sidecar = find_columnar_sidecar(path)
+    if sidecar:
+        return _frame_from_arrow(pq.read_table(sidecar, columns=columns, memory_map=True))
+    return pd.read_csv(path, encoding='utf-8', sep=';', usecols=columns)
+
+
+def read_dataset(file_path, columns=None):
+    """Lê o dataset inteiro (apenas as colunas pedidas); as partições são lidas em paralelo."""
+    frames = _map_partitions(lambda path: _read_file(path, columns), _partitions(file_path))
+    return frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+
+
+# --- Filtros, projeção e ordenação (?filter=, ?columns=, ?sort=) ---
+FILTER_OPERATORS = ('eq', 'ne', 'gt', 'gte', 'lt', 'lte', 'in')
+
+
+class DatasetQuery:
+    """
+    Consulta sobre um dataset, montada a partir dos parâmetros da URL:
+      ?columns=a,b              projeção
+      ?filter=COL:op:valor      filtro (repetível); op em eq, ne, gt, gte, lt, lte, in (valores separados por |)
+      ?sort=COL,-COL2           ordenação ('-' = decrescente)
+      ?offset= e ?limit=        paginação, aplicada depois dos filtros e da ordenação
+    """
+
+    def __init__(self, columns=None, filters=None, sort=None, offset=0, limit=None):
+        self.columns = columns or None
+        self.filters = filters or []
+        self.sort = sort or []
+        self.offset = max(offset or 0, 0)
+        self.limit = limit
+
+    @classmethod
+    def from_args(cls, args):
+        columns = [c.strip() for c in args.get('columns', default='').split(',') if c.strip()]
+        filters = []
+        for raw in args.getlist('filter'):
+            parts = raw.split(':', 2)
+            if len(parts) != 3 or parts[1] not in FILTER_OPERATORS:
+                raise DatasetQueryError(f"Invalid filter '{raw}'. Expected COLUMN:op:value with op in {', '.join(FILTER_OPERATORS)}.")
+            column, op, value = parts
+            filters.append((column, op, value.split('|') if op == 'in' else value))
+        sort = []
+        for raw in args.get('sort', default='').split(','):
+            raw = raw.strip()
+            if raw:
+                sort.append((raw.lstrip('-'), not raw.startswith('-')))
+        return cls(columns, filters, sort, args.get('offset', default=0, type=int), args.get('limit', type=int))
+
+    @property
+    def is_plain(self):
+        """Sem filtros nem ordenação: a paginação pode ir direto ao registro pelo índice."""
+        return not self.filters and not self.sort
+
+    def read_columns(self, all_columns):
+        """Colunas que precisam ser lidas: projeção + colunas usadas nos filtros e na ordenação."""
+        if not self.columns:
+            return None
+        needed = list(self.columns)
+        for column in [f[0] for f in self.filters] + [s[0] for s in self.sort]:
+            if column not in needed:
+                needed.append(column)
+        return [c for c in all_columns if c in needed]
+
+    def validate(self, all_columns):
+        referenced = (self.columns or []) + [f[0] for f in self.filters] + [s[0] for s in self.sort]
+        unknown = [c for c in dict.fromkeys(referenced) if c not in all_columns]
+        if unknown:
+            raise DatasetQueryError(f"Unknown columns: {', '.join(unknown)}")
+
+
+def _arrow_filter(filters, schema):
+    """Traduz os filtros em uma expressão do pyarrow.dataset (pushdown com estatísticas dos row groups)."""
+    expression = None
+    for column, op, value in filters:
+        field_type = schema.field(column).type
+        values = [_arrow_value(field_type, v) for v in (value if op == 'in' else [value])]
+        values = [v for v in values if v is not None]
+        field = ds.field(column)
+        if not values:
+            # valor incompatível com o tipo da coluna: nenhum registro atende (igual ao CSV)
+            condition = ds.scalar(False)
+            expression = condition if expression is None else expression & condition
+            continue
+        condition = {
+            'eq': lambda: field == values[0],
+            'ne': lambda: field != values[0],
+            'gt': lambda: field > values[0],
+            'gte': lambda: field >= values[0],
+            'lt': lambda: field < values[0],
+            'lte': lambda: field <= values[0],
+            'in': lambda: field.isin(values),
+        }[op]()
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def _arrow_value(field_type, value):
+    """Converte o valor do filtro para o tipo da coluna; None se não for compatível."""
+    try:
+        if pa.types.is_integer(field_type) or pa.types.is_floating(field_type):
+            return pa.scalar(float(value), type=pa.float64())
+        if pa.types.is_timestamp(field_type):
+            return pa.scalar(pd.Timestamp(value).to_pydatetime(), type=field_type)
+    except ValueError:
+        return None
+    return pa.scalar(str(value), type=pa.string())
+
+
+def _frame_mask(df, filters):
+    """Máscara vetorizada dos filtros sobre um bloco do CSV (nenhuma linha vira objeto Python)."""
+    mask = pd.Series(True, index=df.index)
+    for column, op, value in filters:
+        series = df[column]
+        values = value if op == 'in' else [value]
+        if pd.api.types.is_numeric_dtype(series):
+            values = list(pd.to_numeric(pd.Series(values), errors='coerce'))
+        else:
+            series = series.where(series.isna(), series.astype(str))
+        if op == 'in':
+            condition = series.isin(values)
+        else:
+            condition = {
+                'eq': series.__eq__, 'ne': series.__ne__,
+                'gt': series.__gt__, 'gte': series.__ge__,
+                'lt': series.__lt__, 'lte': series.__le__,
+            }[op](values[0])
+        mask &= condition.fillna(False).astype(bool) & series.notna()
+    return mask
+
+
+def _iter_filtered_chunks(file_path, query, read_columns, chunk_rows, first_chunk_rows):
+    for path in _partitions(file_path):
+        yield from _iter_filtered_file_chunks(path, query, read_columns, chunk_rows, first_chunk_rows)
+
+
+def _filtered_frames(file_path, query, read_columns, chunk_rows, first_chunk_rows):
+    """Todos os blocos filtrados, na ordem das partições; as partições são lidas em paralelo."""
+    per_partition = _map_partitions(
+        lambda path: list(_iter_filtered_file_chunks(path, query, read_columns, chunk_rows, first_chunk_rows)),
+        _partitions(file_path))
+    return [frame for frames in per_partition for frame in frames]
+
+
+def _iter_filtered_file_chunks(file_path, query, read_columns, chunk_rows, first_chunk_rows):
+    sidecar = find_columnar_sidecar(file_path)
+    if sidecar:
+        dataset = ds.dataset(sidecar, format='parquet')
+        batches = dataset.to_batches(columns=read_columns, filter=_arrow_filter(query.filters, dataset.schema),
+                                     batch_size=chunk_rows)
+        for batch in batches:
+            if batch.num_rows:
+                yield _frame_from_arrow(pa.Table.from_batches([batch]))
+        return
+
+    for chunk in _iter_csv_chunks(file_path, read_columns, 0, chunk_rows, first_chunk_rows):
+        if query.filters:
+            chunk = chunk[_frame_mask(chunk, query.filters)]
+        if not chunk.empty:
+            yield chunk
+
+
+def iter_query_chunks(file_path, query, chunk_rows=CHUNK_ROWS, first_chunk_rows=FIRST_CHUNK_ROWS):
+    """
+    Executa a consulta em blocos. Os filtros são aplicados durante a leitura (expressão do
+    pyarrow.dataset no sidecar, máscara vetorizada por bloco no CSV), antes de qualquer conversão
+    para objetos Python. Com ordenação, apenas as linhas já filtradas são reunidas e ordenadas.
+    """
+    if query.is_plain:
+        yield from slice_chunks(iter_dataset_chunks(file_path, query.columns, query.offset, chunk_rows, first_chunk_rows),
+                                limit=query.limit)
+        return
+
+    read_columns = query.read_columns(dataset_columns(file_path))
+    if query.sort:
+        frames = _filtered_frames(file_path, query, read_columns, chunk_rows, first_chunk_rows)
+        if not frames:
+            return
+        df = pd.concat(frames, ignore_index=True)
+        df = df.sort_values([c for c, _ in query.sort], ascending=[a for _, a in query.sort],
+                            kind='mergesort', na_position='last')
+        end = None if query.limit is None else query.offset + query.limit
+        df = df.iloc[query.offset:end]
+        chunks = (df.iloc[i:i + chunk_rows] for i in range(0, len(df), chunk_rows))
+    else:
+        chunks = slice_chunks(_iter_filtered_chunks(file_path, query, read_columns, chunk_rows, first_chunk_rows),
+                              query.offset, query.limit)
+
+    for chunk in chunks:
+        yield chunk[query.columns] if query.columns else chunk
+
+
+def run_query(file_path, query):
+    """Executa a consulta inteira. Retorna (DataFrame, total de registros do dataset ou None se filtrado)."""
+    total_rows = count_dataset_rows(file_path) if query.is_plain else None
+    if query.is_plain and not query.offset and query.limit is None:
+        df = read_dataset(file_path, query.columns)
+    else:
+        if not query.is_plain and not query.sort and query.limit is None:
+            # todas as partições serão lidas de qualquer forma: filtra em paralelo
+            read_columns = query.read_columns(dataset_columns(file_path))
+            frames = list(slice_chunks(_filtered_frames(file_path, query, read_columns, CHUNK_ROWS, CHUNK_ROWS),
+                                       offset=query.offset))
+        else:
+            chunk_rows = query.limit if query.is_plain and query.limit else CHUNK_ROWS
+            frames = list(iter_query_chunks(file_path, query, chunk_rows=chunk_rows, first_chunk_rows=chunk_rows))
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=query.columns or dataset_columns(file_path))
+    return (df[query.columns] if query.columns else df), total_rows
+
+
+# --- Cache de respostas e validação condicional (ETag / Last-Modified) ---
+class DatasetCache:
+    """
+    Cache LRU, limitado em bytes, das respostas já serializadas da API de dados.
+    A chave inclui mtime e tamanho do arquivo, então uma nova exportação invalida as
+    entradas antigas naturalmente (elas apenas deixam de ser usadas e saem pelo LRU).
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max(0, int(max_bytes))
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, body, headers):
+        size = len(body)
+        # uma resposta que ocupa mais de 1/4 do orçamento expulsaria quase tudo: não vale a pena
+        if size > self.max_bytes // 4:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= len(self._entries.pop(key)[0])
+            self._entries[key] = (body, headers)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes and self._entries:
+                _, (old_body, _) = self._entries.popitem(last=False)
+                self.current_bytes -= len(old_body)
+
+
+def dataset_validators(file_path, args):
+    """
+    Retorna (chave do cache, ETag, Last-Modified) do dataset para os parâmetros da requisição.
+    A chave/ETag mudam quando o arquivo (ou qualquer partição) é regravado (mtime/tamanho)
+    ou quando a consulta muda.
+    """
+    stats = [(path, os.stat(path)) for path in _partitions(file_path)]
+    key = (tuple((path, stat.st_mtime_ns, stat.st_size) for path, stat in stats), tuple(sorted(args.items(multi=True))))
+    etag = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+    last_modified = datetime.datetime.fromtimestamp(int(max(stat.st_mtime for _, stat in stats)), tz=datetime.timezone.utc)
+    return key, etag, last_modified
+
+
+def is_not_modified(request, etag, last_modified):
+    """Requisição condicional (If-None-Match / If-Modified-Since) ainda válida -> 304."""
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if request.if_modified_since:
+        return last_modified <= request.if_modified_since
+    return False
+
+
+def _iter_reader(reader, chunk_rows, first_chunk_rows):
+    with reader:
+        size = min(first_chunk_rows, chunk_rows)
+        while True:
+            try:
+                chunk = reader.get_chunk(size)
+            except StopIteration:
+                return
+            if chunk.empty:
+                return
+            yield chunk
+            size = chunk_rows
+
+
+def slice_chunks(chunks, offset=0, limit=None):
+    """Aplica ?offset= e ?limit= sobre os blocos, parando a leitura assim que o limite é atingido."""
+    skip = max(offset or 0, 0)
+    remaining = limit
+    for chunk in chunks:
+        if skip:
+            if skip >= len(chunk):
+                skip -= len(chunk)
+                continue
+            chunk = chunk.iloc[skip:]
+            skip = 0
+        if remaining is not None:
+            if remaining <= 0:
+                return
+            chunk = chunk.iloc[:remaining]
+            remaining -= len(chunk)
+        yield chunk
+        if remaining is not None and remaining <= 0:
+            return
+
+
+def _stream_error_record():
+    return json.dumps({STREAM_ERROR_KEY: STREAM_ERROR_MESSAGE})
+
+
+def stream_ndjson(chunks):
+    """
+    Gera uma linha JSON por registro (NDJSON), bloco a bloco. Se a leitura falhar, a última
+    linha é o registro de erro (STREAM_ERROR_KEY) e a exceção segue para quem chamou.
+    """
+    try:
+        for chunk in chunks:
+            yield chunk.to_json(orient='records', lines=True, force_ascii=False, date_format='iso')
+    except Exception:
+        yield _stream_error_record() + '\n'
+        raise
+
+
+def stream_json_array(chunks):
+    """
+    Gera um único array JSON, escrito bloco a bloco. O '[' sai antes de ler o arquivo.
+    Se a leitura falhar, o array é fechado com o registro de erro (STREAM_ERROR_KEY) como último
+    elemento, para o JSON continuar válido, e a exceção segue para quem chamou.
+    """
+    yield '['
+    first = True
+    try:
+        for chunk in chunks:
+            body = chunk.to_json(orient='records', force_ascii=False, date_format='iso')[1:-1]
+            if not body:
+                continue
+            yield body if first else ',' + body
+            first = False
+    except Exception:
+        yield (_stream_error_record() if first else ',' + _stream_error_record()) + ']'
+        raise
+    yield ']'
@@ -0,0 +1,252 @@
+"""
+##----------------------------------------
+Escrita dos arquivos de exportação dos jobs
+##----------------------------------------
+"""
+import csv
+import datetime
+import os
+import re
+import shutil
+
+import oracledb
+
+from auxiliares import open_export, compression_of, atomic_output
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow é opcional: sem ele o job exporta apenas o CSV
+    pa = None
+    pq = None
+
+
+def columnar_available():
+    return pa is not None
+
+
+def _arrow_type(column):
+    """Tipo Arrow equivalente à coluna Oracle (cursor.description)."""
+    type_code = column.type_code
+    if type_code in (oracledb.DB_TYPE_NUMBER, oracledb.DB_TYPE_BINARY_INTEGER):
+        # Igual ao oracledb: NUMBER(p, 0) vem como int; o restante como float
+        if column.scale == 0 and 0 < (column.precision or 0) <= 18:
+            return pa.int64()
+        return pa.float64()
+    if type_code in (oracledb.DB_TYPE_BINARY_DOUBLE, oracledb.DB_TYPE_BINARY_FLOAT):
+        return pa.float64()
+    if type_code in (oracledb.DB_TYPE_DATE, oracledb.DB_TYPE_TIMESTAMP,
+                     oracledb.DB_TYPE_TIMESTAMP_LTZ, oracledb.DB_TYPE_TIMESTAMP_TZ):
+        return pa.timestamp('us')
+    if type_code in (oracledb.DB_TYPE_RAW, oracledb.DB_TYPE_LONG_RAW):
+        return pa.binary()
+    return pa.string()
+
+
+class ParquetSidecarWriter:
+    """
+    Grava, no mesmo loop de fetch do CSV, uma cópia tipada e comprimida do resultado em Parquet.
+    Em caso de erro o arquivo parcial é removido, para a API nunca ler um sidecar incompleto
+    (o agendador grava em um temporário, ver atomic_output).
+    """
+
+    def __init__(self, path, description, compression='zstd'):
+        self.path = path
+        self.schema = pa.schema([(column[0], _arrow_type(column)) for column in description])
+        self._string_columns = [i for i, field in enumerate(self.schema) if pa.types.is_string(field.type)]
+        self._writer = pq.ParquetWriter(path, self.schema, compression=compression)
+
+    def write_batch(self, rows):
+        if not rows:
+            return
+        columns = [list(values) for values in zip(*rows)]
+        for i in self._string_columns:
+            # LOBs, ROWIDs, intervalos etc. vão como texto, igual ao que o csv.writer grava
+            columns[i] = [value if value is None or isinstance(value, str) else str(value) for value in columns[i]]
+        arrays = [pa.array(values, type=field.type) for values, field in zip(columns, self.schema)]
+        self._writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        self._writer.close()
+
+    def abort(self):
+        try:
+            self._writer.close()
+        finally:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+
+
+# --- Serialização do CSV (backend escolhido em scheduler.csv_writer) ---
+CSV_DELIMITER = ';'
+CSV_LINE_TERMINATOR = '\r\n'  # o mesmo do csv.writer
+_needs_quotes = re.compile(f'[{CSV_DELIMITER}"\r\n]').search
+
+
+class CsvRowWriter:
+    """Backend 'csv': o csv.writer, linha a linha."""
+
+    def __init__(self, csvfile):
+        self._writer = csv.writer(csvfile, delimiter=CSV_DELIMITER)
+
+    def writerow(self, row):
+        self._writer.writerow(row)
+
+    def writerows(self, rows):
+        self._writer.writerows(rows)
+
+
+def _format_column(values):
+    """
+    Converte uma coluna do bloco em texto, como o csv.writer faria campo a campo.
+    Datas repetem muito dentro de um bloco, então cada data distinta é convertida uma vez só
+    (o cache é indexado pelo tipo e pelo valor: True, 1 e 1.0 são iguais como chave de dict).
+    """
+    first = next((value for value in values if value is not None), None)
+    if first is None:
+        return [''] * len(values)
+    kind = type(first)
+    if kind is str:
+        texts = ['' if value is None else value for value in values]
+    elif kind is datetime.datetime or kind is datetime.date:
+        cache = {}
+        texts = []
+        for value in values:
+            if value is None:
+                texts.append('')
+                continue
+            key = (type(value), value)
+            text = cache.get(key)
+            if text is None:
+                text = cache[key] = str(value)
+            texts.append(text)
+    else:
+        texts = list(map(str, values)) if None not in values else ['' if value is None else str(value) for value in values]
+
+    try:
+        joined = '\x00'.join(texts)
+    except TypeError:
+        # coluna com tipos misturados: converte valor a valor
+        texts = ['' if value is None else str(value) for value in values]
+        joined = '\x00'.join(texts)
+    # uma única busca na coluna inteira; só se algum campo precisar de aspas olhamos campo a campo
+    if _needs_quotes(joined):
+        texts = ['"' + text.replace('"', '""') + '"' if _needs_quotes(text) else text for text in texts]
+    return texts
+
+
+class ColumnarCsvWriter:
+    """
+    Backend 'columnar': converte cada bloco do fetchmany coluna a coluna (um tipo por coluna,
+    conversões repetidas em cache, verificação de aspas em lote) e grava o bloco com um único
+    write. Gera exatamente os mesmos bytes que o csv.writer (';', QUOTE_MINIMAL, '\\r\\n').
+    """
+
+    def __init__(self, csvfile):
+        self._file = csvfile
+        self._writer = csv.writer(csvfile, delimiter=CSV_DELIMITER)
+
+    def writerow(self, row):
+        self._writer.writerow(row)
+
+    def writerows(self, rows):
+        if not rows:
+            return
+        columns = [_format_column(values) for values in zip(*rows)]
+        if len(columns) == 1:
+            # o csv.writer escreve '""' quando a linha tem um único campo vazio
+            columns[0] = [text or '""' for text in columns[0]]
+        self._file.write(CSV_LINE_TERMINATOR.join(map(CSV_DELIMITER.join, zip(*columns))))
+        self._file.write(CSV_LINE_TERMINATOR)
+
+
+CSV_WRITERS = {
+    'csv': CsvRowWriter,
+    'columnar': ColumnarCsvWriter,
+}
+
+
+def _key_indexes(header, key_columns):
+    """Posições das colunas de `data_primary_key` ('COL_A, COL_B') no cabeçalho do CSV."""
+    names = [name.strip().upper() for name in key_columns.replace(';', ',').split(',') if name.strip()]
+    upper_header = [column.upper() for column in header]
+    missing = [name for name in names if name not in upper_header]
+    if not names or missing:
+        raise ValueError(f"data_primary_key columns not found in the result: {key_columns}")
+    return [upper_header.index(name) for name in names]
+
+
+def merge_incremental(target_path, delta_path, key_columns):
+    """
+    Junta ao CSV existente as linhas novas (delta) deduplicando pela chave: as linhas antigas
+    cuja chave aparece no delta são substituídas pelas novas. Apenas as chaves do delta ficam
+    em memória; o resultado é gravado em um temporário e trocado com os.replace (atomic_output).
+    O arquivo final mantém a compressão do existente (o delta nunca é comprimido).
+    Retorna (linhas mantidas do arquivo antigo, total de linhas do arquivo final).
+    """
+    with open(delta_path, newline='', encoding='utf-8') as delta:
+        reader = csv.reader(delta, delimiter=';')
+        header = next(reader, None)
+        key_indexes = _key_indexes(header, key_columns)
+        delta_keys = set()
+        delta_rows = 0
+        for row in reader:
+            delta_keys.add(tuple(row[i] for i in key_indexes))
+            delta_rows += 1
+
+    kept_rows = 0
+    with atomic_output(target_path) as tmp_path:
+        with open_export(target_path, 'r') as current, \
+                open_export(tmp_path, 'w', compression=compression_of(target_path)) as output:
+            reader = csv.reader(current, delimiter=';')
+            if next(reader, None) != header:
+                raise ValueError("The query columns differ from the existing file; "
+                                 "delete the file to force a full export.")
+            writer = csv.writer(output, delimiter=';')
+            writer.writerow(header)
+            for row in reader:
+                if tuple(row[i] for i in key_indexes) not in delta_keys:
+                    writer.writerow(row)
+                    kept_rows += 1
+
+            # o delta já está no mesmo formato: copia os bytes depois do cabeçalho
+            with open(delta_path, newline='', encoding='utf-8') as delta:
+                delta.readline()
+                shutil.copyfileobj(delta, output)
+    return kept_rows, kept_rows + delta_rows
+
+
+def concat_parquet_parts(part_paths, target_path, compression='zstd'):
+    """
+    Junta os Parquet parciais (mesmo schema, vindo do cursor.description) em um único arquivo,
+    na ordem recebida, lote a lote. O arquivo final só substitui o anterior ao final.
+    """
+    with atomic_output(target_path) as tmp_path:
+        writer = None
+        try:
+            for part_path in part_paths:
+                part = pq.ParquetFile(part_path)
+                if writer is None:
+                    writer = pq.ParquetWriter(tmp_path, part.schema_arrow, compression=compression)
+                for batch in part.iter_batches():
+                    writer.write_batch(batch)
+        finally:
+            if writer is not None:
+                writer.close()
+
+
+def concat_csv_parts(part_paths, target_path):
+    """
+    Junta os CSVs parciais (mesmo cabeçalho, sem compressão) em um único arquivo, na ordem
+    recebida: o cabeçalho vem do primeiro e das demais partes é copiado apenas o conteúdo.
+    O arquivo final é comprimido conforme o seu sufixo e só substitui o anterior ao final.
+    """
+    with atomic_output(target_path) as tmp_path:
+        with open_export(tmp_path, 'wb', compression=compression_of(target_path)) as output:
+            for i, part_path in enumerate(part_paths):
+                with open(part_path, 'rb') as part:
+                    header = part.readline()
+                    if i == 0:
+                        output.write(header)
+                    shutil.copyfileobj(part, output, 1024 * 1024)
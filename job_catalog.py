@@ -0,0 +1,64 @@
+"""
+##----------------------------------------
+Catálogo de jobs (compartilhado entre backend, agendador e benchmarks)
+##----------------------------------------
+"""
+from typing import NamedTuple
+
+from sqlalchemy import column, select, table
+
+from job_schedule import CronMask, JobSchedule
+
+
+class JobRecord(NamedTuple):
+    """Retrato imutável de um job e da sua agenda, desacoplado da sessão do SQLAlchemy."""
+    job_id: int
+    job_name: str
+    job_status: str
+    export_type: str
+    export_path: str
+    export_name: str
+    days_offset: int
+    check_parameter: str
+    parameter_id: int
+    data_primary_key: str
+    sql_script: str
+    job_priority: int
+    job_weight: int
+    columnar_output: str
+    split_column: str
+    split_parts: int
+    export_compression: str
+    fetch_arraysize: int
+    fetch_prefetchrows: int
+    overlap_policy: str
+    schedule_days: int
+    schedule_hours: int
+    schedule_minutes: int
+
+    @property
+    def schedule_mask(self):
+        return CronMask(self.schedule_days or 0, self.schedule_hours or 0, self.schedule_minutes or 0)
+
+    @property
+    def schedule(self):
+        return JobSchedule.from_masks(self.schedule_days, self.schedule_hours, self.schedule_minutes)
+
+
+# Só as colunas lidas pelo catálogo; o modelo completo fica em backend.JobHE (Flask-SQLAlchemy)
+jobs_he = table('jobs_he', *(column(field) for field in JobRecord._fields))
+
+
+def load_job_catalog(bind, job_id=None, active_only=False):
+    """
+    Carrega os jobs com as agendas já incluídas: as máscaras ficam nas colunas schedule_* de
+    jobs_he, então é uma única consulta, independente da quantidade de jobs e de horários.
+    `bind` é uma Session ou Connection do SQLAlchemy; não depende do Flask.
+    Retorna uma lista de JobRecord ordenada pelo nome do job.
+    """
+    query = select(jobs_he)
+    if active_only:
+        query = query.where(jobs_he.c.job_status == 'Y')
+    if job_id is not None:
+        query = query.where(jobs_he.c.job_id == job_id)
+    return [JobRecord(*row) for row in bind.execute(query.order_by(jobs_he.c.job_name))]
@@ -0,0 +1,221 @@
+import bisect
+import itertools
+import threading
+import time
+
+# --- Import Logging ---
+from logging_config import get_logger, log_info, log_warning, log_exception, log_debug
+logger = get_logger('executor')
+# --- End Logging Import ---
+
+
+# O que fazer quando um job é submetido enquanto a execução anterior ainda está na fila ou rodando
+OVERLAP_POLICIES = ('skip', 'queue', 'cancel')
+DEFAULT_OVERLAP = 'skip'
+
+
+class JobExecutor:
+    """
+    Executor de jobs com fila por prioridade.
+
+    - Os jobs saem da fila por `priority` (maior primeiro) e, em empate, por ordem de chegada.
+    - Cada schema Oracle aceita no máximo `max_schema_weight` de peso rodando ao mesmo tempo
+      (um job mais pesado que o limite ainda roda, mas sozinho no schema).
+    - Jobs pesados nunca ocupam os `reserved_workers` workers reservados, então um extract
+      longo não bloqueia as exportações curtas. É pesado o job com weight > 1 e também o job
+      cuja última execução levou `heavy_seconds` ou mais (0 desativa). A duração fica só em
+      memória: até a primeira execução terminar, um job com weight 1 conta como leve.
+    - Um job nunca roda duas vezes ao mesmo tempo. Se ele já está na fila ou rodando, a nova
+      submissão segue o `overlap` (OVERLAP_POLICIES): 'skip' descarta a nova execução, 'queue'
+      deixa uma execução esperando a atual terminar e 'cancel' também, mas pede o cancelamento
+      da atual (`on_cancel(job_data)`). Mais de uma execução esperando nunca se acumula.
+      O pedido de cancelamento (`cancel_requested(job_id)`) vale só para a execução que estava
+      rodando: é registrado e limpo sob o mesmo lock que marca o fim dela, então nunca sobra
+      para a execução seguinte.
+    """
+
+    def __init__(self, max_workers=5, reserved_workers=1, max_schema_weight=3, heavy_seconds=300, on_cancel=None):
+        self.max_workers = max(1, int(max_workers))
+        self.reserved_workers = min(max(0, int(reserved_workers)), self.max_workers - 1)
+        self.max_schema_weight = max(1, int(max_schema_weight))
+        self.heavy_seconds = max(0, float(heavy_seconds or 0))
+        self.on_cancel = on_cancel
+
+        self._queue = []        # lista ordenada de (-priority, seq, item)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._schema_weight = {}
+        self._heavy_running = 0
+        self._running = 0
+        self._shutdown = False
+        self._timers = {}       # re-submissões agendadas (submit_after): timer -> on_dropped
+        self._queued_jobs = set()
+        self._running_jobs = set()
+        self._cancel_requested = set()  # jobs cuja execução atual deve ser interrompida
+        self._last_duration = {}        # job_id -> segundos da última execução
+
+        self._workers = []
+        for i in range(self.max_workers):
+            t = threading.Thread(target=self._worker, name=f'job-worker-{i}', daemon=True)
+            t.start()
+            self._workers.append(t)
+
+        log_info(logger, f"Job executor started: {self.max_workers} workers ({self.reserved_workers} reserved for light jobs), max schema weight {self.max_schema_weight}.")
+
+    @property
+    def queue_depth(self):
+        with self._cond:
+            return len(self._queue)
+
+    @property
+    def running(self):
+        with self._cond:
+            return self._running
+
+    def submit(self, func, job_data, priority=0, weight=1, schema=None, overlap=DEFAULT_OVERLAP):
+        """
+        Coloca `func(job_data)` na fila. Retorna False se o executor já foi encerrado ou se a
+        execução foi descartada pela política de sobreposição.
+        """
+        job_id = job_data.job_id
+        overlap = overlap if overlap in OVERLAP_POLICIES else DEFAULT_OVERLAP
+        item = {
+            'func': func,
+            'job_data': job_data,
+            'priority': int(priority or 0),
+            'weight': max(1, int(weight or 1)),
+            'schema': (schema or '').upper(),
+            'queued_at': time.time()
+        }
+        with self._cond:
+            if self._shutdown:
+                log_warning(logger, f"Executor is shut down. Job '{job_data.job_name}' was not queued.", job_id=job_data.job_id)
+                return False
+            queued = job_id in self._queued_jobs
+            running = job_id in self._running_jobs
+            if queued or (running and overlap == 'skip'):
+                state = 'queued' if queued else 'running'
+                log_info(logger, f"Job '{job_data.job_name}' is already {state}. New run skipped (overlap policy '{overlap}').", job_id=job_id)
+                return False
+            self._queued_jobs.add(job_id)
+            bisect.insort(self._queue, (-item['priority'], next(self._seq), item))
+            if running and overlap == 'cancel':
+                self._cancel_requested.add(job_id)
+            self._cond.notify_all()
+
+        if running:
+            log_info(logger, f"Job '{job_data.job_name}' is still running. New run queued behind it (overlap policy '{overlap}').", job_id=job_id)
+            if overlap == 'cancel' and self.on_cancel:
+                self.on_cancel(job_data)
+        return True
+
+    def cancel_requested(self, job_id):
+        """True se a execução do job que está rodando agora teve o cancelamento pedido."""
+        with self._cond:
+            return job_id in self._cancel_requested
+
+    def submit_after(self, delay, func, job_data, priority=0, weight=1, schema=None, overlap=DEFAULT_OVERLAP,
+                     on_dropped=None):
+        """
+        Coloca o job na fila daqui a `delay` segundos (re-tentativas com backoff).
+        `on_dropped()` é chamado uma vez se, na hora, a execução não entrar na fila (política de
+        sobreposição ou executor encerrado, inclusive re-tentativas descartadas no shutdown).
+        """
+        def fire():
+            with self._cond:
+                if timer not in self._timers:
+                    return  # descartada pelo shutdown, que já chamou on_dropped
+                del self._timers[timer]
+            submitted = self.submit(func, job_data, priority=priority, weight=weight, schema=schema, overlap=overlap)
+            if not submitted and on_dropped:
+                on_dropped()
+
+        timer = threading.Timer(delay, fire)
+        timer.daemon = True
+        with self._cond:
+            if self._shutdown:
+                return False
+            self._timers[timer] = on_dropped
+        timer.start()
+        return True
+
+    def shutdown(self, wait=True):
+        """Para de aceitar jobs; com wait=True espera a fila esvaziar e os workers terminarem."""
+        with self._cond:
+            self._shutdown = True
+            # re-tentativas ainda não disparadas são descartadas
+            dropped = [on_dropped for on_dropped in self._timers.values() if on_dropped]
+            for timer in self._timers:
+                timer.cancel()
+            self._timers.clear()
+            if not wait:
+                self._queue.clear()
+                self._queued_jobs.clear()
+            self._cond.notify_all()
+        for on_dropped in dropped:
+            on_dropped()
+        if wait:
+            for t in self._workers:
+                t.join()
+
+    def _is_heavy(self, item):
+        if item['weight'] > 1:
+            return True
+        last_duration = self._last_duration.get(item['job_data'].job_id)
+        return bool(self.heavy_seconds) and last_duration is not None and last_duration >= self.heavy_seconds
+
+    def _can_run(self, item):
+        if item['job_data'].job_id in self._running_jobs:
+            return False  # espera a execução anterior do mesmo job terminar
+        weight = item['weight']
+        if self._is_heavy(item) and self._heavy_running >= self.max_workers - self.reserved_workers:
+            return False
+        running_weight = self._schema_weight.get(item['schema'], 0)
+        # Um job mais pesado que o limite roda, desde que sozinho no schema
+        return running_weight == 0 or running_weight + weight <= self.max_schema_weight
+
+    def _next_item(self):
+        # Chamado com o lock adquirido: pega o job de maior prioridade que pode rodar agora
+        for index, (_, _, item) in enumerate(self._queue):
+            if self._can_run(item):
+                del self._queue[index]
+                return item
+        return None
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                item = self._next_item()
+                while item is None:
+                    if self._shutdown and not self._queue:
+                        return
+                    self._cond.wait()
+                    item = self._next_item()
+
+                self._running += 1
+                job_id = item['job_data'].job_id
+                self._running_jobs.add(job_id)
+                self._queued_jobs.discard(job_id)
+                self._schema_weight[item['schema']] = self._schema_weight.get(item['schema'], 0) + item['weight']
+                item['heavy'] = self._is_heavy(item)
+                if item['heavy']:
+                    self._heavy_running += 1
+
+            job_data = item['job_data']
+            wait_ms = int((time.time() - item['queued_at']) * 1000)
+            log_debug(logger, f"Job '{job_data.job_name}' left the queue after {wait_ms} ms (priority {item['priority']}, weight {item['weight']}, {'heavy' if item['heavy'] else 'light'}, schema {item['schema'] or '-'}).", job_id=job_data.job_id)
+            start_time = time.time()
+            try:
+                item['func'](job_data)
+            except Exception as e:
+                log_exception(logger, f"Unhandled error running job '{job_data.job_name}': {e}", job_id=job_data.job_id)
+            finally:
+                with self._cond:
+                    self._running -= 1
+                    self._running_jobs.discard(job_data.job_id)
+                    self._cancel_requested.discard(job_data.job_id)
+                    self._schema_weight[item['schema']] -= item['weight']
+                    self._last_duration[job_data.job_id] = time.time() - start_time
+                    if item['heavy']:
+                        self._heavy_running -= 1
+                    self._cond.notify_all()
@@ -0,0 +1,247 @@
+"""
+##----------------------------------------
+Leases de execução dos jobs (tabela job_leases): vários agendadores na mesma base
+##----------------------------------------
+"""
+import collections
+import threading
+
+from sqlalchemy import text
+
+import metrics
+
+# --- Import Logging ---
+from logging_config import get_logger, log_info, log_warning, log_error, log_exception, log_debug
+logger = get_logger('job_leases')
+# --- End Logging Import ---
+
+lease_claims = metrics.counter('job_lease_claims_total', 'Scheduled runs offered to this node, by claim result.', ['result'])
+lease_takeovers = metrics.counter('job_lease_takeovers_total', 'Expired leases of other nodes taken over by this node.')
+
+# Linhas novas só para jobs que ainda existem (a FK recusaria jobs apagados no meio do caminho)
+ENSURE_ROWS_SQL = text("""
+    INSERT INTO job_leases (job_id)
+    SELECT job_id FROM jobs_he WHERE job_id = ANY(CAST(:job_ids AS INTEGER[]))
+    ON CONFLICT (job_id) DO NOTHING
+""")
+
+# Um disparo (job_id, horário agendado) só é assumido se o lease está livre, vencido ou já é deste
+# nó, e se o horário ainda não foi assumido por ninguém. Linhas bloqueadas por outro nó são puladas.
+CLAIM_SQL = text("""
+    WITH due AS (
+        SELECT l.job_id, f.fire
+          FROM job_leases AS l
+          JOIN unnest(CAST(:job_ids AS INTEGER[]), CAST(:fires AS TIMESTAMP[])) AS f(job_id, fire)
+            ON f.job_id = l.job_id
+         WHERE (l.owner IS NULL OR l.owner = :node_id OR l.lease_until < LOCALTIMESTAMP)
+           AND (l.last_fire IS NULL OR l.last_fire < f.fire)
+           FOR UPDATE OF l SKIP LOCKED
+    )
+    UPDATE job_leases AS l
+       SET owner = :node_id,
+           lease_until = LOCALTIMESTAMP + :lease_seconds * INTERVAL '1 second',
+           last_fire = due.fire,
+           claimed_at = LOCALTIMESTAMP
+      FROM due
+     WHERE l.job_id = due.job_id
+    RETURNING l.job_id, l.last_fire
+""")
+
+HEARTBEAT_SQL = text("""
+    UPDATE job_leases
+       SET lease_until = LOCALTIMESTAMP + :lease_seconds * INTERVAL '1 second'
+     WHERE owner = :node_id AND job_id = ANY(CAST(:job_ids AS INTEGER[]))
+    RETURNING job_id
+""")
+
+TAKEOVER_SQL = text("""
+    WITH expired AS (
+        SELECT job_id, owner
+          FROM job_leases
+         WHERE owner IS NOT NULL AND owner <> :node_id AND lease_until < LOCALTIMESTAMP
+         ORDER BY lease_until
+         LIMIT :limit
+           FOR UPDATE SKIP LOCKED
+    )
+    UPDATE job_leases AS l
+       SET owner = :node_id,
+           lease_until = LOCALTIMESTAMP + :lease_seconds * INTERVAL '1 second',
+           claimed_at = LOCALTIMESTAMP,
+           takeovers = l.takeovers + 1
+      FROM expired
+     WHERE l.job_id = expired.job_id
+    RETURNING l.job_id, expired.owner, l.last_fire
+""")
+
+# Só libera se o job não foi assumido de novo (disparo mais novo) depois da execução que terminou
+RELEASE_SQL = text("""
+    UPDATE job_leases AS l
+       SET owner = NULL, lease_until = NULL
+      FROM unnest(CAST(:job_ids AS INTEGER[]), CAST(:fires AS TIMESTAMP[])) AS r(job_id, fire)
+     WHERE l.job_id = r.job_id AND l.owner = :node_id AND l.last_fire IS NOT DISTINCT FROM r.fire
+""")
+
+
+class JobLeases:
+    """
+    Divide os disparos dos jobs entre vários agendadores que usam a mesma base PostgreSQL.
+
+    - Todos os nós montam a mesma agenda; quando um horário chega, cada nó tenta assumir o disparo
+      (job_id, horário agendado) na linha do job em job_leases com SELECT ... FOR UPDATE SKIP LOCKED.
+      Só um nó grava o horário em last_fire e executa o job; os outros pulam a linha sem esperar.
+    - Enquanto o job está na fila ou rodando, o dono renova o lease a cada `heartbeat_seconds`.
+      Um lease não renovado em `lease_seconds` (nó parado ou sem acesso à base) é assumido por
+      outro nó, que executa o job de novo (`on_takeover(job_ids)`).
+    - Se a liberação falhar quando a execução termina, o lease continua sendo renovado e a
+      liberação é tentada de novo a cada heartbeat, para outro nó não repetir um job que já rodou.
+    - Um nó pode assumir de novo um job cujo lease já é dele; a sobreposição local segue a
+      overlap_policy do job. Entre nós diferentes, um job rodando faz o novo disparo ser pulado.
+    """
+
+    def __init__(self, engine, node_id, lease_seconds=60, heartbeat_seconds=15, takeover_limit=5, on_takeover=None):
+        self.engine = engine
+        self.node_id = node_id
+        self.lease_seconds = lease_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.takeover_limit = takeover_limit
+        self.on_takeover = on_takeover
+        self._held = collections.Counter()  # job_id -> execuções deste nó ainda não liberadas
+        self._fires = {}                    # job_id -> último disparo assumido (last_fire do lease)
+        self._unreleased = {}               # job_id -> disparo: execuções terminadas à espera da liberação
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def held(self):
+        """Quantidade de jobs com lease deste nó."""
+        return len(self._held)
+
+    def claim(self, fires):
+        """
+        Tenta assumir os disparos `fires` ([(job_id, horário agendado), ...]) numa única transação.
+        Retorna o conjunto de job_id assumidos por este nó.
+        """
+        fires = list(fires)
+        if not fires:
+            return set()
+        job_ids = [job_id for job_id, _ in fires]
+        params = {'job_ids': job_ids, 'fires': [fire for _, fire in fires],
+                  'node_id': self.node_id, 'lease_seconds': self.lease_seconds}
+        with self.engine.begin() as connection:
+            connection.execute(ENSURE_ROWS_SQL, {'job_ids': job_ids})
+            rows = connection.execute(CLAIM_SQL, params).all()
+        self._hold(rows)
+        claimed = {row.job_id for row in rows}
+        lease_claims.inc(len(claimed), result='claimed')
+        lease_claims.inc(len(fires) - len(claimed), result='skipped')
+        log_debug(logger, f"Node {self.node_id} claimed {len(claimed)} of {len(fires)} due runs.")
+        return claimed
+
+    def _hold(self, rows):
+        """Registra os leases assumidos (linhas com job_id e last_fire)."""
+        with self._lock:
+            for row in rows:
+                self._held[row.job_id] += 1
+                self._fires[row.job_id] = row.last_fire
+                self._unreleased.pop(row.job_id, None)  # assumido de novo: a liberação antiga não vale mais
+
+    def retain(self, job_id):
+        """
+        Mais uma execução deste nó passa a usar um lease que ele já tem (ex.: nova tentativa do job),
+        sem ir à base; cada retain pede um release. Retorna False se o lease não é deste nó.
+        """
+        with self._lock:
+            if job_id not in self._held:
+                return False
+            self._held[job_id] += 1
+            return True
+
+    def release(self, job_id):
+        """Libera o lease quando a última execução do job neste nó termina."""
+        with self._lock:
+            self._held[job_id] -= 1
+            if self._held[job_id] > 0:
+                return
+            del self._held[job_id]
+            self._unreleased[job_id] = self._fires.pop(job_id, None)
+        self.release_pending()
+
+    def release_pending(self):
+        """
+        Libera os leases das execuções que já terminaram. Os que falharem continuam na lista (e sendo
+        renovados pelo heartbeat) até a próxima tentativa. Retorna False se a liberação falhou.
+        """
+        with self._lock:
+            pending = dict(self._unreleased)
+        if not pending:
+            return True
+        try:
+            with self.engine.begin() as connection:
+                connection.execute(RELEASE_SQL, {'job_ids': list(pending), 'fires': list(pending.values()),
+                                                 'node_id': self.node_id})
+        except Exception as e:
+            log_exception(logger, f"Could not release the leases of jobs {sorted(pending)}: {e}. Retrying on the next heartbeat.")
+            return False
+        with self._lock:
+            for job_id, fire in pending.items():
+                if self._unreleased.get(job_id, fire) == fire:
+                    self._unreleased.pop(job_id, None)
+        return True
+
+    def heartbeat(self):
+        """Renova os leases deste nó (inclusive os que esperam liberação); avisa sobre os que outro nó já assumiu."""
+        self.release_pending()
+        with self._lock:
+            held = set(self._held) | set(self._unreleased)
+        if not held:
+            return
+        with self.engine.begin() as connection:
+            renewed = {row.job_id for row in connection.execute(
+                HEARTBEAT_SQL, {'job_ids': list(held), 'node_id': self.node_id, 'lease_seconds': self.lease_seconds})}
+        for job_id in held - renewed:
+            log_warning(logger, f"Lease of job {job_id} was taken over by another node. The run on {self.node_id} is now a duplicate.", job_id=job_id)
+
+    def take_over_expired(self):
+        """Assume até `takeover_limit` leases vencidos de outros nós; retorna os job_id assumidos."""
+        with self.engine.begin() as connection:
+            rows = connection.execute(TAKEOVER_SQL, {'node_id': self.node_id, 'lease_seconds': self.lease_seconds,
+                                                     'limit': self.takeover_limit}).all()
+        self._hold(rows)
+        for row in rows:
+            lease_takeovers.inc()
+            log_warning(logger, f"Node {self.node_id} took over job {row.job_id} from node {row.owner} (lease expired).", job_id=row.job_id)
+        return [row.job_id for row in rows]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='job-leases', daemon=True)
+        self._thread.start()
+        log_info(logger, f"Distributed mode: node {self.node_id}, lease {self.lease_seconds} s, heartbeat {self.heartbeat_seconds} s.")
+
+    def stop(self):
+        """
+        Para o heartbeat e libera todos os leases deste nó (execuções interrompidas voltam a ficar livres).
+        Nunca levanta exceção: sem acesso à base os leases vencem em `lease_seconds`.
+        """
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.heartbeat_seconds)
+        with self._lock:
+            for job_id in self._held:
+                self._unreleased[job_id] = self._fires.pop(job_id, None)
+            self._held.clear()
+            count = len(self._unreleased)
+        if count and self.release_pending():
+            log_info(logger, f"Node {self.node_id} released {count} leases on shutdown.")
+        elif count:
+            log_warning(logger, f"Node {self.node_id} could not release {count} leases on shutdown. They expire in {self.lease_seconds} s.")
+
+    def _run(self):
+        while not self._stop.wait(self.heartbeat_seconds):
+            try:
+                self.heartbeat()
+                taken = self.take_over_expired()
+                if taken and self.on_takeover:
+                    self.on_takeover(taken)
+            except Exception as e:
+                log_exception(logger, f"Lease heartbeat failed on node {self.node_id}: {e}")
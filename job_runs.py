@@ -0,0 +1,81 @@
+"""
+##----------------------------------------
+Histórico de execuções dos jobs (tabela job_runs)
+##----------------------------------------
+"""
+import atexit
+import contextlib
+import datetime
+import threading
+import time
+
+import metrics
+from backend import JobRun
+from logging_config import BatchWriter, engine, LOGGING_PARAMETERS, DB_BATCH_SIZE, DB_FLUSH_INTERVAL_S, DB_QUEUE_SIZE
+
+RUN_PHASES = ('connect', 'execute', 'fetch', 'serialize')
+ERROR_TEXT_MAX_LEN = 4000
+
+# Mesmo gravador em lote dos logs, mas com a fila cheia o job espera por espaço em vez de
+# descartar: o histórico alimenta a recuperação de horários perdidos, então uma linha perdida pode
+# fazer o job rodar de novo. Só depois de block_timeout a linha é descartada (e contada).
+run_writer = BatchWriter(
+    'job_runs', JobRun.__table__, engine,
+    batch_size=LOGGING_PARAMETERS.get('db_batch_size', DB_BATCH_SIZE),
+    flush_interval=LOGGING_PARAMETERS.get('db_flush_interval_s', DB_FLUSH_INTERVAL_S),
+    max_queue=LOGGING_PARAMETERS.get('db_queue_size', DB_QUEUE_SIZE),
+    overflow='block',
+)
+atexit.register(run_writer.close)
+
+runs_total = metrics.counter('job_runs_total', 'Job executions by final status.', ['status'])
+run_duration = metrics.histogram('job_run_duration_seconds', 'Total duration of job executions.', ['status'])
+phase_seconds = metrics.counter('job_phase_seconds_total', 'Seconds spent in each execution phase.', ['phase'])
+
+
+class RunTimings:
+    """
+    Tempo acumulado por fase (RUN_PHASES) de uma execução de job.
+    Na extração dividida as sessões paralelas somam nas mesmas fases, então a soma pode passar da duração total.
+    """
+
+    def __init__(self):
+        self.seconds = dict.fromkeys(RUN_PHASES, 0.0)
+        self._lock = threading.Lock()
+
+    def add(self, phase, seconds):
+        with self._lock:
+            self.seconds[phase] += seconds
+
+    @contextlib.contextmanager
+    def phase(self, phase):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(phase, time.perf_counter() - start)
+
+    def as_columns(self):
+        return {f'{phase}_ms': int(seconds * 1000) for phase, seconds in self.seconds.items()}
+
+
+def record_run(job_id, started_at, status, timings, attempt=0, rows_exported=None, bytes_written=None, error_text=None):
+    """Enfileira o registro de uma execução em job_runs (gravado em lote pelo run_writer)."""
+    finished_at = datetime.datetime.now()
+    duration = (finished_at - started_at).total_seconds()
+    runs_total.inc(status=status)
+    run_duration.observe(duration, status=status)
+    for phase, seconds in timings.seconds.items():
+        phase_seconds.inc(seconds, phase=phase)
+    run_writer.write({
+        'job_id': job_id,
+        'started_at': started_at,
+        'finished_at': finished_at,
+        'status': status,
+        'attempt': attempt,
+        'rows_exported': rows_exported,
+        'bytes_written': bytes_written,
+        'duration_ms': int(duration * 1000),
+        **timings.as_columns(),
+        'error_text': error_text[:ERROR_TEXT_MAX_LEN] if error_text else None,
+    })
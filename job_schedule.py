@@ -0,0 +1,241 @@
+"""
+##----------------------------------------
+Agenda dos jobs: máscaras de bits no estilo cron e fila de disparos em min-heap
+##----------------------------------------
+"""
+import datetime
+import heapq
+import itertools
+from typing import NamedTuple
+
+# abreviações PT dos dias da agenda, na ordem de datetime.weekday() (segunda = 0)
+DAY_KEYS = ('Seg', 'Ter', 'Qua', 'Qui', 'Sex', 'Sáb', 'Dom')
+DAY_INDEX = {day_key: index for index, day_key in enumerate(DAY_KEYS)}
+
+def lowest_bit_from(mask, start):
+    """Menor posição >= start com o bit ligado em `mask`, ou None."""
+    mask >>= start
+    if not mask:
+        return None
+    return start + (mask & -mask).bit_length() - 1
+
+
+def highest_bit_upto(mask, end):
+    """Maior posição <= end com o bit ligado em `mask`, ou None."""
+    mask &= (2 << end) - 1
+    return mask.bit_length() - 1 if mask else None
+
+
+def bit_positions(mask):
+    """Posições com o bit ligado em `mask`, em ordem crescente."""
+    position = lowest_bit_from(mask, 0)
+    while position is not None:
+        yield position
+        position = lowest_bit_from(mask, position + 1)
+
+
+def mask_from_numbers(values, size):
+    """Máscara com os bits dos números em `values` (ex.: ['08', '14']); ValueError fora de 0..size-1."""
+    mask = 0
+    for value in values:
+        number = int(value)
+        if not 0 <= number < size:
+            raise ValueError(f"Invalid schedule value {value!r} (expected 0 to {size - 1})")
+        mask |= 1 << number
+    return mask
+
+
+class CronMask(NamedTuple):
+    """
+    Um horário no estilo cron: dispara em todo (dia, hora, minuto) do produto das três máscaras.
+    Bit i de `days` = datetime.weekday() i; de `hours` = hora i; de `minutes` = minuto i.
+    """
+    days: int
+    hours: int
+    minutes: int
+
+    @classmethod
+    def from_fields(cls, days, hours, minutes):
+        """
+        Máscara a partir das listas da tela de jobs, ex.: (['Seg', 'Qua'], ['08'], ['00', '30']).
+        Levanta ValueError para dia, hora ou minuto inválido.
+        """
+        day_mask = 0
+        for day_key in days:
+            if day_key not in DAY_INDEX:
+                raise ValueError(f"Invalid schedule day {day_key!r}")
+            day_mask |= 1 << DAY_INDEX[day_key]
+        return cls(day_mask, mask_from_numbers(hours, 24), mask_from_numbers(minutes, 60))
+
+    def day_keys(self):
+        return [DAY_KEYS[day] for day in bit_positions(self.days)]
+
+    def hour_values(self):
+        return [f'{hour:02d}' for hour in bit_positions(self.hours)]
+
+    def minute_values(self):
+        return [f'{minute:02d}' for minute in bit_positions(self.minutes)]
+
+    def rows(self):
+        """Agenda expandida no formato de jobs_de: (dia, 'HH', 'MM') para cada horário."""
+        hours, minutes = self.hour_values(), self.minute_values()
+        return [(day_key, hour, minute) for day_key in self.day_keys() for hour in hours for minute in minutes]
+
+    def next_after(self, moment):
+        """Primeiro disparo estritamente depois de `moment` (resolução de minuto)."""
+        start = moment.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+        for offset in range(8):
+            day = start + datetime.timedelta(days=offset)
+            if not self.days >> day.weekday() & 1:
+                continue
+            hour = minute = None
+            if offset == 0:
+                hour = lowest_bit_from(self.hours, start.hour)
+                if hour == start.hour:
+                    minute = lowest_bit_from(self.minutes, start.minute)
+                    if minute is None:
+                        hour = lowest_bit_from(self.hours, start.hour + 1)
+            else:
+                hour = lowest_bit_from(self.hours, 0)
+            if hour is None:
+                continue
+            if minute is None:
+                minute = lowest_bit_from(self.minutes, 0)
+            return day.replace(hour=hour, minute=minute)
+        return None
+
+    def previous_at(self, moment):
+        """Último disparo em ou antes de `moment` (resolução de minuto)."""
+        end = moment.replace(second=0, microsecond=0)
+        for offset in range(8):
+            day = end - datetime.timedelta(days=offset)
+            if not self.days >> day.weekday() & 1:
+                continue
+            hour = minute = None
+            if offset == 0:
+                hour = highest_bit_upto(self.hours, end.hour)
+                if hour == end.hour:
+                    minute = highest_bit_upto(self.minutes, end.minute)
+                    if minute is None:
+                        hour = highest_bit_upto(self.hours, end.hour - 1) if end.hour else None
+            else:
+                hour = highest_bit_upto(self.hours, 23)
+            if hour is None:
+                continue
+            if minute is None:
+                minute = highest_bit_upto(self.minutes, 59)
+            return day.replace(hour=hour, minute=minute)
+        return None
+
+    @property
+    def slots(self):
+        """Quantidade de (dia, hora, minuto) cobertos por semana."""
+        return bin(self.days).count('1') * bin(self.hours).count('1') * bin(self.minutes).count('1')
+
+
+class JobSchedule(NamedTuple):
+    """Agenda semanal de um job: a CronMask das colunas schedule_* de jobs_he, ou nenhuma se estiver vazia."""
+    entries: tuple
+
+    @classmethod
+    def from_masks(cls, days, hours, minutes):
+        """Agenda de uma única máscara (colunas schedule_* de jobs_he); vazia se algum campo não tiver bits."""
+        mask = CronMask(days or 0, hours or 0, minutes or 0)
+        return cls((mask,) if mask.slots else ())
+
+    def next_after(self, moment):
+        fires = [fire for fire in (entry.next_after(moment) for entry in self.entries) if fire is not None]
+        return min(fires) if fires else None
+
+    def previous_at(self, moment):
+        fires = [fire for fire in (entry.previous_at(moment) for entry in self.entries) if fire is not None]
+        return max(fires) if fires else None
+
+    @property
+    def slots(self):
+        return sum(entry.slots for entry in self.entries)
+
+
+class ScheduleQueue:
+    """
+    Próximo disparo de cada job em um min-heap: uma entrada por job (não uma por horário da
+    agenda), então a memória cresce só com a quantidade de jobs e cada disparo custa O(log n).
+    Entradas de jobs removidos ou reagendados ficam no heap e são descartadas ao chegar ao topo
+    (ou numa compactação, quando passam a ser maioria).
+    Não é thread-safe: só o run_loop do agendador mexe na fila.
+    """
+
+    def __init__(self):
+        self._heap = []   # (próximo disparo, seq, job_id)
+        self._jobs = {}   # job_id -> (agenda, payload, seq da entrada válida no heap)
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def add(self, job_id, schedule, payload, now=None):
+        """(Re)agenda o job; retorna o próximo disparo, ou None se a agenda estiver vazia."""
+        fire = schedule.next_after(now or datetime.datetime.now())
+        if fire is None:
+            self.remove(job_id)
+            return None
+        self._push(job_id, schedule, payload, fire)
+        self._compact()
+        return fire
+
+    def remove(self, job_id):
+        self._jobs.pop(job_id, None)
+        self._compact()
+
+    def clear(self):
+        self._heap.clear()
+        self._jobs.clear()
+
+    def pop_due(self, now=None):
+        """
+        Pares (horário agendado, payload) dos jobs cujo disparo já chegou, cada um reagendado para o
+        próximo horário depois de `now` (um atraso do loop não gera disparos acumulados do mesmo job).
+        """
+        now = now or datetime.datetime.now()
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            item = heapq.heappop(self._heap)
+            if not self._is_current(item):
+                continue
+            fire, _, job_id = item
+            schedule, payload, _ = self._jobs[job_id]
+            due.append((fire, payload))
+            fire = schedule.next_after(now)
+            if fire is None:
+                del self._jobs[job_id]
+            else:
+                self._push(job_id, schedule, payload, fire)
+        return due
+
+    @property
+    def next_run(self):
+        """Horário do próximo disparo, ou None se não há jobs agendados."""
+        while self._heap and not self._is_current(self._heap[0]):
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def idle_seconds(self, now=None):
+        """Segundos até o próximo disparo (negativo se atrasado), ou None se não há jobs agendados."""
+        next_run = self.next_run
+        if next_run is None:
+            return None
+        return (next_run - (now or datetime.datetime.now())).total_seconds()
+
+    def _push(self, job_id, schedule, payload, fire):
+        seq = next(self._seq)
+        self._jobs[job_id] = (schedule, payload, seq)
+        heapq.heappush(self._heap, (fire, seq, job_id))
+
+    def _compact(self):
+        if len(self._heap) > 2 * len(self._jobs) + 64:
+            self._heap = [item for item in self._heap if self._is_current(item)]
+            heapq.heapify(self._heap)
+
+    def _is_current(self, item):
+        entry = self._jobs.get(item[2])
+        return entry is not None and entry[2] == item[1]
@@ -1,16 +1,23 @@
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, text, table, column
+from sqlalchemy.exc import IntegrityError
 from urllib.parse import quote_plus
 from sqlalchemy.orm import sessionmaker
+import atexit
 import datetime
 import logging
 import os
-from auxiliares import open_json, get_postgres_engine
+import queue
+import threading
+import time
+from auxiliares import open_json, get_postgres_url
+import metrics
 
 # Parametros principais
 MAIN_PARAMETERS = open_json()
 
-# Configuração do SQLITE3
-engine = get_postgres_engine(MAIN_PARAMETERS['postgres'])
+# Engine dos logs: a conexão só é aberta na primeira gravação, pela thread do BatchWriter,
+# então importar este módulo (ex.: nos testes) não exige o PostgreSQL
+engine = create_engine(get_postgres_url(MAIN_PARAMETERS['postgres']))
 LogSession = sessionmaker(bind=engine)
 
 # --- Standard Logging Setup ---
@@ -28,36 +35,208 @@ logging.basicConfig(
     ]
 )
 
+# --- Asynchronous DB sink ---
+# Defaults for the "logging" section of the parameters file
+DB_BATCH_SIZE = 200
+DB_FLUSH_INTERVAL_S = 1.0
+DB_QUEUE_SIZE = 10000
+DB_OVERFLOW = 'drop_oldest'
+OVERFLOW_POLICIES = ('drop_oldest', 'drop_new', 'block')
+_STOP = object()  # sentinel that tells the writer thread to drain and exit
+BATCH_WRITERS = []  # every BatchWriter of the process, for the metrics below
+
+metrics.gauge('batch_writer_queue_depth', 'Rows waiting in the asynchronous database writers.', ['writer'],
+              function=lambda: {(writer.name,): writer.queue_depth for writer in BATCH_WRITERS})
+metrics.counter('batch_writer_dropped_total', 'Rows dropped because a database writer queue was full.', ['writer'],
+                function=lambda: {(writer.name,): writer.dropped_total for writer in BATCH_WRITERS})
+
+logs_table = table(
+    'logs',
+    column('timestamp'), column('log_level'), column('logger_name'), column('job_id'),
+    column('user_name'), column('log_text'), column('duration_ms'),
+)
+
+
+class BatchWriter:
+    """
+    Bounded queue drained by a background thread that inserts rows in batches.
+
+    Rows are flushed as a single multi-row INSERT when `batch_size` rows are pending or
+    `flush_interval` seconds have passed since the first pending row, whichever comes first.
+    When the queue is full the `overflow` policy decides what happens:
+      - drop_oldest: discard the oldest queued row to make room (default, never blocks callers)
+      - drop_new:    discard the row being written
+      - block:       wait up to `block_timeout` seconds for room, then discard the new row
+    Dropped rows are counted and reported on the console at the next flush.
+    If a batch INSERT fails, its rows are retried one by one so a single bad row (e.g. the
+    job_id of a job deleted in the meantime) only loses itself; see _write_rows.
+    """
+
+    def __init__(self, name, target_table, bind, batch_size=DB_BATCH_SIZE, flush_interval=DB_FLUSH_INTERVAL_S,
+                 max_queue=DB_QUEUE_SIZE, overflow=DB_OVERFLOW, block_timeout=5.0):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Invalid overflow policy '{overflow}', expected one of {OVERFLOW_POLICIES}")
+        self.name = name
+        self.insert = target_table.insert()
+        self.bind = bind
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = float(flush_interval)
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.dropped = 0
+        self.dropped_total = 0
+        self._queue = queue.Queue(maxsize=max(1, int(max_queue)))
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        BATCH_WRITERS.append(self)
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None and not self._stop.is_set():
+                self._thread = threading.Thread(target=self._run, name=f'{self.name}-writer', daemon=True)
+                self._thread.start()
+
+    def write(self, row):
+        """Queues one row (a dict keyed by column name). Never raises."""
+        if self._stop.is_set():
+            # after shutdown there is no writer thread: write synchronously so nothing is lost
+            self._write_batch([row])
+            return
+        self._ensure_started()
+        try:
+            if self.overflow == 'block':
+                self._queue.put(row, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(row)
+            return
+        except queue.Full:
+            pass
+        if self.overflow == 'drop_oldest':
+            try:
+                if self._queue.get_nowait() is _STOP:
+                    # close() ran after the check above and the sentinel is the oldest item: it must
+                    # not be evicted or the writer thread never exits. Put it back (the thread is
+                    # draining the queue, so room shows up) and write this row synchronously.
+                    self._queue.put(_STOP, timeout=self.block_timeout)
+                    self._write_batch([row])
+                    return
+                self._queue.put_nowait(row)
+            except (queue.Empty, queue.Full):
+                pass
+        self.dropped += 1
+        self.dropped_total += 1
+
+    def _run(self):
+        batch = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                row = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                row = None
+            if row is _STOP:
+                break
+            if row is not None:
+                batch.append(row)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+            if batch and (len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                self._write_batch(batch)
+                batch, deadline = [], None
+        # shutdown: drain whatever is still queued
+        while True:
+            try:
+                row = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if row is not _STOP:
+                batch.append(row)
+        for i in range(0, len(batch), self.batch_size):
+            self._write_batch(batch[i:i + self.batch_size])
+
+    def _write_batch(self, batch):
+        dropped, self.dropped = self.dropped, 0
+        if dropped:
+            print(f"WARNING: {self.name} queue full, {dropped} rows were dropped ({self.overflow})")
+        try:
+            with self.bind.begin() as connection:
+                connection.execute(self.insert, batch)
+        except Exception as e:
+            # Avoid infinite loops: never log through the DB sink from here
+            print(f"WARNING: Failed to write a batch of {len(batch)} rows to {self.name}, retrying row by row. Error: {getattr(e, 'orig', e)}")
+            self._write_rows(batch)
+
+    def _write_rows(self, rows):
+        """
+        Per-row fallback of a failed batch. A row rejected by a constraint that references a
+        job (job deleted while the row was queued) is retried once with job_id = NULL, as the
+        logs FK would do on delete; tables where job_id is mandatory just lose that row.
+        """
+        failed = 0
+        for row in rows:
+            try:
+                with self.bind.begin() as connection:
+                    connection.execute(self.insert, [row])
+                continue
+            except IntegrityError as e:
+                error = e
+                if row.get('job_id') is not None:
+                    try:
+                        with self.bind.begin() as connection:
+                            connection.execute(self.insert, [{**row, 'job_id': None}])
+                        continue
+                    except Exception as retry_error:
+                        error = retry_error
+            except Exception as e:
+                error = e
+            failed += 1
+            print(f"CRITICAL: Failed to write a row to {self.name} (job_id={row.get('job_id')})! Error: {getattr(error, 'orig', error)}")
+        if failed:
+            print(f"CRITICAL: {failed} of {len(rows)} rows could not be written to {self.name}.")
+
+    def close(self, timeout=10):
+        """Stops the writer thread after flushing everything already queued."""
+        self._stop.set()
+        thread = self._thread
+        if thread is None:
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            pass
+        thread.join(timeout)
+
+
+LOGGING_PARAMETERS = MAIN_PARAMETERS.get('logging', {})
+db_log_writer = BatchWriter(
+    'logs', logs_table, engine,
+    batch_size=LOGGING_PARAMETERS.get('db_batch_size', DB_BATCH_SIZE),
+    flush_interval=LOGGING_PARAMETERS.get('db_flush_interval_s', DB_FLUSH_INTERVAL_S),
+    max_queue=LOGGING_PARAMETERS.get('db_queue_size', DB_QUEUE_SIZE),
+    overflow=LOGGING_PARAMETERS.get('db_overflow', DB_OVERFLOW),
+)
+atexit.register(db_log_writer.close)
+
+
 def log_to_db(level: str, logger_name: str, message: str, job_id: int = None, user_name: str = None, duration_ms: int = None):
-    """Writes a log entry to the SQLite database."""
-    if not LogSession:
-        print(f"DB Logging Error (no session): {level} - {logger_name} - {message}")
-        return
-
-    session = LogSession()
-    try:
-        # Use text() for raw SQL and parameter binding
-        stmt = text("""
-            INSERT INTO logs (timestamp, log_level, logger_name, job_id, user_name, log_text, duration_ms)
-            VALUES (:ts, :lvl, :ln, :jid, :un, :txt, :dur)
-        """)
-        session.execute(stmt, {
-            "ts": datetime.datetime.now(),
-            "lvl": level,
-            "ln": logger_name,
-            "jid": job_id,
-            "un": user_name,
-            "txt": message,
-            "dur": duration_ms
-        })
-        session.commit()
-    except Exception as e:
-        session.rollback()
-        # Avoid infinite loops if logging the error itself fails
-        print(f"CRITICAL: Failed to write log to database! Error: {e}")
-        print(f"Original log message: {level} - {logger_name} - {message}")
-    finally:
-        session.close()
+    """Queues a log entry for the database; the background writer inserts it in batches."""
+    db_log_writer.write({
+        "timestamp": datetime.datetime.now(),
+        "log_level": level,
+        "logger_name": logger_name,
+        "job_id": job_id,
+        "user_name": user_name,
+        "log_text": message,
+        "duration_ms": duration_ms
+    })
 
 def get_logger(name: str):
     """Gets a logger instance."""
@@ -0,0 +1,204 @@
+"""
+##----------------------------------------
+Métricas em memória expostas no formato texto do Prometheus (/metrics)
+##----------------------------------------
+"""
+import bisect
+import hmac
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+METRICS_PATH = '/metrics'
+
+# Limites (segundos) dos buckets de histograma: de requisições rápidas da API a extrações de uma hora
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels_text(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """
+    Base das métricas: valores por combinação de labels (na ordem de `labelnames`), protegidos por um lock.
+    Com `function`, o valor é lido na hora da coleta (ex.: tamanho de uma fila): a função retorna o
+    valor, ou um dict {(valor do label, ...): valor} quando a métrica tem labels.
+    """
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.function = function
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _current(self):
+        if self.function is None:
+            with self._lock:
+                return dict(self._values)
+        value = self.function()
+        return value if self.labelnames else {(): value}
+
+    def collect(self):
+        for key, value in sorted(self._current().items()):
+            yield f'{self.name}{_labels_text(self.labelnames, key)} {_number(value)}'
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    """Contagem por bucket (acumulada só na coleta), soma e quantidade das observações."""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def collect(self):
+        with self._lock:
+            values = {key: (list(counts), total, count) for key, (counts, total, count) in self._values.items()}
+        for key, (counts, total, count) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                yield f'{self.name}_bucket{_labels_text(self.labelnames, key, ("le", _number(bound)))} {cumulative}'
+            yield f'{self.name}_sum{_labels_text(self.labelnames, key)} {_number(total)}'
+            yield f'{self.name}_count{_labels_text(self.labelnames, key)} {count}'
+
+
+class Registry:
+    """Conjunto das métricas de um processo, renderizado no formato texto do Prometheus."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric '{metric.name}' is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=(), function=None):
+        return self.register(Counter(name, documentation, labelnames, function))
+
+    def gauge(self, name, documentation, labelnames=(), function=None):
+        return self.register(Gauge(name, documentation, labelnames, function))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            try:
+                lines.extend(metric.collect())
+            except Exception as error:
+                # uma função de coleta com erro não derruba as demais métricas
+                lines.append(f'# {metric.name} collection failed: {_escape(error)}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+
+
+def token_matches(authorization, token):
+    """True se o header Authorization traz 'Bearer <token>'. Sem token configurado, nunca."""
+    if not token:
+        return False
+    return hmac.compare_digest((authorization or '').encode('utf-8'), f'Bearer {token}'.encode('utf-8'))
+
+
+def start_metrics_server(port, host='', registry=REGISTRY, token=None):
+    """
+    Servidor HTTP mínimo, em uma thread daemon, que responde GET /metrics (para processos sem Flask).
+    Com `token`, só responde a quem enviar 'Authorization: Bearer <token>'.
+    """
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?', 1)[0] != METRICS_PATH:
+                self.send_error(404)
+                return
+            if token and not token_matches(self.headers.get('Authorization'), token):
+                self.send_response(401)
+                self.send_header('WWW-Authenticate', 'Bearer')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            body = registry.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # os scrapes não vão para o log
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    return server
@@ -0,0 +1,93 @@
+import threading
+import time
+
+from auxiliares import is_select_query
+
+# --- Import Logging ---
+from logging_config import get_logger, log_info, log_warning, log_error, log_exception, log_debug
+logger = get_logger('parameter_gate')
+# --- End Logging Import ---
+
+# Valores da primeira coluna que indicam "origem ainda não está pronta"
+NOT_READY_VALUES = (None, 0, '0', '', 'N', 'n')
+
+
+def is_ready_value(value):
+    if isinstance(value, str):
+        value = value.strip()
+    return value not in NOT_READY_VALUES
+
+
+class ParameterGate:
+    """
+    Avalia o SQL de um parâmetro ("a origem já está pronta?") antes dos jobs que dependem dele.
+
+    - O parâmetro está pronto quando a consulta retorna ao menos uma linha e o primeiro valor
+      não é nulo, 0, '0', vazio ou 'N'.
+    - O resultado fica em cache por parâmetro: `ttl_seconds` quando pronto e `fail_ttl_seconds`
+      quando não pronto, então vários jobs com o mesmo parâmetro geram uma única consulta no Oracle.
+    - Se vários jobs pedem o mesmo parâmetro ao mesmo tempo, só um executa a consulta
+      e os demais esperam o resultado (single-flight).
+    """
+
+    def __init__(self, pool, load_sql, ttl_seconds=300, fail_ttl_seconds=60):
+        self.pool = pool
+        self.load_sql = load_sql
+        self.ttl_seconds = ttl_seconds
+        self.fail_ttl_seconds = fail_ttl_seconds
+        self._results = {}      # parameter_id -> (pronto, instante da avaliação)
+        self._locks = {}
+        self._guard = threading.Lock()
+
+    def _cached(self, parameter_id):
+        entry = self._results.get(parameter_id)
+        if entry is None:
+            return None
+        ready, checked_at = entry
+        ttl = self.ttl_seconds if ready else self.fail_ttl_seconds
+        return ready if time.monotonic() - checked_at < ttl else None
+
+    def is_ready(self, parameter_id):
+        ready = self._cached(parameter_id)
+        if ready is not None:
+            return ready
+
+        with self._guard:
+            lock = self._locks.setdefault(parameter_id, threading.Lock())
+        with lock:
+            # outra thread pode ter avaliado enquanto esperávamos
+            ready = self._cached(parameter_id)
+            if ready is None:
+                ready = self._evaluate(parameter_id)
+                self._results[parameter_id] = (ready, time.monotonic())
+            return ready
+
+    def invalidate(self, parameter_id=None):
+        with self._guard:
+            if parameter_id is None:
+                self._results.clear()
+            else:
+                self._results.pop(parameter_id, None)
+
+    def _evaluate(self, parameter_id):
+        start_time = time.time()
+        try:
+            sql = self.load_sql(parameter_id)
+            if not sql:
+                log_error(logger, f"Parameter {parameter_id} not found or has no SQL script. Treating as not ready.")
+                return False
+            if not is_select_query(sql):
+                log_error(logger, f"Parameter {parameter_id}: SQL is not a SELECT query. Treating as not ready.")
+                return False
+
+            with self.pool.acquire() as connection:
+                with connection.cursor() as cursor:
+                    cursor.execute(sql)
+                    row = cursor.fetchone()
+            ready = row is not None and is_ready_value(row[0])
+            duration_ms = int((time.time() - start_time) * 1000)
+            log_info(logger, f"Parameter {parameter_id} evaluated: {'ready' if ready else 'not ready'} (value: {row[0] if row else None}).", duration_ms=duration_ms)
+            return ready
+        except Exception as e:
+            log_exception(logger, f"Error evaluating parameter {parameter_id}: {e}. Treating as not ready.")
+            return False
@@ -1,16 +1,32 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, func
 from sqlalchemy.orm import sessionmaker
-from backend import JobHE, JobDE, Parameter
+from backend import JobHE, JobDE, JobRun, Parameter, JOBS_CHANNEL
+from job_catalog import JobRecord, load_job_catalog
 
 import oracledb
 
-import schedule
-from concurrent.futures import ThreadPoolExecutor
+from job_executor import JobExecutor
+from job_leases import JobLeases
+from job_schedule import ScheduleQueue
+from parameter_gate import ParameterGate
+from job_runs import RunTimings, record_run
+import metrics
+from data_api import build_row_index
+from export_writers import ParquetSidecarWriter, columnar_available, merge_incremental, concat_csv_parts, concat_parquet_parts, CSV_WRITERS
 
-import csv
 
+import contextlib
 import datetime
+import functools
+import re
+from concurrent.futures import ThreadPoolExecutor
 import time
+import json
+import os
+import queue
+import select
+import socket
+import threading
 
 from auxiliares import *
 
@@ -21,39 +37,139 @@ logger = get_logger('scheduler')
 
 ## CONSTANTES
 
-# abreviações PT → método schedule em inglês
-DAY_MAP = {
-    'Seg': 'monday',
-    'Ter': 'tuesday',
-    'Qua': 'wednesday',
-    'Qui': 'thursday',
-    'Sex': 'friday',
-    'Sáb': 'saturday',
-    'Dom': 'sunday'
-}
-
 # Parametros do oracle
 LIB = MAIN_PARAMETERS['oracle_database']['INSTANT_CLIENT']
 DSN = MAIN_PARAMETERS['oracle_database']['TSN']
 USER = MAIN_PARAMETERS['user_name']
 PWD = MAIN_PARAMETERS['user_pass']
-ARRAYSIZE = 5000
+ARRAYSIZE = 5000  # usado quando não é possível descrever a consulta antes de executá-la
+
+# Exportação incremental: o export_type 'Acumulado' busca só a janela nova e junta ao CSV existente
+INCREMENTAL_EXPORT_TYPE = 'Acumulado'
+INCREMENTAL_FULL_START = datetime.date(1900, 1, 1)  # início da janela na primeira carga
+
+# Exportação mensal: o export_type 'Mês' grava um arquivo por mês ('nome MM.AAAA.csv')
+MONTHLY_EXPORT_TYPE = 'Mês'
+
+# Parametros do pool de sessões do oracle
+POOL_PARAMETERS = MAIN_PARAMETERS['oracle_database'].get('pool', {})
+POOL_MIN = int(POOL_PARAMETERS.get('min', 1))
+POOL_MAX = int(POOL_PARAMETERS.get('max', 10))
+POOL_INCREMENT = int(POOL_PARAMETERS.get('increment', 1))
+POOL_WAIT_TIMEOUT_MS = int(POOL_PARAMETERS.get('wait_timeout_ms', 60000))
 
 # Configuração do SQLITE3
 engine = get_postgres_engine(MAIN_PARAMETERS['postgres'])
 Session = sessionmaker(bind=engine)
 
-# Thread pool (ajuste max_workers conforme CPUs / volume de jobs)
-# TODO: Implementar numero de workers no datafile.json
-executor = ThreadPoolExecutor(max_workers=5)
+# Executor de jobs (workers, reserva para jobs leves e limite por schema vêm do datafile.json)
+SCHEDULER_PARAMETERS = MAIN_PARAMETERS.get('scheduler', {})
+MONTHLY_BACKFILL_MONTHS = int(SCHEDULER_PARAMETERS.get('monthly_backfill_months', 12))
+
+# Parâmetro de liberação (check_parameter): cache do resultado e re-tentativas com backoff
+PARAMETER_TTL_SECONDS = int(SCHEDULER_PARAMETERS.get('parameter_ttl_seconds', 300))
+PARAMETER_FAIL_TTL_SECONDS = int(SCHEDULER_PARAMETERS.get('parameter_fail_ttl_seconds', 60))
+PARAMETER_RETRY_SECONDS = int(SCHEDULER_PARAMETERS.get('parameter_retry_seconds', 300))
+PARAMETER_MAX_RETRIES = int(SCHEDULER_PARAMETERS.get('parameter_max_retries', 6))
+PARAMETER_RETRY_MAX_SECONDS = 3600
+
+# Extração dividida: cada job com split_column usa até split_parts sessões, limitado por este teto
+MAX_SPLIT_PARTS = int(SCHEDULER_PARAMETERS.get('max_split_parts', 4))
+MAX_WORKERS = int(SCHEDULER_PARAMETERS.get('max_workers', 5))
+
+# Serialização do CSV: 'columnar' (coluna a coluna, padrão) ou 'csv' (csv.writer); os dois geram os mesmos bytes
+CSV_WRITER = SCHEDULER_PARAMETERS.get('csv_writer', 'columnar')
+if CSV_WRITER not in CSV_WRITERS:
+    raise ValueError(f"Invalid scheduler.csv_writer '{CSV_WRITER}', expected one of {tuple(CSV_WRITERS)}")
+
+# Tamanho do fetch: arraysize calculado pela largura das colunas para caber no alvo de memória
+FETCH_MEMORY_TARGET_BYTES = int(SCHEDULER_PARAMETERS.get('fetch_memory_target_mb', 64)) * 1024 * 1024
+FETCH_MIN_ARRAYSIZE = int(SCHEDULER_PARAMETERS.get('fetch_min_arraysize', 100))
+FETCH_MAX_ARRAYSIZE = int(SCHEDULER_PARAMETERS.get('fetch_max_arraysize', 50000))
+
+# Recuperação de execuções perdidas enquanto o agendador estava parado (ver catch_up_missed_runs)
+CATCHUP_LOOKBACK_HOURS = int(SCHEDULER_PARAMETERS.get('catchup_lookback_hours', 24))
+CATCHUP_MAX_CONCURRENCY = max(1, int(SCHEDULER_PARAMETERS.get('catchup_max_concurrency', 2)))
+
+# Modo distribuído: vários agendadores na mesma base dividem os disparos por leases (ver job_leases)
+DISTRIBUTED = bool(SCHEDULER_PARAMETERS.get('distributed', False))
+NODE_ID = SCHEDULER_PARAMETERS.get('node_id') or f"{socket.gethostname()}:{os.getpid()}"
+LEASE_SECONDS = int(SCHEDULER_PARAMETERS.get('lease_seconds', 60))
+LEASE_HEARTBEAT_SECONDS = int(SCHEDULER_PARAMETERS.get('lease_heartbeat_seconds', 15))
+
+# Sessões Oracle em uso por job: com overlap_policy = 'cancel' a execução anterior é interrompida por elas.
+# O pedido de cancelamento fica no executor (executor.cancel_requested), preso à execução que estava rodando.
+active_sessions = {}
+active_sessions_lock = threading.Lock()
+
+
+class JobCancelled(Exception):
+    """A execução foi cancelada por uma nova submissão do mesmo job (overlap_policy = 'cancel')."""
+
+
+def cancel_running_job(job_data):
+    """Interrompe as consultas em andamento da execução atual do job (a próxima já está na fila)."""
+    errors = []
+    with active_sessions_lock:
+        # a execução pode ter terminado depois do pedido: a seguinte não tem o pedido e não é interrompida.
+        # Sob o lock, as sessões listadas ainda estão com a execução cancelada (ver job_session).
+        if not executor.cancel_requested(job_data.job_id):
+            return
+        sessions = list(active_sessions.get(job_data.job_id, ()))
+        for connection in sessions:
+            try:
+                connection.cancel()
+            except oracledb.Error as error:
+                errors.append(error)
+    log_warning(logger, f"Job '{job_data.job_name}': cancelling the running execution ({len(sessions)} active sessions).", job_id=job_data.job_id)
+    for error in errors:
+        log_warning(logger, f"Job '{job_data.job_name}': could not cancel session: {error}", job_id=job_data.job_id)
+
+
+executor = JobExecutor(
+    max_workers=MAX_WORKERS,
+    reserved_workers=SCHEDULER_PARAMETERS.get('reserved_workers', 1),
+    max_schema_weight=SCHEDULER_PARAMETERS.get('max_schema_weight', 3),
+    heavy_seconds=SCHEDULER_PARAMETERS.get('heavy_job_seconds', 300),
+    on_cancel=cancel_running_job
+)
+
+# Métricas do agendador, servidas em http://<host>:<metrics_port>/metrics (0 desativa)
+METRICS_PORT = int(SCHEDULER_PARAMETERS.get('metrics_port', 9108))
+rows_fetched_total = metrics.counter('oracle_rows_fetched_total', 'Rows fetched from Oracle by job exports.')
+fetch_seconds_total = metrics.counter('oracle_fetch_seconds_total', 'Seconds spent in fetchmany by job exports.')
+metrics.gauge('executor_queue_depth', 'Jobs waiting for a free worker.', function=lambda: executor.queue_depth)
+metrics.gauge('executor_active_jobs', 'Jobs currently running.', function=lambda: executor.running)
+metrics.gauge('oracle_pool_busy_sessions', 'Oracle pool sessions in use.', function=lambda: pool.busy)
+metrics.gauge('oracle_pool_open_sessions', 'Oracle pool sessions open.', function=lambda: pool.opened)
 
 # Configuração Oracle 11g
 # Create OracleDB object
 
+def init_session(connection, requested_tag):
+    """
+    Callback do pool: aplica as configurações de sessão uma única vez,
+    quando uma nova sessão é criada, em vez de a cada execução de job.
+    """
+    with connection.cursor() as cursor:
+        # Altera o formato de data para o padrão regional
+        cursor.execute("ALTER SESSION SET NLS_DATE_FORMAT = 'DD/MM/YYYY'")
+
 try:
     oracledb.init_oracle_client(lib_dir=LIB)
+    pool = oracledb.create_pool(
+        user=USER,
+        password=PWD,
+        dsn=DSN,
+        min=POOL_MIN,
+        max=POOL_MAX,
+        increment=POOL_INCREMENT,
+        getmode=oracledb.POOL_GETMODE_TIMEDWAIT,
+        wait_timeout=POOL_WAIT_TIMEOUT_MS,
+        session_callback=init_session
+    )
     # pequena conexão teste:
-    with oracledb.connect(user=USER, password=PWD, dsn=DSN) as connection:
+    with pool.acquire() as connection:
         with connection.cursor() as cursor:
             cursor.execute('SELECT SYSDATE FROM DUAL')
 
@@ -61,65 +177,52 @@ try:
     
     if not type(result[0]) is datetime.datetime:
         raise ConnectionError('Erro ao executar DQL teste')
-except Exception:
-    print(f'Erro ao inicializar conexão com Oracle: {Exception}')
+except Exception as e:
+    print(f'Erro ao inicializar conexão com Oracle: {e}')
     exit(-1)
 
 def fetch_parameter(parameter_id: int):
     session = Session()
 
-    param = session.query(Parameter).filter_by(parameter_id=parameter_id).first()
+    try:
+        param = session.query(Parameter).filter_by(parameter_id=parameter_id).first()
+        if param is None:
+            return None
+
+        result = {
+                'parameter_id': param.parameter_id,
+                'parameter_name': param.parameter_name,
+                'sql_script': param.sql_script
+            }
+
+        return result
+    finally:
+        session.close()
+
+
+def fetch_parameter_sql(parameter_id: int):
+    param = fetch_parameter(parameter_id)
+    return param['sql_script'] if param else None
 
-    result = {
-            'parameter_id': param.parameter_id,
-            'parameter_name': param.parameter_name,
-            'sql_script': param.sql_script
-        }
 
-    return result
+parameter_gate = ParameterGate(pool, fetch_parameter_sql, PARAMETER_TTL_SECONDS, PARAMETER_FAIL_TTL_SECONDS)
 
 
 def fetch_jobs(job_id=None):
+    """Retorna os jobs ativos (JobRecord, com a agenda incluída) carregados pelo catálogo compartilhado."""
     session = Session()
 
     log_debug(logger, f"Fetching jobs from DB. Specific job_id: {job_id if job_id else 'All active'}")
 
     try:
         # só traz aqueles com status = 'Y' (ativo)
-        if job_id is None:
-            jobs = session.query(JobHE).filter_by(job_status='Y').all()
-        else:
-            jobs = session.query(JobHE).filter_by(job_status='Y', job_id=job_id).all()
-
-        result = []
-
-        job_ids_fetched = [j.job_id for j in jobs]
-        if not job_ids_fetched:
-                log_debug(logger, "No active jobs found matching criteria.")
-                return result # Vazio
-
-        for job in jobs:
-            # coleta os horários/dias associados
-            scheds = session.query(JobDE).filter_by(job_id=job.job_id).all()
-            for s in scheds:
-                result.append({
-                    'job_id': job.job_id,
-                    'schedule_id': s.schedule_id,
-                    'name': job.job_name,
-                    'export_type': job.export_type,
-                    'export_name': job.export_name,
-                    'export_path': job.export_path,
-                    'days_offset': job.days_offset,
-                    'check_parameter': job.check_parameter,
-                    'parameter_id': job.parameter_id,
-                    'data_primary_key': job.data_primary_key,
-                    'sql_script': job.sql_script,
-                    'day': s.job_day,
-                    'time': f"{s.job_hour.zfill(2)}:{s.job_minute.zfill(2)}"
-                })
-        
-        log_debug(logger, f"Fetched {len(result)} job schedule instances.")
-        return result
+        jobs = load_job_catalog(session, job_id=job_id, active_only=True)
+        if not jobs:
+            log_debug(logger, "No active jobs found matching criteria.")
+            return jobs # Vazio
+
+        log_debug(logger, f"Fetched {len(jobs)} jobs with {sum(j.schedule.slots for j in jobs)} weekly runs.")
+        return jobs
     except Exception as e:
         log_exception(logger, f"Error fetching jobs from database: {e}")
         return [] # Return empty list on error
@@ -127,28 +230,367 @@ def fetch_jobs(job_id=None):
         session.close()
 
 
-def execute_job(job_data):
+# Memória estimada por valor buscado (objeto Python + referência na tupla da linha)
+FETCH_NUMBER_BYTES = 40
+FETCH_DATE_BYTES = 56
+FETCH_STR_OVERHEAD_BYTES = 57
+FETCH_LOB_BYTES = 4000
+FETCH_ROW_OVERHEAD_BYTES = 56
+FETCH_NUMBER_TYPES = (oracledb.DB_TYPE_NUMBER, oracledb.DB_TYPE_BINARY_DOUBLE, oracledb.DB_TYPE_BINARY_FLOAT,
+                      oracledb.DB_TYPE_BINARY_INTEGER)
+FETCH_DATE_TYPES = (oracledb.DB_TYPE_DATE, oracledb.DB_TYPE_TIMESTAMP, oracledb.DB_TYPE_TIMESTAMP_TZ,
+                    oracledb.DB_TYPE_TIMESTAMP_LTZ)
+FETCH_LOB_TYPES = (oracledb.DB_TYPE_CLOB, oracledb.DB_TYPE_NCLOB, oracledb.DB_TYPE_BLOB, oracledb.DB_TYPE_LONG,
+                   oracledb.DB_TYPE_LONG_RAW, oracledb.DB_TYPE_BFILE)
+
+
+def estimated_row_bytes(description):
+    """Memória de uma linha buscada, pelo tipo e pela largura máxima declarada de cada coluna."""
+    row_bytes = FETCH_ROW_OVERHEAD_BYTES
+    for column in description:
+        type_code, internal_size = column[1], column[3]
+        if type_code in FETCH_NUMBER_TYPES:
+            row_bytes += FETCH_NUMBER_BYTES
+        elif type_code in FETCH_DATE_TYPES:
+            row_bytes += FETCH_DATE_BYTES
+        elif type_code in FETCH_LOB_TYPES:
+            row_bytes += FETCH_LOB_BYTES
+        else:
+            row_bytes += FETCH_STR_OVERHEAD_BYTES + (internal_size or 0)
+    return row_bytes
+
+
+def fetch_sizes(cursor, sql, job_data, job_logger):
+    """
+    Define arraysize e prefetchrows do cursor antes do execute. Sem override no job, descreve a
+    consulta (cursor.parse, sem buscar linhas) e calcula quantas linhas cabem em
+    FETCH_MEMORY_TARGET_BYTES: tabelas estreitas buscam blocos maiores (menos round trips) e
+    extracts largos, blocos menores. O prefetch acompanha o arraysize, trazendo o primeiro bloco
+    já na resposta do execute. Retorna (arraysize, prefetchrows) para aplicar em outros cursores.
+    """
+    arraysize = job_data.fetch_arraysize
+    source = 'job override'
+    if not arraysize:
+        try:
+            cursor.parse(sql)
+            row_bytes = estimated_row_bytes(cursor.description)
+            arraysize = max(FETCH_MIN_ARRAYSIZE, min(FETCH_MAX_ARRAYSIZE, FETCH_MEMORY_TARGET_BYTES // row_bytes))
+            source = f"{len(cursor.description)} columns, ~{row_bytes} bytes/row"
+        except oracledb.DatabaseError as error:
+            arraysize = ARRAYSIZE
+            source = f"default, could not describe the query: {error}"
+    prefetchrows = job_data.fetch_prefetchrows if job_data.fetch_prefetchrows is not None else arraysize
+    cursor.arraysize, cursor.prefetchrows = arraysize, prefetchrows
+    log_info(job_logger, f"Job '{job_data.job_name}': fetch arraysize {arraysize}, prefetchrows {prefetchrows} ({source}).", job_id=job_data.job_id)
+    return arraysize, prefetchrows
+
+
+@contextlib.contextmanager
+def job_session(job_id, timings):
+    """
+    Sessão do pool para o job (tempo de espera somado na fase 'connect'), registrada em
+    active_sessions enquanto está em uso para que a execução possa ser cancelada.
+    """
+    with timings.phase('connect'):
+        connection = pool.acquire()
+    with active_sessions_lock:
+        active_sessions.setdefault(job_id, set()).add(connection)
+        cancelled = executor.cancel_requested(job_id)
+    with connection:
+        try:
+            if cancelled:
+                raise JobCancelled()
+            yield connection
+        finally:
+            # sai de active_sessions antes de voltar ao pool: um cancelamento nunca atinge a sessão de outro job
+            with active_sessions_lock:
+                sessions = active_sessions.get(job_id, set())
+                sessions.discard(connection)
+                if not sessions:
+                    active_sessions.pop(job_id, None)
+
+
+def write_export(cursor, absolute_path, job_data, job_logger, columnar=True, timings=None):
+    """
+    Percorre o cursor já executado em blocos de `arraysize` e grava o CSV e, se o job
+    tiver columnar_output = 'Y', o sidecar Parquet no mesmo loop. Retorna a quantidade de linhas.
+    Com `timings` (RunTimings), soma o tempo de fetch e o de serialização (todo o resto).
+    """
+    job_id = job_data.job_id
+    job_name = job_data.job_name
+    rows_exported = 0
+    fetch_seconds = 0.0
+    write_start = time.perf_counter()
+
+    # CSV e sidecar são gravados em temporários e só substituem a versão anterior se tudo der certo;
+    # a API de dados continua servindo o último arquivo completo enquanto o job roda
+    with contextlib.ExitStack() as outputs:
+        csv_tmp_path = outputs.enter_context(atomic_output(absolute_path))
+        columnar_writer = None
+        if columnar and job_data.columnar_output == 'Y':
+            if columnar_available():
+                # aberto depois do CSV: é trocado antes dele e fica com mtime mais novo
+                columnar_writer = ParquetSidecarWriter(outputs.enter_context(atomic_output(columnar_path(absolute_path))), cursor.description)
+            else:
+                log_warning(job_logger, f"Job '{job_name}': columnar output requested but pyarrow is not installed. Exporting CSV only.", job_id=job_id)
+
+        try:
+            # com export_compression o arquivo é comprimido em fluxo, bloco a bloco, dentro deste loop
+            with open_export(csv_tmp_path, 'w', compression=compression_of(absolute_path)) as csvfile:
+                writer = CSV_WRITERS[CSV_WRITER](csvfile)
+
+                headers = [col[0] for col in cursor.description]
+                writer.writerow(headers)
+
+                # busca em blocos de até `arraysize`
+                while True:
+                    fetch_start = time.perf_counter()
+                    rows = cursor.fetchmany()  # vai até `arraysize` linhas
+                    fetch_seconds += time.perf_counter() - fetch_start
+                    if not rows:
+                        break
+                    writer.writerows(rows)
+                    if columnar_writer:
+                        columnar_writer.write_batch(rows)
+                    rows_exported += len(rows)
+                    log_debug(job_logger, f"Job '{job_name}': Fetched/wrote {len(rows)} rows (Total: {rows_exported})", job_id=job_id)
+        except Exception:
+            if columnar_writer:
+                columnar_writer.abort()
+            raise
+
+        if columnar_writer:
+            # fechado depois do CSV: o sidecar só é usado pela API se for mais novo que o CSV
+            columnar_writer.close()
+
+    write_seconds = time.perf_counter() - write_start
+    rows_fetched_total.inc(rows_exported)
+    fetch_seconds_total.inc(fetch_seconds)
+    if timings:
+        timings.add('fetch', fetch_seconds)
+        timings.add('serialize', write_seconds - fetch_seconds)
+    fetch_rate = rows_exported / fetch_seconds if fetch_seconds else 0
+    log_info(job_logger, f"Job '{job_name}': {os.path.basename(absolute_path)}: {rows_exported} rows, fetch {fetch_seconds:.2f} s ({fetch_rate:.0f} rows/s, arraysize {cursor.arraysize}).",
+             job_id=job_id, duration_ms=int(write_seconds * 1000))
+    return rows_exported
+
+
+def incremental_binds(job_data, absolute_path, job_logger):
+    """
+    Binds :start_date / :end_date da exportação incremental.
+    A marca d'água é a data da última exportação bem-sucedida (mtime do CSV) menos days_offset;
+    a janela recomeça no primeiro dia do mês dessa data (date_treatment), para que dados lançados
+    com atraso sejam buscados de novo (a deduplicação pela chave evita duplicidade). Sem CSV
+    anterior a janela começa em INCREMENTAL_FULL_START. Retorna ({} se não houver binds, binds).
+    """
+    job_id = job_data.job_id
+    job_name = job_data.job_name
+    sql_binds = get_sql_binds(job_data.sql_script)
+    if 'start_date' not in sql_binds:
+        log_warning(job_logger, f"Job '{job_name}': incremental export requires a :start_date bind in the SQL. Running a full export.", job_id=job_id)
+        return {}
+    if not job_data.data_primary_key:
+        log_warning(job_logger, f"Job '{job_name}': incremental export requires data_primary_key. Running a full export.", job_id=job_id)
+        start_date = INCREMENTAL_FULL_START
+    elif os.path.isfile(absolute_path):
+        days_offset = int(job_data.days_offset or 0)
+        watermark = datetime.date.fromtimestamp(os.path.getmtime(absolute_path)) - datetime.timedelta(days=days_offset)
+        start_date = date_treatment(getdate_str(watermark - datetime.timedelta(days=1)), days_offset)['sql_dates'][0].date()
+    else:
+        start_date = INCREMENTAL_FULL_START
+
+    end_date = datetime.date.today() - datetime.timedelta(days=int(job_data.days_offset or 0))
+    binds = {'start_date': start_date}
+    if 'end_date' in sql_binds:
+        binds['end_date'] = end_date
+    log_info(job_logger, f"Job '{job_name}': incremental window {start_date} to {end_date}.", job_id=job_id)
+    return binds
+
+
+def monthly_partitions(job_data, job_logger, suffix=''):
+    """
+    Meses a (re)extrair no modo mensal, como [(caminho da partição, binds)].
+    Só são refeitos o mês da última atualização (mtime da partição mais recente menos days_offset,
+    via date_treatment) e os seguintes até hoje - days_offset; os meses já fechados não são tocados.
+    Sem partições, a primeira carga cobre os últimos MONTHLY_BACKFILL_MONTHS meses.
+    Retorna [] se a consulta não tiver os binds :start_date e :end_date.
+    """
+    job_id = job_data.job_id
+    job_name = job_data.job_name
+    if not {'start_date', 'end_date'} <= get_sql_binds(job_data.sql_script):
+        log_warning(job_logger, f"Job '{job_name}': monthly export requires :start_date and :end_date binds in the SQL. Running a full export.", job_id=job_id)
+        return []
+
+    days_offset = int(job_data.days_offset or 0)
+    final_date = datetime.date.today() - datetime.timedelta(days=days_offset)
+    existing = {}
+    if os.path.isdir(job_data.export_path):
+        for file_name in os.listdir(job_data.export_path):
+            partition = parse_export_name(file_name)
+            if partition and partition[0] == job_data.export_name:
+                existing[partition[1]] = os.path.join(job_data.export_path, file_name)
+
+    if existing:
+        last_refresh = datetime.date.fromtimestamp(os.path.getmtime(existing[max(existing)]))
+        watermark = last_refresh - datetime.timedelta(days=days_offset)
+        window = date_treatment(getdate_str(watermark - datetime.timedelta(days=1)), days_offset)
+        initial_date = window['sql_dates'][0].date()
+        if window['month_check']:
+            log_debug(job_logger, f"Job '{job_name}': window crosses month boundary, refreshing from {initial_date:%m/%Y}.", job_id=job_id)
+    else:
+        initial_date = final_date.replace(day=1)
+        for _ in range(MONTHLY_BACKFILL_MONTHS - 1):
+            initial_date = (initial_date - datetime.timedelta(days=1)).replace(day=1)
+
+    partitions = []
+    for month_start in month_starts(initial_date, final_date):
+        month_end = (month_start + datetime.timedelta(days=32)).replace(day=1) - datetime.timedelta(days=1)
+        path = os.path.join(job_data.export_path, get_export_name(job_data.export_name, month_start) + suffix)
+        partitions.append((path, {'start_date': month_start, 'end_date': min(month_end, final_date)}))
+    log_info(job_logger, f"Job '{job_name}': refreshing {len(partitions)} monthly partitions ({initial_date:%m/%Y} to {final_date:%m/%Y}).", job_id=job_id)
+    return partitions
+
+
+# Cada worker do executor usa no máximo uma sessão do pool por vez; as sessões a mais das faixas
+# de uma extração dividida saem desta reserva, então o total nunca passa de oracle_database.pool.max
+split_sessions = threading.BoundedSemaphore(max(0, POOL_MAX - MAX_WORKERS))
+
+
+def reserve_split_sessions(wanted):
+    """Reserva até `wanted` sessões extras para as faixas, sem esperar; retorna quantas conseguiu."""
+    reserved = 0
+    while reserved < wanted and split_sessions.acquire(blocking=False):
+        reserved += 1
+    return reserved
+
+
+def export_split(sql, binds, ranges, job_data, target_path, job_logger, columnar, fetch=(ARRAYSIZE, 2), timings=None):
+    """
+    Executa uma sub-consulta por faixa em sessões separadas do pool, gravando cada uma em um CSV
+    parcial (e num Parquet parcial, se o job tiver columnar_output); ao final as partes são juntadas
+    na ordem das faixas. Chamar sem nenhuma sessão do job aberta: a sessão do worker é usada por
+    uma das faixas e as demais rodam ao mesmo tempo só com as sessões extras livres
+    (reserve_split_sessions); as faixas que sobram esperam na fila.
+    """
+    job_id = job_data.job_id
+    job_name = job_data.job_name
+    column = job_data.split_column
+    timings = timings or RunTimings()
+    part_paths = [f"{target_path}.part{i}.csv" for i in range(len(ranges))]
+    sidecar = columnar and job_data.columnar_output == 'Y'
+    if sidecar and not columnar_available():
+        log_warning(job_logger, f"Job '{job_name}': columnar output requested but pyarrow is not installed. Exporting CSV only.", job_id=job_id)
+        sidecar = False
+    part_sidecars = [columnar_path(part_path) for part_path in part_paths] if sidecar else []
+
+    def run_part(part):
+        low, high = ranges[part]
+        part_start = time.time()
+        with job_session(job_id, timings) as connection:
+            with connection.cursor() as cursor:
+                cursor.arraysize, cursor.prefetchrows = fetch
+                with timings.phase('execute'):
+                    cursor.execute(split_query(sql, column, part, len(ranges)), {**binds, 'split_low': low, 'split_high': high})
+                rows = write_export(cursor, part_paths[part], job_data, job_logger, columnar=sidecar, timings=timings)
+        log_debug(job_logger, f"Job '{job_name}': part {part + 1}/{len(ranges)} ({low} to {high}) exported {rows} rows.", job_id=job_id, duration_ms=int((time.time() - part_start) * 1000))
+        return rows
+
+    extra_sessions = reserve_split_sessions(len(ranges) - 1)
+    if extra_sessions < len(ranges) - 1:
+        log_info(job_logger, f"Job '{job_name}': {len(ranges)} parts running on {extra_sessions + 1} sessions (no more free sessions in the pool for split parts).", job_id=job_id)
+    try:
+        with ThreadPoolExecutor(max_workers=extra_sessions + 1, thread_name_prefix=f'split-{job_id}') as split_executor:
+            rows_exported = sum(split_executor.map(run_part, range(len(ranges))))
+        concat_csv_parts(part_paths, target_path)
+        if part_sidecars:
+            # depois do CSV: o sidecar só é usado pela API se for mais novo que o CSV
+            concat_parquet_parts(part_sidecars, columnar_path(target_path))
+    finally:
+        for _ in range(extra_sessions):
+            split_sessions.release()
+        for part_path in part_paths + part_sidecars:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+    return rows_exported
+
+
+def export_compression(job_data, job_logger):
+    """Compressão configurada no job ('gzip'/'zstd'), ou None se não houver ou não estiver disponível."""
+    compression = (job_data.export_compression or '').strip().lower() or None
+    if compression and not compression_available(compression):
+        log_warning(job_logger, f"Job '{job_data.job_name}': compression '{compression}' is not available. Exporting uncompressed CSV.", job_id=job_data.job_id)
+        return None
+    return compression
+
+
+def submit_job(job_data, func=None, delay=0, on_dropped=None):
+    """
+    Coloca o job na fila do executor (com prioridade, peso e schema do job), opcionalmente após
+    `delay` segundos; nesse caso `on_dropped()` é chamado se a execução não entrar na fila.
+    """
+    kwargs = dict(
+        priority=job_data.job_priority,
+        weight=job_data.job_weight,
+        schema=get_sql_schema(job_data.sql_script, default=USER),
+        overlap=job_data.overlap_policy
+    )
+    if delay:
+        return executor.submit_after(delay, func or execute_job, job_data, on_dropped=on_dropped, **kwargs)
+    return executor.submit(func or execute_job, job_data, **kwargs)
+
+
+def requeue_job(job_data, attempt, job_logger):
+    """Parâmetro não liberado: tenta de novo mais tarde, dobrando a espera a cada tentativa."""
+    job_id = job_data.job_id
+    job_name = job_data.job_name
+    if attempt >= PARAMETER_MAX_RETRIES:
+        log_warning(job_logger, f"Job '{job_name}': parameter {job_data.parameter_id} still not ready after {attempt} retries. Skipping until the next scheduled run.", job_id=job_id)
+        return
+    delay = min(PARAMETER_RETRY_SECONDS * 2 ** attempt, PARAMETER_RETRY_MAX_SECONDS)
+    retry = functools.partial(execute_job, attempt=attempt + 1)
+    if job_leases is None:
+        submit_job(job_data, func=retry, delay=delay)
+    elif job_leases.retain(job_id):
+        # o lease fica com este nó até a nova tentativa terminar: nenhum outro nó roda o job enquanto isso
+        submit_claimed(job_data, func=retry, delay=delay)
+    else:
+        log_warning(job_logger, f"Job '{job_name}': parameter {job_data.parameter_id} not ready and this node does not hold the job lease. Skipping until the next scheduled run.", job_id=job_id)
+        return
+    log_info(job_logger, f"Job '{job_name}': parameter {job_data.parameter_id} not ready. Retry {attempt + 1}/{PARAMETER_MAX_RETRIES} in {delay} s.", job_id=job_id)
+
+
+def execute_job(job_data, attempt=0):
     job_logger = get_logger('executor')
-    job_id = job_data.get('job_id', None)
-    job_name = job_data.get('name', 'Unknown Job')
+    job_id = job_data.job_id
+    job_name = job_data.job_name or 'Unknown Job'
     start_time = time.time()
     log_info(job_logger, f"Starting job execution: '{job_name}'", job_id=job_id)
 
+    # histórico da execução (job_runs): gravado no finally, qualquer que seja o desfecho
+    started_at = datetime.datetime.now()
+    timings = RunTimings()
+    run_status = 'error'
+    error_text = None
+    rows_exported = 0
+    bytes_written = None
+
     try:
-        accum_type = job_data['export_type']
-        #days_offset = int(job_data['days_offset'])
-        archive_path = job_data['export_path']
-        archive_name_with_extention = job_data['export_name'] + '.csv'
-        check_parameter = job_data['check_parameter']
+        accum_type = job_data.export_type
+        #days_offset = int(job_data.days_offset)
+        archive_path = job_data.export_path
+        compression = export_compression(job_data, job_logger)
+        archive_name_with_extention = job_data.export_name + '.csv' + EXPORT_COMPRESSIONS.get(compression, '')
+        check_parameter = job_data.check_parameter == 'Y'
         if check_parameter:
-            parameter_id = job_data['parameter_id']
+            parameter_id = job_data.parameter_id
         else:
             parameter_id = None
 
-        data_primary_key = job_data['data_primary_key']
-        sql = job_data['sql_script']
+        data_primary_key = job_data.data_primary_key
+        sql = job_data.sql_script
 
         if not sql:
+            error_text = "Job has no SQL script defined."
             log_error(job_logger, f"Job '{job_name}' has no SQL script defined.", job_id=job_id)
             return
     
@@ -160,132 +602,400 @@ def execute_job(job_data):
 
         # Verifica se o comando é DQL
         if not is_select_query(sql):
+            error_text = "SQL is not a SELECT query."
             log_error(job_logger, f"Job '{job_name}': SQL is not a SELECT query. Aborting.", job_id=job_id)
             return
 
+        # Parâmetro de liberação: só extrai quando a origem estiver pronta (resultado em cache por parâmetro)
+        if check_parameter:
+            if parameter_id is None:
+                log_warning(job_logger, f"Job '{job_name}': check_parameter is enabled but no parameter is set. Running without the check.", job_id=job_id)
+            elif not parameter_gate.is_ready(parameter_id):
+                run_status = 'deferred'
+                requeue_job(job_data, attempt, job_logger)
+                return
+
+        # Exportação incremental: busca só a janela nova e junta ao CSV existente pela chave
+        binds = {}
+        partitions = []
+        if accum_type == INCREMENTAL_EXPORT_TYPE:
+            binds = incremental_binds(job_data, absolute_path, job_logger)
+        elif accum_type == MONTHLY_EXPORT_TYPE:
+            partitions = monthly_partitions(job_data, job_logger, EXPORT_COMPRESSIONS.get(compression, ''))
+        merge = bool(binds) and binds['start_date'] != INCREMENTAL_FULL_START and os.path.isfile(absolute_path)
+        delta_path = absolute_path + '.delta'
+        ranges = None
+
         log_debug(job_logger, f"Job '{job_name}': Executing SQL:\n{sql[:200]}...", job_id=job_id)
-        rows_exported = 0
 
         # Execução do SQL e exportação com fetchmany()
-        with oracledb.connect(user=USER, password=PWD, dsn=DSN) as connection:
+        # A sessão vem do pool (NLS já aplicado pelo init_session) e volta para ele ao final
+        with job_session(job_id, timings) as connection:
+            pool_wait_ms = int(timings.seconds['connect'] * 1000)
+            log_debug(job_logger, f"Job '{job_name}': Oracle session acquired in {pool_wait_ms} ms (busy: {pool.busy}/{pool.max}).", job_id=job_id)
+
             with connection.cursor() as cursor:
-                # Altera o formato de data para o padrão regional
-                cursor.execute("ALTER SESSION SET NLS_DATE_FORMAT = 'DD/MM/YYYY'")
-
-                cursor.arraysize = ARRAYSIZE
-                cursor.execute(sql)
-
-                with open(absolute_path, 'w', newline='', encoding='utf-8') as csvfile:
-                    writer = csv.writer(csvfile, delimiter=';')
-                    
-                    headers = [col[0] for col in cursor.description]
-                    writer.writerow(headers)
-                    
-                    # busca em blocos de até `arraysize`
-                    while True:
-                        rows = cursor.fetchmany()  # vai até `arraysize` linhas
-                        if not rows:
-                            break
-                        writer.writerows(rows)
-                        rows_exported += len(rows)
-                        log_debug(job_logger, f"Job '{job_name}': Fetched/wrote {len(rows)} rows (Total: {rows_exported})", job_id=job_id)
-        
+                with timings.phase('execute'):
+                    fetch = fetch_sizes(cursor, sql, job_data, job_logger)
+                if partitions:
+                    # uma consulta por mês, na mesma sessão; cada mês vira um arquivo
+                    for partition_path, partition_binds in partitions:
+                        with timings.phase('execute'):
+                            cursor.execute(sql, partition_binds)
+                        partition_rows = write_export(cursor, partition_path, job_data, job_logger, timings=timings)
+                        rows_exported += partition_rows
+                        log_debug(job_logger, f"Job '{job_name}': wrote {partition_rows} rows to {partition_path}.", job_id=job_id)
+                else:
+                    # o sidecar Parquet não é gravado no modo incremental (a API volta a ler o CSV)
+                    target_path = delta_path if merge else absolute_path
+                    split_parts = min(int(job_data.split_parts or 1), MAX_SPLIT_PARTS)
+                    if job_data.split_column and split_parts > 1:
+                        if re.fullmatch(r'[A-Za-z_][\w$#]*', job_data.split_column):
+                            with timings.phase('execute'):
+                                ranges = split_ranges(cursor, sql, binds, job_data.split_column, split_parts)
+                            if not ranges:
+                                log_warning(job_logger, f"Job '{job_name}': could not split on {job_data.split_column} (empty, single-valued or not numeric/date). Running a single query.", job_id=job_id)
+                        else:
+                            log_warning(job_logger, f"Job '{job_name}': invalid split column '{job_data.split_column}'. Running a single query.", job_id=job_id)
+
+                    if not ranges:
+                        with timings.phase('execute'):
+                            cursor.execute(sql, binds or None)
+                        rows_exported = write_export(cursor, target_path, job_data, job_logger, columnar=not merge, timings=timings)
+
+        # Extração dividida: a sessão do job já voltou ao pool e cada faixa usa a sua
+        if ranges:
+            log_info(job_logger, f"Job '{job_name}': extracting in {len(ranges)} parallel parts on {job_data.split_column}.", job_id=job_id)
+            rows_exported = export_split(sql, binds, ranges, job_data, target_path, job_logger, columnar=not merge, fetch=fetch, timings=timings)
+
+        if merge:
+            try:
+                kept_rows, total_rows = merge_incremental(absolute_path, delta_path, job_data.data_primary_key)
+            finally:
+                os.remove(delta_path)
+            log_info(job_logger, f"Job '{job_name}': merged {rows_exported} new rows into {kept_rows} existing rows ({total_rows} total).", job_id=job_id)
+
+        # Índice de linhas para a paginação da API de dados (evita construí-lo na primeira requisição)
+        written_paths = [path for path, _ in partitions] or [absolute_path]
+        for written_path in written_paths:
+            build_row_index(written_path)
+        bytes_written = sum(os.path.getsize(path) for path in written_paths if os.path.exists(path))
+        run_status = 'success'
+
         end_time = time.time()
         duration_ms = int((end_time - start_time) * 1000)
-        log_info(job_logger, f"Job '{job_name}' finished successfully. Exported {rows_exported} rows.", job_id=job_id, duration_ms=duration_ms)
+        log_info(job_logger, f"Job '{job_name}' finished successfully. Exported {rows_exported} rows (pool wait: {pool_wait_ms} ms).", job_id=job_id, duration_ms=duration_ms)
 
-    except FileNotFoundError:
+    except JobCancelled:
+        run_status = 'cancelled'
+        log_warning(job_logger, f"Job '{job_name}': cancelled before querying Oracle (a newer run is queued).", job_id=job_id)
+    except FileNotFoundError as error:
+        error_text = str(error)
         log_exception(job_logger, f"Job '{job_name}': Error creating/writing file at '{absolute_path}'. Check path and permissions.", job_id=job_id)
     except oracledb.DatabaseError as ora_err:
-         log_exception(job_logger, f"Job '{job_name}': Oracle Database Error during execution: {ora_err}", job_id=job_id)
+         error_text = str(ora_err)
+         if executor.cancel_requested(job_id):
+             run_status = 'cancelled'
+             log_warning(job_logger, f"Job '{job_name}': cancelled during the query (a newer run is queued).", job_id=job_id)
+         else:
+             log_exception(job_logger, f"Job '{job_name}': Oracle Database Error during execution: {ora_err}", job_id=job_id)
     except Exception as error:
+        error_text = str(error)
         end_time = time.time()
         duration_ms = int((end_time - start_time) * 1000)
         # Use log_exception to include traceback
         log_exception(job_logger, f"Job '{job_name}': Unexpected error during execution: {error}", job_id=job_id, duration_ms=duration_ms)
         # Optionally re-raise if needed elsewhere, but likely not in a scheduled task
         # return # Ensure function exits on error
+    finally:
+        record_run(job_id, started_at, run_status, timings, attempt=attempt, rows_exported=rows_exported,
+                   bytes_written=bytes_written, error_text=error_text)
 
 def schedule_job(jobs=None):
     """
-    - Se job for None: carrega TODOS os registros do banco e agenda cada um.
-    - Se job for um dict: agenda apenas esse job em memória.
-    - Se job for um int (job_id): busca esse registro no banco e agenda.
+    - Se jobs for None: carrega TODOS os jobs ativos do banco e agenda cada um.
+    - Se jobs for um JobRecord: agenda apenas esse job em memória.
+    - Se jobs for um int (job_id): busca esse registro no banco e agenda.
+    Cada job vira uma única entrada na schedule_queue, com a agenda lida das máscaras de bits
+    do job (JobRecord.schedule); agendar de novo um job substitui a entrada anterior.
     """
     log_source = "database (all active)"
     if jobs is None:
         jobs = fetch_jobs()
         log_info(logger, f"Scheduling all active jobs from database.")
-
-        # a cada 2 horas, faz o reload completo:
-        schedule.every(2).hours.do(lambda: (
-            schedule.clear(),   # limpa tudo
-            schedule_job()      # recarrega todos
-        ))
-        log_info(logger, "Scheduled periodic job reload every 2 hours.")
     elif type(jobs) == int:
         log_source = f"database (ID: {jobs})"
-        jobs = fetch_jobs(job_id=jobs)
         log_info(logger, f"Scheduling specific job from database: ID {jobs}.")
-    elif type(jobs) == dict:
-        log_source = "provided list"
-        log_info(logger, f"Scheduling {len(jobs)} jobs from provided list.")
-        # Assume list of dicts is correctly formatted
+        jobs = fetch_jobs(job_id=jobs)
+    elif type(jobs) == JobRecord:
+        log_source = "provided job"
+        log_info(logger, f"Scheduling job '{jobs.job_name}' from provided record.", job_id=jobs.job_id)
+        jobs = [jobs]
     else:
-        log_error(logger, f"Invalid input type for schedule_job: {type(jobs)}. Expected None, int, or list[dict].")
+        log_error(logger, f"Invalid input type for schedule_job: {type(jobs)}. Expected None, int, or JobRecord.")
         return
     
     scheduled_count = 0
+    slot_count = 0
 
-    try:
-        for job in jobs:
-            day_key = job['day']
-            tag = job['job_id']
-            hhmm = job['time']
-
-            day_method = DAY_MAP.get(day_key)
-            if not day_method:
-                log_warning(logger, f"Invalid day '{day_key}' for job '{job['name']}' (ID: {job['job_id']}). Skipping this schedule.", job_id=job['job_id'])
+    for job in jobs:
+        try:
+            job_schedule = job.schedule
+            next_run = schedule_queue.add(job.job_id, job_schedule, job)
+            if next_run is None:
+                log_warning(logger, f"Job '{job.job_name}' has no valid schedule. Not scheduled.", job_id=job.job_id)
                 continue
+            log_info(logger, f"Scheduling job '{job.job_name}' ({job_schedule.slots} weekly runs). Next run at {next_run:%Y-%m-%d %H:%M}.", job_id=job.job_id)
+            scheduled_count += 1
+            slot_count += job_schedule.slots
+        except Exception as e:
+            log_exception(logger, f"Unexpected error scheduling job {job.job_name}: {e}", job_id=job.job_id)
 
-            def job_wrapper(job_data=job):
-                log_debug(logger, f"Submitting job '{job_data['name']}' (ID: {job_data['job_id']}) to executor.", job_id=job_data['job_id'])
-                executor.submit(execute_job, job_data)
+    log_info(logger, f"Finished scheduling. Added {scheduled_count} jobs ({slot_count} weekly runs).")
 
-            log_info(logger, f"Scheduling job '{job['name']}' (Tag: {tag}) for {day_key} at {hhmm}", job_id=job['job_id'])
-            # schedule.every().monday.at("14:30").do(task).tag(tag)
-            getattr(schedule.every(), day_method).at(hhmm).do(job_wrapper).tag(tag)
-            scheduled_count += 1
-    except KeyError as e:
-            log_error(logger, f"Missing key {e} in job data while scheduling: {job}. Skipping this schedule.", job_id=job.get('job_id'))
+
+def last_scheduled_time(job, now, since):
+    """Horário agendado mais recente do job no intervalo (since, now], ou None se não houver."""
+    latest = job.schedule.previous_at(now)
+    return latest if latest is not None and latest > since else None
+
+
+def last_run_times():
+    """Início da última execução de cada job em job_runs (re-tentativas adiadas não contam)."""
+    session = Session()
+    try:
+        rows = (session.query(JobRun.job_id, func.max(JobRun.started_at))
+                .filter(JobRun.status != 'deferred')
+                .group_by(JobRun.job_id)
+                .all())
+        return dict(rows)
+    finally:
+        session.close()
+
+
+def catch_up_missed_runs():
+    """
+    Roda uma vez (não uma por horário perdido) os jobs cujo horário agendado passou enquanto o
+    agendador estava parado, olhando até CATCHUP_LOOKBACK_HOURS para trás. Os mais atrasados
+    vão primeiro e no máximo CATCHUP_MAX_CONCURRENCY rodam ao mesmo tempo, para não ocupar
+    todos os workers com a recuperação. Jobs sem nenhuma execução registrada são ignorados.
+    """
+    if CATCHUP_LOOKBACK_HOURS <= 0:
+        return
+    now = datetime.datetime.now()
+    window_start = now - datetime.timedelta(hours=CATCHUP_LOOKBACK_HOURS)
+    try:
+        last_runs = last_run_times()
+    except Exception as e:
+        log_exception(logger, f"Could not read the run history for catch-up: {e}")
+        return
+
+    missed = []
+    for job in fetch_jobs():
+        last_run = last_runs.get(job.job_id)
+        if last_run is None:
+            continue
+        scheduled_at = last_scheduled_time(job, now, max(last_run, window_start))
+        if scheduled_at is not None:
+            missed.append((scheduled_at, job))
+    if not missed:
+        log_info(logger, "Catch-up: no missed runs.")
+        return
+
+    missed.sort(key=lambda entry: entry[0])
+    log_info(logger, f"Catch-up: {len(missed)} jobs missed a scheduled run in the last {CATCHUP_LOOKBACK_HOURS} hours.")
+    slots = threading.BoundedSemaphore(CATCHUP_MAX_CONCURRENCY)
+
+    def run(job_data):
+        try:
+            execute_job(job_data)
+        finally:
+            slots.release()
+
+    for scheduled_at, job in missed:
+        if job_leases is not None and not claim_runs([(scheduled_at, job)]):
+            log_info(logger, f"Catch-up: job '{job.job_name}' missed at {scheduled_at:%Y-%m-%d %H:%M} is handled by another node.", job_id=job.job_id)
+            continue
+        slots.acquire()
+        log_info(logger, f"Catch-up: running job '{job.job_name}' missed at {scheduled_at:%Y-%m-%d %H:%M}.", job_id=job.job_id)
+        submitted = submit_claimed(job, func=run) if job_leases is not None else submit_job(job, func=run)
+        if not submitted:
+            slots.release()  # já na fila/rodando pela agenda normal, ou executor encerrado
+
+
+def claim_runs(entries):
+    """
+    Modo distribuído: assume os disparos [(horário agendado, job), ...] que ainda não foram
+    assumidos por outro nó. Retorna os jobs assumidos, na mesma ordem.
+    """
+    try:
+        claimed = job_leases.claim([(job.job_id, fire) for fire, job in entries])
     except Exception as e:
-            log_exception(logger, f"Unexpected error scheduling job {job.get('name', 'Unknown')}: {e}", job_id=job.get('job_id'))
+        # sem a base não há como saber se outro nó já assumiu: pular evita execuções duplicadas
+        log_exception(logger, f"Could not claim {len(entries)} due runs: {e}. Skipping them.")
+        return []
+    for fire, job in entries:
+        if job.job_id not in claimed:
+            log_debug(logger, f"Job '{job.job_name}' at {fire:%H:%M} was claimed by another node.", job_id=job.job_id)
+    return [job for _, job in entries if job.job_id in claimed]
 
-    log_info(logger, f"Finished scheduling. Added {scheduled_count} schedule entries.")
+
+def submit_claimed(job_data, func=None, delay=0):
+    """
+    Submete um job cujo lease este nó já tem (opcionalmente após `delay` segundos); o lease é
+    liberado quando a execução termina ou se ela não chegar a entrar na fila.
+    """
+    func = func or execute_job
+    release = functools.partial(job_leases.release, job_data.job_id)
+
+    def run(job):
+        try:
+            func(job)
+        finally:
+            release()
+
+    if not submit_job(job_data, func=run, delay=delay, on_dropped=release):
+        release()
+        return False
+    return True
+
+
+def resume_taken_over(job_ids):
+    """Executa de novo os jobs cujo lease venceu em outro nó (o nó parou no meio da execução)."""
+    for job_id in job_ids:
+        jobs = fetch_jobs(job_id=job_id)
+        if not jobs:
+            job_leases.release(job_id)  # job apagado ou desativado
+            continue
+        log_warning(logger, f"Re-running job '{jobs[0].job_name}' taken over from a stopped node.", job_id=job_id)
+        submit_claimed(jobs[0])
+
+
+job_leases = JobLeases(
+    engine, NODE_ID,
+    lease_seconds=LEASE_SECONDS,
+    heartbeat_seconds=LEASE_HEARTBEAT_SECONDS,
+    takeover_limit=MAX_WORKERS,
+    on_takeover=resume_taken_over
+) if DISTRIBUTED else None
+if job_leases is not None:
+    metrics.gauge('job_leases_held', 'Job leases held by this node.', function=lambda: job_leases.held)
+
+
+# Próximo disparo de cada job agendado (só o run_loop mexe nela)
+schedule_queue = ScheduleQueue()
+IDLE_MAX_SECONDS = 300  # o run_loop acorda ao menos a cada 5 min, caso o relógio do sistema mude
+metrics.gauge('scheduled_jobs', 'Jobs in the schedule queue.', function=lambda: len(schedule_queue))
+
+# Mudanças de jobs recebidas do backend (job_id, ou None para recarregar tudo)
+job_changes = queue.Queue()
+listener_ready = threading.Event()
+
+
+def listen_job_changes():
+    """
+    Thread que escuta o canal JOBS_CHANNEL do PostgreSQL (LISTEN/NOTIFY) e repassa
+    os job_id alterados para o run_loop, que é quem mexe na agenda.
+    A cada (re)conexão pede um reload completo, pois notificações podem ter sido perdidas.
+    """
+    while True:
+        connection = None
+        try:
+            connection = engine.raw_connection()
+            dbapi_connection = connection.driver_connection
+            dbapi_connection.autocommit = True
+            with dbapi_connection.cursor() as cursor:
+                cursor.execute(f"LISTEN {JOBS_CHANNEL}")
+            log_info(logger, f"Listening for job changes on channel '{JOBS_CHANNEL}'.")
+
+            job_changes.put(None)
+            listener_ready.set()
+
+            while True:
+                # Espera até 60s por dados no socket; o timeout só serve para manter o loop vivo
+                if select.select([dbapi_connection], [], [], 60) == ([], [], []):
+                    continue
+                dbapi_connection.poll()
+                while dbapi_connection.notifies:
+                    notify = dbapi_connection.notifies.pop(0)
+                    try:
+                        change = json.loads(notify.payload)
+                        log_debug(logger, f"Job change received: {change}", job_id=change['job_id'])
+                        job_changes.put(int(change['job_id']))
+                    except (ValueError, KeyError, TypeError):
+                        log_warning(logger, f"Invalid job change payload ignored: {notify.payload!r}")
+        except Exception as e:
+            log_exception(logger, f"Job change listener failed: {e}. Reconnecting in 30 seconds.")
+            time.sleep(30)
+        finally:
+            if connection is not None:
+                try:
+                    connection.invalidate()
+                except Exception:
+                    pass
+
+
+def apply_job_changes():
+    """Aplica na agenda apenas os jobs alterados (por job_id), ou tudo se for pedido um reload."""
+    changed_ids = set()
+    full_reload = False
+    while True:
+        try:
+            change = job_changes.get_nowait()
+        except queue.Empty:
+            break
+        if change is None:
+            full_reload = True
+        else:
+            changed_ids.add(change)
+
+    if full_reload:
+        log_info(logger, "Reloading all job schedules.")
+        schedule_queue.clear()
+        schedule_job()
+        return
+
+    for job_id in changed_ids:
+        log_info(logger, f"Applying changes for job ID {job_id}.", job_id=job_id)
+        schedule_queue.remove(job_id)
+        schedule_job(job_id) # jobs inativos ou deletados não voltam para a agenda
+
+
+def wait_for_changes(timeout):
+    """Dorme até `timeout` segundos, acordando antes se chegar uma mudança de job."""
+    try:
+        change = job_changes.get(timeout=timeout)
+    except queue.Empty:
+        return
+    job_changes.put(change)
 
 
 def run_loop():
     log_info(logger, "Scheduler run_loop starting.")
-    log_info(logger, f"Next scheduled run at: {schedule.next_run}")
+    log_info(logger, f"Next scheduled run at: {schedule_queue.next_run}")
     while True:
         try:
-            schedule.run_pending()
+            apply_job_changes()
+            due = schedule_queue.pop_due()
+            if job_leases is not None and due:
+                for job_data in claim_runs(due):
+                    log_debug(logger, f"Submitting claimed job '{job_data.job_name}' (ID: {job_data.job_id}) to executor.", job_id=job_data.job_id)
+                    submit_claimed(job_data)
+            else:
+                for _, job_data in due:
+                    log_debug(logger, f"Submitting job '{job_data.job_name}' (ID: {job_data.job_id}) to executor.", job_id=job_data.job_id)
+                    submit_job(job_data)
 
-            idle = schedule.idle_seconds()
+            idle = schedule_queue.idle_seconds()
             if idle is None:
                 # No jobs scheduled
                 log_debug(logger, "No jobs scheduled. Sleeping for 120 seconds.")
-                time.sleep(120)
+                wait_for_changes(120)
             elif idle > 0:
-                # Sleep until the next job, but check more frequently than idle_seconds
-                # Check every 60 seconds or until next job, whichever is smaller
-                sleep_time = min(idle, 60)
+                # Sleep exactly until the next run (or a job change); the cap only guards against clock changes
+                sleep_time = min(idle, IDLE_MAX_SECONDS)
                 log_debug(logger, f"Next job in {idle:.2f} seconds. Sleeping for {sleep_time:.2f} seconds.")
-                time.sleep(sleep_time)
-            else:
-                # Jobs might be due now or overdue, sleep very briefly
-                 log_debug(logger, "Jobs pending or due. Short sleep (1s).")
-                 time.sleep(10) # Short sleep if jobs ran or are due
+                wait_for_changes(sleep_time)
 
         except KeyboardInterrupt:
              log_info(logger, "Scheduler run_loop interrupted by user (KeyboardInterrupt). Exiting.")
@@ -298,10 +1008,24 @@ def run_loop():
 if __name__ == '__main__':
     log_info(logger, "*** Scheduler Service Starting ***")
     try:
-        schedule_job() # Initial scheduling
+        # A carga inicial é o reload pedido pelo listener ao conectar: assim nenhuma mudança
+        # feita entre a carga e o LISTEN é perdida
+        threading.Thread(target=listen_job_changes, name='job-change-listener', daemon=True).start()
+        if not listener_ready.wait(timeout=30):
+            log_warning(logger, "Job change listener is not ready. Scheduling jobs now; changes made in the UI will be applied once it connects.")
+            job_changes.put(None)
+        if METRICS_PORT:
+            metrics.start_metrics_server(METRICS_PORT, token=SCHEDULER_PARAMETERS.get('metrics_token'))
+            log_info(logger, f"Metrics available on port {METRICS_PORT} ({metrics.METRICS_PATH}).")
+        if job_leases is not None:
+            job_leases.start()
+        threading.Thread(target=catch_up_missed_runs, name='catch-up', daemon=True).start()
         run_loop()
     except Exception as e:
         log_exception(logger, "*** Scheduler Service Crashed Unhandled Exception ***")
     finally:
         log_info(logger, "*** Scheduler Service Shutting Down ***")
-        executor.shutdown(wait=True) # Wait for running jobs to finish if possible
\ No newline at end of file
+        executor.shutdown(wait=True) # Wait for running jobs to finish if possible
+        if job_leases is not None:
+            job_leases.stop()
+        pool.close()
\ No newline at end of file
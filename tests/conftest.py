@@ -0,0 +1,20 @@
+"""
+Os testes rodam sem o datafile.json do ambiente e sem PostgreSQL: os módulos leem um datafile
+mínimo em uma pasta temporária e os logs vão só para o console (nada é gravado na tabela logs).
+"""
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_workdir = tempfile.mkdtemp(prefix='automacao-sql-tests-')
+with open(os.path.join(_workdir, 'datafile.json'), 'w', encoding='utf-8') as datafile:
+    json.dump({'postgres': {'hostname': 'localhost', 'port': '5432', 'database': 'tests', 'username': '', 'password': ''}},
+              datafile)
+os.chdir(_workdir)
+
+import logging_config  # noqa: E402
+
+logging_config.log_to_db = lambda *args, **kwargs: None
@@ -0,0 +1,40 @@
+import json
+
+import pandas as pd
+import pytest
+
+from data_api import STREAM_ERROR_KEY, stream_json_array, stream_ndjson
+
+
+def failing_chunks(chunks_before_error):
+    for i in range(chunks_before_error):
+        yield pd.DataFrame({'id': [i * 2, i * 2 + 1]})
+    raise OSError('disco removido')
+
+
+def consume(pieces):
+    body = []
+    with pytest.raises(OSError):
+        for piece in pieces:
+            body.append(piece)
+    return ''.join(body)
+
+
+@pytest.mark.parametrize('chunks_before_error', [0, 2])
+def test_json_array_is_closed_with_error_record(chunks_before_error):
+    records = json.loads(consume(stream_json_array(failing_chunks(chunks_before_error))))
+    assert records[:-1] == [{'id': i} for i in range(chunks_before_error * 2)]
+    assert STREAM_ERROR_KEY in records[-1]
+
+
+@pytest.mark.parametrize('chunks_before_error', [0, 2])
+def test_ndjson_ends_with_error_record(chunks_before_error):
+    lines = consume(stream_ndjson(failing_chunks(chunks_before_error))).splitlines()
+    records = [json.loads(line) for line in lines]
+    assert records[:-1] == [{'id': i} for i in range(chunks_before_error * 2)]
+    assert STREAM_ERROR_KEY in records[-1]
+
+
+def test_stream_without_error_has_no_error_record():
+    chunks = [pd.DataFrame({'id': [1, 2]})]
+    assert json.loads(''.join(stream_json_array(iter(chunks)))) == [{'id': 1}, {'id': 2}]
@@ -0,0 +1,37 @@
+import csv
+import datetime
+import io
+
+from export_writers import ColumnarCsvWriter, CSV_DELIMITER
+
+
+def csv_writer_output(rows):
+    output = io.StringIO()
+    csv.writer(output, delimiter=CSV_DELIMITER).writerows(rows)
+    return output.getvalue()
+
+
+def columnar_output(rows):
+    output = io.StringIO()
+    ColumnarCsvWriter(output).writerows(rows)
+    return output.getvalue()
+
+
+def test_mixed_columns_match_csv_writer():
+    day = datetime.date(2024, 1, 31)
+    moment = datetime.datetime(2024, 1, 31, 8, 30)
+    # cada coluna começa com um tipo e depois mistura outros, inclusive valores iguais como chave de dict
+    columns = [
+        [moment, True, 1, 1.0, None, day, 'texto', moment, False, 0, 0.0],
+        [day, moment, datetime.datetime(2024, 1, 31), '2024-01-31', None, day, 1, True, day, 'a;b', 'a"b'],
+        [True, 1, 1.0, None, False, 0, 'x', 2.5, True, 1, None],
+        ['a', 1, True, None, 'b\r\nc', 1.0, 'a', '', None, day, 'd'],
+        [None, None, 1, True, 1.0, 'x;y', None, moment, None, None, None],
+    ]
+    rows = [tuple(row) for row in zip(*columns)]
+    assert columnar_output(rows) == csv_writer_output(rows)
+
+
+def test_single_empty_column_matches_csv_writer():
+    rows = [(None,), ('',), ('a',)]
+    assert columnar_output(rows) == csv_writer_output(rows)
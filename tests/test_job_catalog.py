@@ -0,0 +1,22 @@
+from sqlalchemy import create_engine, text
+
+from job_catalog import JobRecord, load_job_catalog
+from job_schedule import CronMask
+
+
+def test_load_job_catalog_reads_masks_in_a_single_query():
+    engine = create_engine('sqlite://')
+    mask = CronMask.from_fields(['Seg', 'Qua'], ['08'], ['00', '30'])
+    with engine.begin() as connection:
+        connection.execute(text(f"CREATE TABLE jobs_he ({', '.join(JobRecord._fields)})"))
+        for job_id, name, status in [(1, 'b', 'Y'), (2, 'a', 'Y'), (3, 'c', 'N')]:
+            row = dict.fromkeys(JobRecord._fields)
+            row.update(job_id=job_id, job_name=name, job_status=status, schedule_days=mask.days,
+                       schedule_hours=mask.hours, schedule_minutes=mask.minutes)
+            connection.execute(text(f"INSERT INTO jobs_he VALUES ({', '.join(':' + f for f in JobRecord._fields)})"), row)
+
+        assert [job.job_name for job in load_job_catalog(connection)] == ['a', 'b', 'c']
+        active = load_job_catalog(connection, active_only=True)
+        assert [job.job_id for job in active] == [2, 1]
+        assert active[0].schedule_mask == mask
+        assert [job.job_id for job in load_job_catalog(connection, job_id=3)] == [3]
@@ -0,0 +1,104 @@
+import queue
+import threading
+import time
+from types import SimpleNamespace
+
+from job_executor import JobExecutor
+
+TIMEOUT = 5  # só um limite para o teste não travar; nenhuma asserção depende do tempo
+
+
+def job(job_id):
+    return SimpleNamespace(job_id=job_id, job_name=f'job {job_id}')
+
+
+def slow(seconds, running):
+    def run(job_data):
+        running.put(job_data.job_id)
+        time.sleep(seconds)  # a duração fica em pelo menos `seconds`
+    return run
+
+
+def blocking(started, release):
+    def run(job_data):
+        started.put(job_data.job_id)
+        release.wait(TIMEOUT)
+    return run
+
+
+def start_second_runs(executor, started, release, seconds):
+    """
+    Jobs 1 e 2 rodam uma vez por `seconds` e, enquanto rodam, ganham uma segunda execução
+    (overlap 'queue'), que só sai da fila depois que a primeira termina e tem a duração registrada.
+    """
+    running = queue.Queue()
+    for job_id in (1, 2):
+        executor.submit(slow(seconds, running), job(job_id))
+    for _ in (1, 2):
+        job_id = running.get(timeout=TIMEOUT)
+        assert executor.submit(blocking(started, release), job(job_id), overlap='queue')
+
+
+def test_job_slower_than_heavy_seconds_stays_off_the_reserved_worker():
+    executor = JobExecutor(max_workers=2, reserved_workers=1, heavy_seconds=0.01)
+    started, release = queue.Queue(), threading.Event()
+    start_second_runs(executor, started, release, 0.02)
+
+    first = started.get(timeout=TIMEOUT)
+    # o outro job também ficou pesado: não pode usar o worker reservado, mas um job novo (leve) pode
+    light_done = threading.Event()
+    executor.submit(lambda job_data: light_done.set(), job(3))
+    assert light_done.wait(TIMEOUT)
+    assert started.empty()
+
+    release.set()
+    assert {first, started.get(timeout=TIMEOUT)} == {1, 2}
+    executor.shutdown()
+
+
+def test_heavy_seconds_zero_only_counts_weight():
+    executor = JobExecutor(max_workers=2, reserved_workers=1, heavy_seconds=0)
+    started, release = queue.Queue(), threading.Event()
+    start_second_runs(executor, started, release, 0.02)
+
+    # sem o limite por duração os dois jobs continuam leves e rodam juntos
+    assert {started.get(timeout=TIMEOUT), started.get(timeout=TIMEOUT)} == {1, 2}
+    release.set()
+    executor.shutdown()
+
+
+def test_weight_above_one_is_heavy_without_history():
+    executor = JobExecutor(max_workers=2, reserved_workers=1, heavy_seconds=0)
+    started, release = queue.Queue(), threading.Event()
+    executor.submit(blocking(started, release), job(1), weight=2)
+    executor.submit(blocking(started, release), job(2), weight=2)
+
+    first = started.get(timeout=TIMEOUT)
+    light_done = threading.Event()
+    executor.submit(lambda job_data: light_done.set(), job(3))
+    assert light_done.wait(TIMEOUT)
+    assert started.empty()
+
+    release.set()
+    assert {first, started.get(timeout=TIMEOUT)} == {1, 2}
+    executor.shutdown()
+
+
+def test_submit_after_reports_a_retry_that_never_runs():
+    executor = JobExecutor(max_workers=1)
+    started, release = queue.Queue(), threading.Event()
+    executor.submit(blocking(started, release), job(1))
+    started.get(timeout=TIMEOUT)
+
+    # na hora de disparar o job 1 ainda está rodando: a política 'skip' descarta a re-tentativa
+    dropped = threading.Event()
+    assert executor.submit_after(0.01, blocking(started, release), job(1), overlap='skip', on_dropped=dropped.set)
+    assert dropped.wait(TIMEOUT)
+
+    # re-tentativas ainda não disparadas também são avisadas no shutdown
+    cancelled = threading.Event()
+    assert executor.submit_after(TIMEOUT, blocking(started, release), job(2), on_dropped=cancelled.set)
+    release.set()
+    executor.shutdown()
+    assert cancelled.is_set()
+    assert started.empty()
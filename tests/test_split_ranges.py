@@ -0,0 +1,52 @@
+import datetime
+
+import pytest
+
+from auxiliares import split_ranges
+
+
+class FakeCursor:
+    def __init__(self, low, high):
+        self.row = (low, high)
+
+    def execute(self, sql, binds=None):
+        pass
+
+    def fetchone(self):
+        return self.row
+
+
+def covers(ranges, low, high):
+    """As faixas começam no MIN, terminam no MAX e são contíguas."""
+    return ranges[0][0] == low and ranges[-1][1] == high and all(a[1] == b[0] for a, b in zip(ranges, ranges[1:]))
+
+
+@pytest.mark.parametrize('low, high, parts', [
+    (2 ** 53 + 3, 2 ** 53 + 1000, 4),
+    (2 ** 62 + 1, 2 ** 63 - 1, 3),
+    (-(2 ** 60) - 7, 2 ** 60 + 5, 4),
+    (1, 10, 4),
+])
+def test_int_bounds_are_exact(low, high, parts):
+    ranges = split_ranges(FakeCursor(low, high), 'SELECT 1 FROM DUAL', {}, 'ID', parts)
+    assert covers(ranges, low, high)
+    assert all(isinstance(bound, int) for pair in ranges for bound in pair)
+
+
+def test_few_values_drop_empty_ranges():
+    ranges = split_ranges(FakeCursor(1, 2), 'SELECT 1 FROM DUAL', {}, 'ID', 4)
+    assert covers(ranges, 1, 2)
+    assert len(ranges) == 1
+
+
+def test_date_and_float_bounds():
+    low, high = datetime.datetime(2026, 1, 1), datetime.datetime(2026, 1, 5)
+    ranges = split_ranges(FakeCursor(low, high), 'SELECT 1 FROM DUAL', {}, 'DT', 4)
+    assert covers(ranges, low, high)
+    assert ranges[1][0] == datetime.datetime(2026, 1, 2)
+    assert covers(split_ranges(FakeCursor(0.5, 2.5), 'SELECT 1 FROM DUAL', {}, 'V', 2), 0.5, 2.5)
+
+
+@pytest.mark.parametrize('low, high', [(None, None), (5, 5), ('a', 'b')])
+def test_not_splittable(low, high):
+    assert split_ranges(FakeCursor(low, high), 'SELECT 1 FROM DUAL', {}, 'ID', 4) is None
@@ -0,0 +1,40 @@
+import pytest
+
+from auxiliares import get_sql_binds, get_sql_schema
+
+
+@pytest.mark.parametrize('sql, expected', [
+    ('SELECT * FROM vendas.pedidos', 'VENDAS'),
+    ('SELECT p.id, p.valor FROM vendas.pedidos p WHERE p.id > 0', 'VENDAS'),
+    ('SELECT EXTRACT(YEAR FROM p.dt) AS ano FROM vendas.pedidos p', 'VENDAS'),
+    ("SELECT TRIM(' ' FROM p.nome) FROM vendas.pedidos p", 'VENDAS'),
+    ('SELECT (SELECT MAX(c.dt) FROM cfg.cargas c) AS ultima, p.id FROM vendas.pedidos p', 'VENDAS'),
+    ('SELECT * FROM (SELECT p.id FROM vendas.pedidos p) t', 'VENDAS'),
+    ('SELECT * FROM "Vendas"."PEDIDOS"', 'Vendas'),
+    ('SELECT * FROM vendas . pedidos', 'VENDAS'),
+])
+def test_get_sql_schema(sql, expected):
+    assert get_sql_schema(sql, default='scott') == expected
+
+
+@pytest.mark.parametrize('sql', [
+    'SELECT p.id FROM pedidos p',
+    "SELECT 'FROM x.y' AS texto FROM pedidos",
+    'SELECT id -- FROM x.y\nFROM pedidos',
+    'SELECT id /* FROM x.y */ FROM pedidos',
+    'SELECT EXTRACT(YEAR FROM p.dt) FROM pedidos p',
+])
+def test_get_sql_schema_default(sql):
+    assert get_sql_schema(sql, default='scott') == 'SCOTT'
+    assert get_sql_schema(sql) is None
+
+
+@pytest.mark.parametrize('sql, expected', [
+    ('SELECT * FROM t WHERE dt BETWEEN :start_date AND :End_Date', {'start_date', 'end_date'}),
+    ("SELECT ':x' AS a, q'[:y]' AS b FROM t WHERE c = :z", {'z'}),
+    ('SELECT a -- :x\nFROM t /* :y */ WHERE b = :z', {'z'}),
+    ('SELECT ":x" FROM t', set()),
+    ("SELECT TO_DATE('01/01/2020 10:30', 'DD/MM/YYYY HH24:MI') FROM t", set()),
+])
+def test_get_sql_binds(sql, expected):
+    assert get_sql_binds(sql) == expected